@@ -0,0 +1,109 @@
+import argparse
+import asyncio
+import threading
+import time
+
+from common import print_result, summarize
+
+from quiz.engine import GameEngine
+from quiz.protocol import HELLO, PROTOCOL_VERSION, QUESTION, WELCOME, FrameDecoder, encode_message
+from quiz.transport import SLOW_CONSUMER_POLICIES, TRANSPORTS
+
+# Question fan-out cost with and without stalled players.
+#
+#   python benchmarks/bench_broadcast.py --players 1000 --stalled 10
+#
+# Every player joins a real GameEngine over loopback. Stalled players finish
+# the handshake and then never read, so their socket buffers fill up and the
+# slow-consumer policy kicks in. The number to watch is how long one
+# engine.broadcast() call takes on the game thread: it should not depend on
+# the stalled players.
+
+
+async def join(port, name, stalled):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(encode_message(HELLO, {"version": PROTOCOL_VERSION, "username": name}))
+    decoder = FrameDecoder()
+    while True:
+        messages = decoder.feed(await reader.read(1024))
+        if messages:
+            break
+    if messages[0][0] != WELCOME:
+        raise RuntimeError(f"{name} was rejected")
+
+    if stalled:
+        # Keep the connection open without ever reading from it again
+        return writer
+
+    # Fast player: read and discard everything until the server closes
+    while await reader.read(65536):
+        pass
+    return writer
+
+
+def run_clients(port, players, stalled, ready):
+    async def main():
+        tasks = [asyncio.create_task(join(port, f"bot{i}", i < stalled)) for i in range(players)]
+        ready.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    asyncio.run(main())
+
+
+def run(mode, players, stalled, rounds, interval, question_bytes, policy):
+    engine = GameEngine(transport_mode=mode, transport_options={"backlog": 1024, "slow_consumer": policy})
+    engine.start_listening(0)
+
+    ready = threading.Event()
+    clients = threading.Thread(target=run_clients, args=(engine.transport.port, players, stalled, ready), daemon=True)
+    clients.start()
+    ready.wait()
+
+    deadline = time.monotonic() + 30
+    while len(engine.players) < players and time.monotonic() < deadline:
+        time.sleep(0.05)
+    joined = len(engine.players)
+
+    question = {
+        "number": 1,
+        "total": rounds,
+        "question": "x" * question_bytes,
+        "options": {"A": "first", "B": "second", "C": "third"},
+    }
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        # On the game thread, like every broadcast of the engine
+        engine.actor.submit(engine.broadcast, QUESTION, question)
+        engine.actor.wait_idle()
+        timings.append(time.perf_counter() - started)
+        time.sleep(interval)
+
+    result = summarize(timings)
+    result["joined"] = joined
+    result["dropped"] = joined - len(engine.players)
+    print_result(f"{mode} broadcast ({players} players, {stalled} stalled)", result)
+
+    engine.stop_listening()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Question broadcast fan-out benchmark")
+    parser.add_argument("--players", type=int, default=1000)
+    parser.add_argument("--stalled", type=int, default=10, help="players that never read")
+    parser.add_argument("--rounds", type=int, default=100, help="broadcasts per run")
+    parser.add_argument("--interval-ms", type=int, default=20, help="pause between broadcasts")
+    parser.add_argument("--question-bytes", type=int, default=1000,
+                        help="raise it to make stalled players overflow their queues within the run")
+    parser.add_argument("--slow-consumer", choices=SLOW_CONSUMER_POLICIES, default="drop")
+    parser.add_argument("--transport", choices=sorted(TRANSPORTS), action="append",
+                        help="transport(s) to benchmark, default: all")
+    args = parser.parse_args()
+
+    for mode in args.transport or sorted(TRANSPORTS):
+        for stalled in sorted({0, args.stalled}):
+            run(mode, args.players, stalled, args.rounds, args.interval_ms / 1000.0,
+                args.question_bytes, args.slow_consumer)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import argparse
+import asyncio
+import time
+
+from bench_transport import StubHost, join
+from common import print_result, summarize
+
+from quiz.transport import HANDSHAKE_TIMEOUT, LISTEN_BACKLOG, MAX_HANDSHAKES, TRANSPORTS
+
+# Time from connect() to the WELCOME when a whole class joins at once.
+#
+#   python benchmarks/bench_connect_storm.py --players 1000 [--slow 50] [--backlog 5]
+#
+# --slow opens that many connections first that never send their hello, so
+# the storm shows whether a silent client holds up everybody behind it: with
+# the handshakes read on the accept thread every one of them cost a full
+# handshake timeout. Needs a file descriptor limit (ulimit -n) above the
+# number of connections.
+
+
+async def open_silent(port, count):
+    connections = []
+    for _ in range(count):
+        try:
+            connections.append(await asyncio.open_connection("127.0.0.1", port))
+        except (ConnectionError, OSError):
+            break
+    return connections
+
+
+async def run_clients(port, players, slow):
+    silent = await open_silent(port, slow)
+
+    storm_started = time.perf_counter()
+    results = await asyncio.gather(*(join(port, f"bot{i}") for i in range(players)))
+    storm_wall = time.perf_counter() - storm_started
+
+    for result in results:
+        if result is not None:
+            result[0][1].close()
+    for _, writer in silent:
+        writer.close()
+    return [result[1] for result in results if result is not None], storm_wall
+
+
+def run(mode, players, slow, backlog, handshake_timeout, max_handshakes):
+    host = StubHost(0)
+    transport = TRANSPORTS[mode](host, backlog=backlog, handshake_timeout=handshake_timeout,
+                                 max_handshakes=max_handshakes)
+    transport.start(0)
+    try:
+        join_times, storm_wall = asyncio.run(run_clients(transport.port, players, slow))
+    finally:
+        transport.stop()
+
+    storm = summarize(join_times)
+    storm["failed"] = players - len(join_times)
+    storm["wall_s"] = round(storm_wall, 3)
+    print_result(f"{mode} time to WELCOME ({players} players, {slow} silent)", storm)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Connect storm benchmark")
+    parser.add_argument("--players", type=int, default=1000)
+    parser.add_argument("--slow", type=int, default=0,
+                        help="connections opened before the storm that never send their hello")
+    parser.add_argument("--backlog", type=int, default=LISTEN_BACKLOG)
+    parser.add_argument("--handshake-timeout", type=float, default=HANDSHAKE_TIMEOUT)
+    parser.add_argument("--max-handshakes", type=int, default=MAX_HANDSHAKES)
+    parser.add_argument("--transport", choices=sorted(TRANSPORTS), action="append",
+                        help="transport(s) to benchmark, default: all")
+    args = parser.parse_args()
+
+    for mode in args.transport or sorted(TRANSPORTS):
+        run(mode, args.players, args.slow, args.backlog, args.handshake_timeout, args.max_handshakes)
+
+
+if __name__ == "__main__":
+    main()
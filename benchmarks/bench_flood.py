@@ -0,0 +1,125 @@
+import argparse
+import asyncio
+import time
+
+from bench_transport import StubHost, answer, join
+from common import print_result, summarize
+
+from quiz import metrics
+from quiz.protocol import encode_answer
+from quiz.ratelimit import BYTE_RATE, MESSAGE_BURST, MESSAGE_RATE
+from quiz.transport import TRANSPORTS
+
+# Answer latency of well-behaved players while other connections flood the
+# server with answers.
+#
+#   python benchmarks/bench_flood.py --players 100 --flooders 2 [--no-limits]
+#
+# Every --interval seconds each player answers once and waits for the ACK,
+# well within the rate a player may send at. The flooders
+# send answers as fast as the server takes them and throw away what comes
+# back; --flood-limit 0 keeps them connected for the whole run. --no-limits
+# turns the inbound rate limits off for comparison.
+
+
+async def flood(port, name, stop):
+    # Returns the number of answers written
+    joined = await join(port, name)
+    if joined is None:
+        return 0
+    (reader, writer, _), _ = joined
+    burst = encode_answer("A", 1) * 64
+    sent = 0
+
+    async def drain_replies():
+        while await reader.read(65536):
+            pass
+
+    draining = asyncio.ensure_future(drain_replies())
+    stopping = asyncio.ensure_future(stop.wait())
+    try:
+        while not stopping.done() and not draining.done():
+            writer.write(burst)
+            sent += 64
+            # A throttled connection can keep drain() waiting for a long time
+            await asyncio.wait([asyncio.ensure_future(writer.drain()), stopping],
+                               return_when=asyncio.FIRST_COMPLETED)
+    except (ConnectionError, OSError):
+        pass
+    draining.cancel()
+    # Throw away what is still buffered instead of waiting for the server to read it
+    writer.transport.abort()
+    return sent
+
+
+async def run_clients(port, players, flooders, rounds, interval):
+    joined = [result for result in await asyncio.gather(*(join(port, f"bot{i}") for i in range(players)))
+              if result is not None]
+
+    stop = asyncio.Event()
+    flooding = [asyncio.ensure_future(flood(port, f"flooder{i}", stop)) for i in range(flooders)]
+    # Let the flood get going
+    await asyncio.sleep(0.2)
+
+    acks = []
+    started = time.perf_counter()
+    for _ in range(rounds):
+        round_started = time.perf_counter()
+        acks += await asyncio.gather(*(answer(*streams) for streams, _ in joined))
+        await asyncio.sleep(max(0.0, interval - (time.perf_counter() - round_started)))
+    wall = time.perf_counter() - started
+
+    stop.set()
+    sent = sum(await asyncio.gather(*flooding))
+    for (_, writer, _), _ in joined:
+        writer.close()
+    return acks, wall, sent
+
+
+def run(mode, players, flooders, rounds, interval, limits):
+    host = StubHost(0)
+    transport = TRANSPORTS[mode](host, **limits)
+    transport.start(0)
+    before = metrics.registry.snapshot()
+    try:
+        acks, wall, sent = asyncio.run(run_clients(transport.port, players, flooders, rounds, interval))
+    finally:
+        transport.stop()
+    after = metrics.registry.snapshot()
+
+    def delta(name):
+        return after.get((name, ()), 0) - before.get((name, ()), 0)
+
+    result = summarize(acks)
+    result["wall_s"] = round(wall, 3)
+    result["flood_sent"] = sent
+    result["flood_handled"] = host.answers - len(acks)
+    result["dropped"] = delta("quiz_messages_dropped_total")
+    result["throttled_reads"] = delta("quiz_reads_throttled_total")
+    print_result(f"{mode} answer to ACK ({players} players, {flooders} flooding)", result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inbound flood benchmark")
+    parser.add_argument("--players", type=int, default=100)
+    parser.add_argument("--flooders", type=int, default=2)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--interval", type=float, default=0.5, help="seconds between a player's answers")
+    parser.add_argument("--flood-limit", type=int, default=0,
+                        help="dropped messages before a flooder is disconnected (0: never)")
+    parser.add_argument("--no-limits", action="store_true", help="turn the inbound rate limits off")
+    parser.add_argument("--transport", choices=sorted(TRANSPORTS), action="append",
+                        help="transport(s) to benchmark, default: all")
+    args = parser.parse_args()
+
+    if args.no_limits:
+        limits = {"message_rate": 0, "byte_rate": 0, "flood_limit": 0}
+    else:
+        limits = {"message_rate": MESSAGE_RATE, "message_burst": MESSAGE_BURST, "byte_rate": BYTE_RATE,
+                  "flood_limit": args.flood_limit}
+    for mode in args.transport or sorted(TRANSPORTS):
+        run(mode, args.players, args.flooders, args.rounds, args.interval, limits)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from common import print_result, summarize
+
+from quiz.history import HistoryStore
+
+# Game history store: what recording costs the game thread, how fast the
+# writer keeps up, and leaderboard queries over a large history.
+#
+#   python benchmarks/bench_history.py --games 2000 --players 50 --rounds 10
+#
+# The games are spread over the last 30 days, played by a pool of 10 times
+# as many players as there are in one game. "record" is the time the game
+# thread spends handing one event to the store, "write" the time until the
+# writer has everything on disk.
+
+
+def game_events(index, players, rounds, pool, now):
+    game = f"game{index}"
+    started = now - random.uniform(0, 30 * 86400)
+    names = random.sample(pool, players)
+    scores = dict.fromkeys(names, 0)
+    events = [("game_started", {"game": game, "started": started, "questions": rounds, "players": players})]
+
+    for number in range(1, rounds + 1):
+        answers = []
+        for position, name in enumerate(random.sample(names, players)):
+            points = random.choice((0, 0, 1, 1 + players - 1 if position == 0 else 1))
+            scores[name] += points
+            answers.append((name, random.choice("ABC"), points, started + number + position * 0.001))
+        events.append(("round_finished", {"game": game, "number": number, "question": f"Question {number}",
+                                          "answer": "A", "asked": started + number, "answers": answers}))
+
+    ordered = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+    standings = []
+    for name, score in ordered:
+        rank = standings[-1][0] if standings and standings[-1][2] == score else len(standings) + 1
+        standings.append((rank, name, score))
+    events.append(("game_finished", {"game": game, "finished": started + rounds + 1, "rounds": rounds,
+                                     "standings": standings}))
+    return events
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Game history store benchmark")
+    parser.add_argument("--games", type=int, default=2000)
+    parser.add_argument("--players", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--db", help="database file to fill (default: a temporary file)")
+    args = parser.parse_args()
+
+    random.seed(1)
+    now = time.time()
+    pool = [f"player{i}" for i in range(args.players * 10)]
+    events = []
+    for index in range(args.games):
+        events += game_events(index, args.players, args.rounds, pool, now)
+
+    directory = None
+    path = args.db
+    if path is None:
+        directory = tempfile.TemporaryDirectory()
+        path = os.path.join(directory.name, "history.db")
+    store = HistoryStore(path)
+
+    record_times = []
+    started = time.perf_counter()
+    for event in events:
+        before = time.perf_counter()
+        store(event)
+        record_times.append(time.perf_counter() - before)
+    recorded = time.perf_counter() - started
+    store.flush()
+    written = time.perf_counter() - started
+
+    print_result(f"record ({len(events)} events)", summarize(record_times))
+    print_result("write", {
+        "games": args.games,
+        "answers": args.games * args.rounds * args.players,
+        "record_s": round(recorded, 3),
+        "write_s": round(written, 3),
+        "events_per_s": round(len(events) / written),
+    })
+
+    for name, since in (("all time", None), ("last 7 days", now - 7 * 86400), ("last day", now - 86400)):
+        times = []
+        for _ in range(args.queries):
+            before = time.perf_counter()
+            store.leaderboard(10, since=since)
+            times.append(time.perf_counter() - before)
+        print_result(f"leaderboard top 10, {name}", summarize(times))
+
+    store.close()
+    if directory is not None:
+        directory.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import argparse
+import asyncio
+import subprocess
+import sys
+import time
+
+from common import REPO_ROOT, free_port, print_result
+
+from quiz.loadgen import Swarm, raise_open_file_limit, think_time
+
+# End-to-end latency of a real server under simulated players, see
+# quiz/loadgen.py for what each number measures.
+#
+#   python benchmarks/bench_latency.py --players 1000 --seconds 20 --transport threaded,asyncio
+#
+# Starts a headless server per transport on a free port (every game waits
+# for all players, no pause between questions, no limit on how fast a bot
+# answers), runs the bots in this process and prints the percentiles.
+# Compare runs of the same arguments before and after a server change.
+
+
+def run(transport, args):
+    port = free_port()
+    command = [sys.executable, "-m", "quiz.headless", "--port", str(port), "--transport", transport,
+               "--questions", "quiz_qa.txt", "--qa", "1000000", "--auto-start", str(args.players),
+               "--question-time", str(args.question_time), "--question-pause", "0",
+               "--message-rate", "0"]
+    server = subprocess.Popen(command, cwd=REPO_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    time.sleep(1.0)
+
+    try:
+        swarm = Swarm("127.0.0.1", port, args.players, duration=args.seconds, ramp=args.ramp,
+                      think=think_time(args.think), correct_rate=0.7)
+        report = asyncio.run(swarm.run())
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+    for name in ("question_spread", "answer_ack", "turnaround", "join"):
+        print_result(f"{transport} {name} ({args.players} players)", report[name])
+    print_result(f"{transport} counters", report["counters"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end latency benchmark")
+    parser.add_argument("--players", type=int, default=500)
+    parser.add_argument("--seconds", type=float, default=15.0)
+    parser.add_argument("--ramp", type=float, default=2.0, help="seconds over which the players join")
+    parser.add_argument("--think", default="uniform:0.01,0.2", help="fixed:S, uniform:MIN,MAX or exp:MEAN")
+    parser.add_argument("--question-time", type=float, default=10.0)
+    parser.add_argument("--transport", default="threaded,asyncio", help="comma separated transports")
+    args = parser.parse_args()
+
+    raise_open_file_limit()
+    for transport in args.transport.split(","):
+        run(transport, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import argparse
+import time
+
+from common import print_result
+
+from quiz.payloads import PayloadCache, question_body
+from quiz.protocol import QUESTION, encode_message
+from quiz.questions import Question
+
+# Cost of preparing one QUESTION message: rendering and encoding it every
+# time, as the engine used to, versus the payload cache (quiz/payloads.py).
+#
+#   python benchmarks/bench_payloads.py --questions 50 --asks 200000
+#
+# The questions are asked round-robin with a wrapping question number, like
+# long sessions on a small file do.
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Question payload cache benchmark")
+    parser.add_argument("--questions", type=int, default=50)
+    parser.add_argument("--asks", type=int, default=200000)
+    parser.add_argument("--game-length", type=int, default=10, help="questions per game")
+    args = parser.parse_args()
+
+    questions = [Question(f"Question {i}: which option is the right one for this question?",
+                          (("A", f"First option {i}"), ("B", f"Second option {i}"), ("C", f"Third option {i}")),
+                          "A", i * 5 + 1) for i in range(args.questions)]
+    source = ("/bench/questions.txt", 0, 0)
+
+    def header(ask):
+        return (ask % args.game_length + 1, args.game_length, 30.0)
+
+    started = time.perf_counter()
+    for ask in range(args.asks):
+        encode_message(QUESTION, question_body(questions[ask % args.questions], *header(ask)))
+    rendered = time.perf_counter() - started
+
+    cache = PayloadCache()
+    started = time.perf_counter()
+    for ask in range(args.asks):
+        cache.question(source, questions, ask % args.questions, header(ask))
+    cached = time.perf_counter() - started
+
+    print_result("render every time", {"asks": args.asks, "us_per_ask": round(rendered / args.asks * 1e6, 2)})
+    print_result("payload cache", {"asks": args.asks, "us_per_ask": round(cached / args.asks * 1e6, 2),
+                                   "hits": cache.hits, "misses": cache.misses})
+
+
+if __name__ == "__main__":
+    main()
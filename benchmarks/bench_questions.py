@@ -0,0 +1,94 @@
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from common import print_result
+
+from quiz.questions import CompiledQuestions, compile_questions, iter_questions, read_questions
+
+# Loading a large question bank: parsing the text file versus mapping a
+# compiled one (see quiz/questions.py).
+#
+#   python benchmarks/bench_questions.py --questions 500000 --asked 20
+#
+# Writes a generated bank (5 lines per question) to a temporary directory,
+# then measures the streaming parser's throughput, and for each format the
+# time and Python memory to load it and to ask --asked questions.
+
+
+def write_bank(path, count):
+    with open(path, 'w') as file:
+        for i in range(count):
+            file.write(f"Question number {i}: which option is the right one for this question?\n"
+                       f"A - First option of question {i}\nB - Second option of question {i}\n"
+                       f"C - Third option of question {i}\nAnswer: {'ABC'[i % 3]}\n")
+
+
+def load_and_ask(load, asked):
+    questions = load()
+    step = max(1, len(questions) // asked)
+    for index in range(0, step * asked, step):
+        questions[index % len(questions)].text
+    return questions
+
+
+def measure(name, load, asked):
+    # Timed without tracing first, tracemalloc slows parsing down a lot
+    started = time.perf_counter()
+    questions = load()
+    loaded = time.perf_counter() - started
+    load_and_ask(lambda: questions, asked)
+    total = time.perf_counter() - started
+    del questions
+
+    tracemalloc.start()
+    questions = load_and_ask(load, asked)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print_result(name, {"questions": len(questions), "load_ms": round(loaded * 1000, 1),
+                        "load_and_ask_ms": round(total * 1000, 1), "peak_mb": round(peak / 2 ** 20, 1)})
+
+
+def measure_parser(path):
+    # Stream the file through the parser without keeping the questions
+    started = time.perf_counter()
+    questions = 0
+    with open(path, 'r') as file:
+        for _ in iter_questions(file):
+            questions += 1
+    elapsed = time.perf_counter() - started
+    with open(path, 'rb') as file:
+        lines = sum(1 for _ in file)
+
+    print_result("streaming parser", {"lines": lines, "questions": questions, "ms": round(elapsed * 1000, 1),
+                                      "lines_per_s": round(lines / elapsed),
+                                      "mb_per_s": round(os.path.getsize(path) / 2 ** 20 / elapsed, 1)})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Question bank loading benchmark")
+    parser.add_argument("--questions", type=int, default=500000)
+    parser.add_argument("--asked", type=int, default=20, help="questions read after loading")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        text_path = os.path.join(directory, "bank.txt")
+        compiled_path = os.path.join(directory, "bank.qbank")
+        write_bank(text_path, args.questions)
+
+        started = time.perf_counter()
+        compile_questions(text_path, compiled_path)
+        print_result("compile", {"ms": round((time.perf_counter() - started) * 1000, 1),
+                                 "text_mb": round(os.path.getsize(text_path) / 2 ** 20, 1),
+                                 "compiled_mb": round(os.path.getsize(compiled_path) / 2 ** 20, 1)})
+
+        measure_parser(text_path)
+        measure("text file", lambda: read_questions(text_path), args.asked)
+        measure("compiled, memory-mapped", lambda: CompiledQuestions(compiled_path), args.asked)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import argparse
+import time
+
+from common import print_result, summarize
+
+from quiz.players import PlayerRegistry
+
+# Player bookkeeping cost with many players, without any networking.
+#
+#   python benchmarks/bench_registry.py --players 10000 --rounds 5
+#
+# The lookups the engine makes for joins, answers and disconnects, timed
+# directly on PlayerRegistry and on the old layout (connection -> name dict,
+# linear scan to find a player's connection). Both send the answer
+# acknowledgement to a null connection; the game thread is not involved.
+
+ADDRESS = ("127.0.0.1", 0)
+
+
+class NullConnection:
+    def send(self, data, msg_type=None):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class LegacyLookups:
+    # The player lookups the engine did before quiz/players.py
+    def __init__(self):
+        self.players = {}
+        self.answered_players = set()
+
+    def join(self, conn, name):
+        if name in self.players.values():
+            return False
+        self.players[conn] = name
+        return True
+
+    def new_round(self):
+        self.answered_players.clear()
+
+    def answer(self, name):
+        if name in self.answered_players:
+            return
+        self.answered_players.add(name)
+        # send_to_player: find the connection of the acknowledged player
+        for player_conn, player_name in self.players.items():
+            if player_name == name:
+                player_conn.send(b"")
+                break
+
+    def leave(self, conn):
+        name = self.players.pop(conn, None)
+        self.answered_players.discard(name)
+
+
+class RegistryLookups:
+    # The same lookups through PlayerRegistry, as the engine makes them
+    def __init__(self):
+        self.players = PlayerRegistry()
+
+    def join(self, conn, name):
+        return self.players.add(conn, name, ADDRESS) is not None
+
+    def new_round(self):
+        self.players.new_round()
+
+    def answer(self, name):
+        player = self.players.get(name)
+        if player is None or not self.players.record_answer(player, "A"):
+            return
+        # send_to_player
+        self.players.get(name).conn.send(b"")
+
+    def leave(self, conn):
+        self.players.remove(conn)
+
+
+def run(label, lookups, players, rounds):
+    connections = [(NullConnection(), f"player{i}") for i in range(players)]
+    started = time.perf_counter()
+    for conn, name in connections:
+        lookups.join(conn, name)
+    join_time = time.perf_counter() - started
+
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        lookups.new_round()
+        for conn, name in connections:
+            lookups.answer(name)
+        timings.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for conn, name in connections:
+        lookups.leave(conn)
+    leave_time = time.perf_counter() - started
+
+    result = summarize(timings)
+    result["join_ms"] = round(join_time * 1000, 1)
+    result["leave_ms"] = round(leave_time * 1000, 1)
+    print_result(f"{label} ({players} players, per round)", result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Player registry benchmark")
+    parser.add_argument("--players", type=int, default=10000)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--skip-legacy", action="store_true", help="the legacy lookups are quadratic")
+    args = parser.parse_args()
+
+    run("registry", RegistryLookups(), args.players, args.rounds)
+    if not args.skip_legacy:
+        run("legacy", LegacyLookups(), args.players, args.rounds)
+
+
+if __name__ == "__main__":
+    main()
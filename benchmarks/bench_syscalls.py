@@ -0,0 +1,158 @@
+import argparse
+import contextlib
+import os
+import socket
+import struct
+import threading
+import time
+
+from common import REPO_ROOT, print_result
+
+from quiz import metrics, transport as transports
+from quiz.engine import GameEngine
+from quiz.protocol import CONTROL, QUESTION, FrameDecoder, encode_answer, encode_hello
+
+# Socket writes per player and round, with and without write coalescing.
+#
+#   python benchmarks/bench_syscalls.py --players 50 --rounds 20
+#
+# A real engine and transport run in this process; every player is a
+# blocking socket on its own thread that answers each question right away.
+#   writes     write calls the transport made on player sockets
+#              (quiz_socket_writes_total): send()/sendmsg() on the threaded
+#              transport, StreamWriter writes on asyncio, which the event
+#              loop may still merge before they reach the kernel
+#   segments   TCP segments with data the players' sockets received, the
+#              kernel's own count (TCP_INFO, Linux only); small back-to-back
+#              writes can share a segment, so this is at most the number of
+#              send system calls
+#   reads      player reads that returned data
+#
+# "unbatched" is what the server did before writes were coalesced: the
+# writer is woken after every message, and the threaded writer sends each
+# queued message with a sendall() of its own (the asyncio writer already
+# wrote everything queued at once). "batched" is the server as it is, one
+# wake-up per engine event and one write for everything queued by then.
+
+# Offset of tcpi_data_segs_in in struct tcp_info (Linux 4.6+)
+DATA_SEGS_IN_OFFSET = 152
+
+
+class Player(threading.Thread):
+    def __init__(self, port, name):
+        super().__init__(daemon=True)
+        self.sock = socket.create_connection(("127.0.0.1", port))
+        self.sock.sendall(encode_hello(name))
+        self.reads = 0
+        self.game_over = threading.Event()
+
+    def data_segments(self):
+        # None where TCP_INFO is not available
+        if not hasattr(socket, "TCP_INFO"):
+            return None
+        try:
+            info = self.sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_INFO, 256)
+        except OSError:
+            return None
+        if len(info) < DATA_SEGS_IN_OFFSET + 4:
+            return None
+        return struct.unpack_from("I", info, DATA_SEGS_IN_OFFSET)[0]
+
+    def run(self):
+        decoder = FrameDecoder()
+        try:
+            while True:
+                data = self.sock.recv(65536)
+                if not data:
+                    break
+                self.reads += 1
+                for msg_type, body in decoder.feed(data):
+                    if msg_type == QUESTION:
+                        self.sock.sendall(encode_answer("A", body.get("number")))
+                    elif msg_type == CONTROL and body.get("event") == "game_over":
+                        self.game_over.set()
+        except OSError:
+            pass
+        self.game_over.set()
+
+
+@contextlib.contextmanager
+def send_each_message():
+    # One sendall() per queued message on the threaded transport
+    def send_each(sock, batch):
+        for data in batch:
+            sock.sendall(data)
+        return len(batch)
+
+    send_batch = transports.send_batch
+    transports.send_batch = send_each
+    try:
+        yield
+    finally:
+        transports.send_batch = send_batch
+
+
+def wait_until(condition, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise RuntimeError("Timed out")
+        time.sleep(0.01)
+
+
+def run(transport, batch_writes, players, rounds):
+    engine = GameEngine(transport_mode=transport, question_time=0, question_pause=0, batch_writes=batch_writes)
+    engine.load_questions(os.path.join(REPO_ROOT, "quiz_qa.txt"))
+    engine.set_qa_number(rounds)
+    if not engine.start_listening(0):
+        raise RuntimeError("Could not start the server")
+
+    clients = [Player(engine.transport.port, f"player{i}") for i in range(players)]
+    for client in clients:
+        client.start()
+    wait_until(lambda: len(engine.players) == players)
+    engine.actor.wait_idle()
+
+    writes = metrics.socket_writes.value
+    sent = metrics.messages_sent.value
+    segments = [client.data_segments() for client in clients]
+    started = time.perf_counter()
+    engine.start_game()
+    for client in clients:
+        client.game_over.wait(60)
+    elapsed = time.perf_counter() - started
+    # Let the writers finish the last round before counting
+    time.sleep(0.2)
+    writes = metrics.socket_writes.value - writes
+    sent = metrics.messages_sent.value - sent
+    if None not in segments:
+        segments = sum(client.data_segments() - before for client, before in zip(clients, segments))
+
+    engine.stop_listening()
+    per_round = players * rounds
+    return {
+        "messages_per_player_round": round(sent / per_round, 2),
+        "writes_per_player_round": round(writes / per_round, 2),
+        "segments_per_player_round": round(segments / per_round, 2) if isinstance(segments, int) else "n/a",
+        "reads_per_player_round": round(sum(client.reads for client in clients) / per_round, 2),
+        "wall_s": round(elapsed, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Socket writes per round, with and without write coalescing")
+    parser.add_argument("--players", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--transport", choices=("threaded", "asyncio"), nargs="+", default=["threaded", "asyncio"])
+    args = parser.parse_args()
+
+    for transport in args.transport:
+        unbatched = send_each_message if transport == "threaded" else contextlib.nullcontext
+        for mode, batch_writes, writes in (("unbatched", False, unbatched), ("batched", True, contextlib.nullcontext)):
+            with writes():
+                result = run(transport, batch_writes, args.players, args.rounds)
+            print_result(f"{transport} {mode} ({args.players} players)", result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import argparse
+import asyncio
+import threading
+import time
+
+from common import print_result, summarize
+
+from quiz.protocol import (
+    ACK, ANSWER, HELLO, PROTOCOL_VERSION, WELCOME, FrameDecoder, encode_message,
+)
+from quiz.transport import LISTEN_BACKLOG, TRANSPORTS
+
+# Threaded vs asyncio transport under a connect storm and an answer burst.
+#
+#   python benchmarks/bench_transport.py --players 500 [--backlog 5]
+#
+# benchmarks/bench_connect_storm.py looks at the joins alone.
+#
+# The server side uses a stub host with the same shape as Server (players
+# dict, answer lock, per-answer acknowledgement), so the numbers compare the
+# networking cores rather than the game rules.
+
+
+class StubHost:
+    def __init__(self, expected_answers):
+        self.players = {}
+        self.lock = threading.Lock()
+        self.answers = 0
+        self.expected_answers = expected_answers
+        self.all_answered = threading.Event()
+
+    def check_new_player(self, name, room=None, resume=None):
+        if name in self.players.values():
+            return f"Username '{name}' is already taken."
+        return None
+
+    def add_player(self, conn, name, address, room=None, session=None, resume=None):
+        self.players[conn] = name
+
+    def handle_player_message(self, conn, name, msg_type, body):
+        with self.lock:
+            self.answers += 1
+            conn.send(encode_message(ACK, {"accepted": True, "text": f"Your answer: '{body['choice']}' is received"}))
+            conn.flush()
+            if self.answers == self.expected_answers:
+                self.all_answered.set()
+
+    def remove_player(self, conn, reason="closed"):
+        self.players.pop(conn, None)
+
+
+async def join(port, name):
+    # Returns None when the join failed (refused, reset or rejected)
+    started = time.perf_counter()
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(encode_message(HELLO, {"version": PROTOCOL_VERSION, "username": name}))
+        decoder = FrameDecoder()
+        msg_type, _ = await read_message(reader, decoder)
+    except (ConnectionError, OSError):
+        return None
+    if msg_type != WELCOME:
+        writer.close()
+        return None
+    return (reader, writer, decoder), time.perf_counter() - started
+
+
+async def read_message(reader, decoder):
+    # The benchmark never has more than one message in flight per player
+    while True:
+        data = await reader.read(1024)
+        if not data:
+            raise ConnectionResetError("Server closed the connection")
+        messages = decoder.feed(data)
+        if messages:
+            return messages[0]
+
+
+async def answer(reader, writer, decoder):
+    started = time.perf_counter()
+    writer.write(encode_message(ANSWER, {"choice": "A"}))
+    await read_message(reader, decoder)
+    return time.perf_counter() - started
+
+
+async def run_clients(port, players):
+    storm_started = time.perf_counter()
+    results = await asyncio.gather(*(join(port, f"bot{i}") for i in range(players)))
+    storm_wall = time.perf_counter() - storm_started
+    joined = [result for result in results if result is not None]
+
+    burst_started = time.perf_counter()
+    acks = await asyncio.gather(*(answer(*streams) for streams, _ in joined))
+    burst_wall = time.perf_counter() - burst_started
+
+    for (_, writer, _), _ in joined:
+        writer.close()
+    return [elapsed for _, elapsed in joined], storm_wall, acks, burst_wall
+
+
+def run(mode, players, backlog):
+    host = StubHost(players)
+    transport = TRANSPORTS[mode](host, backlog=backlog)
+    transport.start(0)
+    try:
+        join_times, storm_wall, ack_times, burst_wall = asyncio.run(run_clients(transport.port, players))
+        host.all_answered.wait(timeout=5)
+    finally:
+        transport.stop()
+
+    storm = summarize(join_times)
+    storm["failed"] = players - len(join_times)
+    storm["wall_s"] = round(storm_wall, 3)
+    burst = summarize(ack_times)
+    burst["wall_s"] = round(burst_wall, 3)
+    print_result(f"{mode} connect storm ({players} players)", storm)
+    print_result(f"{mode} answer burst ({players} players)", burst)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Threaded vs asyncio transport benchmark")
+    parser.add_argument("--players", type=int, default=200)
+    parser.add_argument("--backlog", type=int, default=LISTEN_BACKLOG,
+                        help="listen backlog; a small one like 5 turns a storm into SYN retries")
+    parser.add_argument("--transport", choices=sorted(TRANSPORTS), action="append",
+                        help="transport(s) to benchmark, default: all")
+    args = parser.parse_args()
+
+    for mode in args.transport or sorted(TRANSPORTS):
+        run(mode, args.players, args.backlog)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import argparse
+import asyncio
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+
+from common import REPO_ROOT, free_port, print_result, summarize
+
+from quiz.protocol import (
+    ANSWER, HELLO, PROTOCOL_VERSION, QUESTION, WELCOME, FrameDecoder, encode_message,
+)
+
+# Join and answer throughput of the supervisor mode for 0, 1, 2, ... workers.
+#
+#   python benchmarks/bench_workers.py --workers 0,1,2,4 --rooms 64 --room-size 8
+#
+# Each run starts a headless server in rooms mode (0 workers: a single
+# process), lets rooms * room-size bots join from several client processes,
+# then every bot answers every question at once; answers are counted for
+# --seconds after the --join-seconds join phase. Games start
+# as soon as a room is full and never wait on a clock, so the answers per
+# second measure how fast the server can turn rounds around.
+#
+# Scaling needs cores: on a machine with fewer cores than workers plus
+# client processes the numbers stay flat.
+
+
+async def bot(port, name, room, count_from, stop_at, stats):
+    started = time.perf_counter()
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(encode_message(HELLO, {"version": PROTOCOL_VERSION, "username": name, "room": room}))
+        decoder = FrameDecoder()
+        messages = []
+        while not messages:
+            data = await reader.read(65536)
+            if not data:
+                raise ConnectionResetError("closed during handshake")
+            messages = decoder.feed(data)
+    except (ConnectionError, OSError):
+        stats["failed"] += 1
+        return
+    if messages[0][0] != WELCOME:
+        stats["failed"] += 1
+        writer.close()
+        return
+    stats["joins"].append(time.perf_counter() - started)
+
+    messages = messages[1:]
+    try:
+        while time.monotonic() < stop_at:
+            for msg_type, body in messages:
+                if msg_type == QUESTION:
+                    writer.write(encode_message(ANSWER, {"choice": "A", "number": body["number"]}))
+                    # Only answers after the join phase count
+                    if time.monotonic() >= count_from:
+                        stats["answers"] += 1
+            data = await asyncio.wait_for(reader.read(65536), max(0.01, stop_at - time.monotonic()))
+            if not data:
+                break
+            messages = decoder.feed(data)
+    except (asyncio.TimeoutError, ConnectionError, OSError):
+        pass
+    writer.close()
+
+
+def run_client_process(port, bots, join_deadline, seconds):
+    # bots: [(name, room)]; returns (join latencies, failed joins, answers sent)
+    async def main():
+        stats = {"joins": [], "failed": 0, "answers": 0}
+        stop_at = join_deadline + seconds
+        await asyncio.gather(*(bot(port, name, room, join_deadline, stop_at, stats) for name, room in bots))
+        return stats["joins"], stats["failed"], stats["answers"]
+    return asyncio.run(main())
+
+
+def run(workers, rooms, room_size, join_seconds, seconds, transport, client_processes):
+    port = free_port()
+    command = [sys.executable, "-m", "quiz.headless", "--port", str(port), "--rooms",
+               "--transport", transport, "--questions", "quiz_qa.txt", "--qa", "1000000",
+               "--auto-start", str(room_size), "--question-time", "0", "--scoreboard-top", "3",
+               "--max-rooms", str(rooms + 1), "--workers", str(workers), "--message-rate", "0"]
+    server = subprocess.Popen(command, cwd=REPO_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    time.sleep(1.0 + 0.2 * workers)
+
+    try:
+        bots = [(f"bot{i}", f"room{i // room_size}") for i in range(rooms * room_size)]
+        # Players of a room stay in one client process so their answers arrive together
+        shares = [[] for _ in range(client_processes)]
+        for index, (name, room) in enumerate(bots):
+            shares[(index // room_size) % client_processes].append((name, room))
+
+        join_deadline = time.monotonic() + join_seconds
+        started = time.perf_counter()
+        with multiprocessing.Pool(client_processes) as pool:
+            results = pool.starmap(run_client_process,
+                                   [(port, share, join_deadline, seconds) for share in shares])
+        wall = time.perf_counter() - started
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+    joins = [elapsed for result in results for elapsed in result[0]]
+    failed = sum(result[1] for result in results)
+    answers = sum(result[2] for result in results)
+
+    result = summarize(joins)
+    result["failed"] = failed
+    result["answers_per_s"] = round(answers / seconds)
+    result["wall_s"] = round(wall, 1)
+    print_result(f"{transport} workers={workers} ({len(bots)} players)", result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Supervisor mode scaling benchmark")
+    parser.add_argument("--workers", default="0,1,2,4", help="comma separated worker counts, 0: single process")
+    parser.add_argument("--rooms", type=int, default=64)
+    parser.add_argument("--room-size", type=int, default=8)
+    parser.add_argument("--join-seconds", type=float, default=5.0, help="time for every bot to join")
+    parser.add_argument("--seconds", type=float, default=5.0, help="answering phase per run")
+    parser.add_argument("--transport", default="asyncio", choices=("asyncio", "threaded"))
+    parser.add_argument("--client-processes", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    args = parser.parse_args()
+
+    for workers in [int(count) for count in args.workers.split(",")]:
+        run(workers, args.rooms, args.room_size, args.join_seconds, args.seconds, args.transport,
+            args.client_processes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+import os
+import socket
+import sys
+
+# Helpers shared by the benchmark scripts.
+# The scripts are run directly (python benchmarks/bench_x.py), so the repo
+# root is put on sys.path to make the quiz package importable.
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+# Latency summaries, the same the load generator reports
+from quiz.loadgen import summarize
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def print_result(name, result):
+    fields = "  ".join(f"{key}={value}" for key, value in result.items())
+    print(f"{name:<40} {fields}")
@@ -0,0 +1,379 @@
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import random
+import selectors
+import socket
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+
+from common import REPO_ROOT, print_result
+
+from quiz import metrics
+from quiz.engine import GameEngine
+from quiz.eventlog import EventLog
+from quiz.protocol import ACK, ANSWER, CONTROL, encode_message
+from quiz.questions import QuestionBank, parse_questions
+from quiz.timerwheel import TimerWheel
+from quiz.transport import Heartbeat, OutboundQueue, ThreadedConnection
+
+# Micro-benchmarks of the server's hot paths, without network clients or a
+# display.
+#
+#   python benchmarks/microbench.py --json results.json
+#   python benchmarks/microbench.py --compare results.json     (after a change)
+#
+# Every case runs --repeat times and reports the median and the fastest run
+# per operation. --json writes the results with the commit they were taken
+# at; --compare prints each case's median against an earlier JSON file.
+#
+# The engine cases call the game-thread (on_*) methods directly: nothing
+# else submits events to these engines, so the benchmark thread is their
+# only writer. Each case stops its engine's game thread when it is done. The GUI case loads the Tk server window's code with a stub
+# listbox, so it needs tkinter installed but no display.
+
+CASES = {}
+
+
+def case(name):
+    def register(function):
+        CASES[name] = function
+        return function
+    return register
+
+
+class NullConnection:
+    is_closing = False
+
+    def send(self, data, msg_type=None):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def measure(run, repeat, operations=1, setup=None):
+    # run() once per repeat after setup(); returns per-operation timings in seconds
+    timings = []
+    for _ in range(repeat):
+        state = setup() if setup is not None else None
+        started = time.perf_counter()
+        run(state)
+        timings.append((time.perf_counter() - started) / operations)
+    return {
+        "operations": operations,
+        "median_us": round(statistics.median(timings) * 1e6, 3),
+        "min_us": round(min(timings) * 1e6, 3),
+    }
+
+
+def question_lines(count):
+    lines = []
+    for i in range(count):
+        lines += [f"Question {i}: which option is the right one?", f"A - First {i}", f"B - Second {i}",
+                  f"C - Third {i}", f"Answer: {'ABC'[i % 3]}"]
+    return lines
+
+
+def engine_with_players(players, questions=10):
+    engine = GameEngine(question_time=0, question_pause=0)
+    engine.questions = parse_questions(question_lines(questions))
+    engine.file_found = True
+    engine.qa_valid = True
+    engine.question_number = 1000000
+    engine.is_listening = True
+    for i in range(players):
+        engine.players.add(NullConnection(), f"player{i}", ("127.0.0.1", i))
+    engine.ranking.reset(engine.players.names())
+    return engine
+
+
+def close_engine(engine):
+    # Stops the engine's game thread, so threads do not pile up across cases
+    engine.actor.close()
+    engine.actor.thread.join()
+
+
+@case("parse_questions")
+def parse_case(args):
+    lines = question_lines(args.questions)
+    return measure(lambda _: parse_questions(lines), args.repeat)
+
+
+@case("load_question_file")
+def load_case(args):
+    # What the "Send" button does: read and parse the file, uncached
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "questions.txt")
+        with open(path, "w") as file:
+            file.write("\n".join(question_lines(args.questions)) + "\n")
+        return measure(lambda bank: bank.load(path), args.repeat, setup=QuestionBank)
+
+
+def scoreboard_case(players, final):
+    def run(args):
+        engine = engine_with_players(players)
+        for name in engine.players.names():
+            engine.ranking.add_points(name, random.randint(0, 50))
+        try:
+            return measure(lambda _: engine.send_scoreboards(final=final), args.repeat)
+        finally:
+            close_engine(engine)
+    return run
+
+
+for _players in (10, 1000, 100000):
+    case(f"scoreboard_{_players}")(scoreboard_case(_players, final=False))
+    case(f"final_scoreboard_{_players}")(scoreboard_case(_players, final=True))
+
+
+@case("send_to_player")
+def send_to_player_case(args):
+    engine = engine_with_players(10000)
+    names = [f"player{random.randrange(10000)}" for _ in range(10000)]
+    data = b"\x00\x00\x00\x03\x0d{}"
+
+    def run(_):
+        for name in names:
+            engine.send_to_player(name, ACK, data=data)
+    try:
+        return measure(run, args.repeat, operations=len(names))
+    finally:
+        close_engine(engine)
+
+
+class SocketPairPlayers:
+    # Real connections over socketpairs; a thread drains the far ends and
+    # counts the bytes, so a broadcast is done when every peer got it
+    def __init__(self, count):
+        self.connections = []
+        self.peers = []
+        self.received = 0
+        self.condition = threading.Condition()
+        self.selector = selectors.DefaultSelector()
+        self.is_closed = False
+        for i in range(count):
+            near, far = socket.socketpair()
+            self.connections.append(ThreadedConnection(near, ("socketpair", i), OutboundQueue()))
+            far.setblocking(False)
+            self.selector.register(far, selectors.EVENT_READ)
+            self.peers.append(far)
+        self.thread = threading.Thread(target=self.drain, daemon=True)
+        self.thread.start()
+
+    def drain(self):
+        while not self.is_closed:
+            for key, _ in self.selector.select(0.1):
+                try:
+                    size = len(key.fileobj.recv(1 << 20))
+                except BlockingIOError:
+                    continue
+                except OSError:
+                    return
+                with self.condition:
+                    self.received += size
+                    self.condition.notify_all()
+
+    def wait_for(self, total):
+        with self.condition:
+            self.condition.wait_for(lambda: self.received >= total, timeout=10)
+
+    def close(self):
+        for connection in self.connections:
+            connection.close()
+        self.is_closed = True
+        self.thread.join()
+        for peer in self.peers:
+            peer.close()
+        self.selector.close()
+
+
+@case("broadcast_socketpairs")
+def broadcast_case(args):
+    players = SocketPairPlayers(args.socket_players)
+    engine = engine_with_players(0)
+    for i, connection in enumerate(players.connections):
+        engine.players.add(connection, f"player{i}", connection.address)
+
+    body = {"event": "game_starting", "text": "--- Game Starting ---"}
+    size = len(encode_message(CONTROL, body))
+    expected = [0]
+
+    def run(_):
+        engine.broadcast(CONTROL, body)
+        engine.flush_writes()
+        # Done once the far ends read the frame from every connection
+        expected[0] += len(engine.players) * size
+        players.wait_for(expected[0])
+    try:
+        result = measure(run, args.repeat)
+    finally:
+        players.close()
+        close_engine(engine)
+    result["players"] = args.socket_players
+    return result
+
+
+@case("evaluate_round_1000")
+def evaluate_case(args):
+    engine = engine_with_players(1000)
+    engine.game_running = True
+    engine.ask_next_question()
+    connections = [(player.conn, player.name) for player in engine.players.players()]
+
+    def setup():
+        # Everyone but the last player answers, untimed; the last answer
+        # triggers evaluation, scoreboards and the next question
+        number = engine.questions_asked_count
+        for conn, name in connections[:-1]:
+            engine.on_message(conn, name, ANSWER, {"choice": random.choice("ABC"), "number": number})
+        return number
+
+    def run(number):
+        conn, name = connections[-1]
+        engine.on_message(conn, name, ANSWER, {"choice": "A", "number": number})
+    try:
+        return measure(run, args.repeat, setup=setup)
+    finally:
+        close_engine(engine)
+
+
+@case("metrics_hooks")
+def metrics_case(args):
+    # What the engine adds per answer: a counter and a histogram update
+    counter = metrics.Counter("bench_total", "")
+    histogram = metrics.Histogram("bench_seconds", "")
+
+    def run(_):
+        for i in range(10000):
+            counter.inc()
+            histogram.observe(0.001)
+    return measure(run, args.repeat, operations=10000)
+
+
+class ManualScheduler:
+    # The wheel's ticks are driven by hand
+    def call_later(self, delay, callback, *args):
+        pass
+
+
+@case("heartbeat_checks_10000")
+def heartbeat_case(args):
+    # One heartbeat check per connection that was active since its last
+    # one: what a wheel tick costs for every connection due in it
+    connections = [NullConnection() for _ in range(10000)]
+
+    def setup():
+        heartbeat = Heartbeat(None, wheel=TimerWheel(scheduler=ManualScheduler()))
+        for conn in connections:
+            heartbeat.watch(conn)
+        return heartbeat
+
+    def run(heartbeat):
+        for conn in connections:
+            heartbeat.check(conn)
+    return measure(run, args.repeat, operations=len(connections), setup=setup)
+
+
+class StubListbox:
+    def __init__(self):
+        self.items = []
+
+    def insert(self, index, *lines):
+        self.items.extend(lines)
+
+    def see(self, index):
+        pass
+
+    def size(self):
+        return len(self.items)
+
+    def delete(self, first, last=None):
+        del self.items[first:first + 1 if last is None else last + 1]
+
+
+def load_server_window():
+    path = os.path.join(REPO_ROOT, "mertcan.bakir_Bakır_Mertcan_server.py")
+    spec = importlib.util.spec_from_file_location("quiz_server_window", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@case("gui_log_lines")
+def gui_log_case(args):
+    try:
+        module = load_server_window()
+    except ImportError as e:
+        return {"skipped": f"tkinter is not available ({e})"}
+
+    # The window without Tk: only what logging and drawing a frame touch
+    window = module.Server.__new__(module.Server)
+    window.listbox = StubListbox()
+    window.event_log = EventLog()
+    window.log_sequence = 0
+    lines = [f"'player{i}' your answer is correct +1 Point." for i in range(1000)]
+
+    def run(_):
+        for line in lines:
+            window.handle_event("log", line)
+        window.show_new_lines()
+    return measure(run, args.repeat, operations=len(lines))
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of the server's hot paths")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--questions", type=int, default=5000, help="questions in the parsing cases")
+    parser.add_argument("--socket-players", type=int, default=500, help="players in the socketpair broadcast")
+    parser.add_argument("--filter", default="", help="only run cases whose name contains this")
+    parser.add_argument("--json", metavar="FILE", help="write the results to FILE")
+    parser.add_argument("--compare", metavar="FILE", help="compare against results written with --json")
+    args = parser.parse_args()
+
+    random.seed(1)
+    results = {}
+    for name, function in CASES.items():
+        if args.filter in name:
+            results[name] = function(args)
+            print_result(name, results[name])
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        print(f"\ncompared with {args.compare} (commit {baseline['meta'].get('commit') or '?'}):")
+        for name, result in results.items():
+            before = baseline["results"].get(name, {}).get("median_us")
+            if before and "median_us" in result:
+                print(f"{name:<40} {before:>12.3f} us -> {result['median_us']:>12.3f} us  "
+                      f"x{result['median_us'] / before:.2f}")
+
+    if args.json:
+        meta = {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        with open(args.json, "w") as file:
+            json.dump({"meta": meta, "results": results}, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
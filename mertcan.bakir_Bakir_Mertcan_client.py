@@ -1,12 +1,43 @@
 import tkinter as tk
 from tkinter import scrolledtext, messagebox
+import argparse
+import queue
 import socket
 import threading
+import time
+
+from quiz.protocol import (
+    CONTROL, ERROR, PING, QUESTION, SCOREBOARD, WELCOME, FrameDecoder, ProtocolError, encode_answer, encode_bye,
+    encode_hello, encode_pong, message_text,
+)
+
+# The receive thread never touches the window: it puts the decoded messages
+# into a queue, and the Tk thread takes everything queued every REFRESH_MS
+# and shows it with one insert. A scoreboard that is followed right away by
+# a newer one is not shown, and the transcript keeps its last lines only.
+#
+# When the connection breaks without the player asking for it, the client
+# connects again with the session token of its WELCOME and gets its place in
+# the game back, score included, if the server still keeps it. Disconnect
+# tells the server the player is gone for good.
+#
+# The receive thread answers the server's heartbeat pings itself, so a busy
+# window never makes the server think the connection died.
+
+# Milliseconds between two refreshes of the window
+REFRESH_MS = 100
+
+# Lines the transcript keeps
+TRANSCRIPT_LINES = 1000
+
+# Tries to get a lost connection back, and milliseconds between them
+RECONNECT_ATTEMPTS = 5
+RECONNECT_DELAY_MS = 2000
 
 
 class PlayerServer:
 
-    def __init__(self, master: tk.Tk):
+    def __init__(self, master: tk.Tk, transcript_lines=TRANSCRIPT_LINES):
 
         self.master = master
         master.title("Player")
@@ -20,6 +51,18 @@ class PlayerServer:
         self.player_socket = None
         self.is_connected = False
         self.thread = None
+        self.decoder = None
+        # The receive thread answers pings while the Tk thread sends answers
+        self.send_lock = threading.Lock()
+        # Number of the question on screen, sent with the answer
+        self.question_number = None
+        # Token to resume the session with after a lost connection (None: start a new one)
+        self.session = None
+        self.reconnect_attempts = 0
+
+        # (msg_type, body) from the receive thread; (None, socket) when that socket's connection is lost
+        self.inbox = queue.SimpleQueue()
+        self.transcript_lines = transcript_lines
 
          # IP input field
         tk.Label(master, text="IP:").grid(row=0, column=0, sticky="E", padx=1, pady=5)
@@ -32,9 +75,14 @@ class PlayerServer:
         self.port_box.grid(row=0, column=3, columnspan=1, sticky="W", padx=1, pady=5)
 
          # Username input field
-        tk.Label(master, text="Username:").grid(row=1, column=1, sticky="E", padx=1, pady=5)
+        tk.Label(master, text="Username:").grid(row=1, column=0, sticky="E", padx=1, pady=5)
         self.username_box = tk.Entry(master, width=20)
-        self.username_box.grid(row=1, column=2, columnspan=1, sticky="W", padx=1, pady=5)
+        self.username_box.grid(row=1, column=1, columnspan=1, sticky="W", padx=1, pady=5)
+
+         # Room input field (optional, only used by servers hosting several rooms)
+        tk.Label(master, text="Room:").grid(row=1, column=2, sticky="E", padx=1, pady=5)
+        self.room_box = tk.Entry(master, width=10)
+        self.room_box.grid(row=1, column=3, columnspan=1, sticky="W", padx=1, pady=5)
 
         # Connect / Disconnect button
         self.Connect_button = tk.Button(master, text="Connect", command= self.toggle_connection)
@@ -71,6 +119,8 @@ class PlayerServer:
         self.Send_button = tk.Button(master, text="Send", command=self.send_message, state=tk.DISABLED)
         self.Send_button.grid(row=4, column=3, sticky="EW", padx=5, pady=5)
 
+        self.process_messages()
+
     # Connect or disconnect depending on current state
     def toggle_connection(self):
         if self.is_connected:
@@ -82,6 +132,7 @@ class PlayerServer:
         ip = self.ip_box.get()
         port_str = self.port_box.get()
         username = self.username_box.get()
+        room = self.room_box.get().strip()
 
         # All fields must be filled before connecting
         if not ip or not port_str or not username:
@@ -97,27 +148,30 @@ class PlayerServer:
             self.player_socket.connect((ip, port))
             self.player_socket.settimeout(None)
 
-            # Send username to server immediately after connection
-            self.player_socket.sendall(username.encode())
+            # Send hello (protocol version + username + room + session) immediately after connection
+            self.player_socket.sendall(encode_hello(username, room, self.session))
 
-            # Wait for server response (OK or Error)
-            self.player_socket.settimeout(2.0)
-            initial_response = self.player_socket.recv(1024).decode()
-            self.player_socket.settimeout(None)
+            # Wait for server response (welcome or error)
+            self.decoder = FrameDecoder()
+            msg_type, body, pending = self.receive_first_message(timeout=2.0)
 
-            if initial_response.startswith("Error:"):
-                # Server rejected connection (e.g., duplicate username)
+            if msg_type == ERROR:
+                # Server rejected connection (e.g., duplicate username); a
+                # session it turned away is over
                 self.player_socket.close()
-                error_message = f"Connection failed: {initial_response[6:].strip()}"
+                self.session = None
+                error_message = f"Connection failed: {body.get('reason', '')}"
                 self.add_message_to_text(error_message)
                 return
 
-            elif initial_response == "OK":
+            elif msg_type == WELCOME:
                 # Successful connection
                 self.is_connected = True
+                self.session = body.get("session")
+                self.reconnect_attempts = 0
                 
                  # Start background thread to receive server messages
-                self.thread = threading.Thread(target=self.receive_messages, daemon=True)
+                self.thread = threading.Thread(target=self.receive_messages, args=(pending,), daemon=True)
                 self.thread.start()
                 
                 self.Connect_button.config(text="Disconnect")
@@ -131,8 +185,8 @@ class PlayerServer:
                 self.add_message_to_text(f"Connection failed: Server sent unknown response.")
                 return
             
-        except socket.timeout:
-            # Timeout while waiting for server response
+        except (socket.timeout, ProtocolError):
+            # Timeout or garbage while waiting for server response
             self.player_socket.close()
             error_message = f"Connection failed: Server sent unknown response."
             self.add_message_to_text(error_message)
@@ -147,20 +201,82 @@ class PlayerServer:
             if self.player_socket:
                 self.player_socket.close()
 
-    def disconnect_to_server(self):
-        # Disconnect safely from the server
+    def receive_first_message(self, timeout):
+        # Read until the first whole message arrived; anything sent right
+        # behind it is returned too so the receive thread can show it
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise socket.timeout("No response from server")
+
+            self.player_socket.settimeout(remaining)
+            data = self.player_socket.recv(1024)
+            if not data:
+                raise ProtocolError("Server closed the connection")
+
+            messages = self.decoder.feed(data)
+            if messages:
+                self.player_socket.settimeout(None)
+                msg_type, body = messages[0]
+                return msg_type, body, messages[1:]
+
+    def disconnect_to_server(self, leaving=True):
+        # Disconnect safely from the server; leaving=False keeps the session
+        # to resume it
         if self.is_connected:
             self.is_connected = False
+            if leaving:
+                try:
+                    self.send(self.player_socket, encode_bye())
+                except (socket.error, OSError):
+                    pass
             self.player_socket.close()
             self.Connect_button.config(text="Connect")
             self.Send_button.config(state=tk.DISABLED)
             self.add_message_to_text("--- Disconnected ---")
+        if leaving:
+            self.session = None
+
+    def connection_lost(self):
+        # Reported by the receive thread and by a failed send; the first one counts
+        if not self.is_connected:
+            return
+        self.disconnect_to_server(leaving=False)
+        if self.session is not None:
+            self.reconnect_attempts = 0
+            self.master.after(RECONNECT_DELAY_MS, self.reconnect)
+
+    def reconnect(self):
+        # Tk thread: try to resume the session until it works, the session
+        # is over or the player connected or disconnected themselves
+        if self.is_connected or self.session is None:
+            return
+
+        self.reconnect_attempts += 1
+        self.add_message_to_text(f"--- Reconnecting ({self.reconnect_attempts}/{RECONNECT_ATTEMPTS}) ---")
+        self.connect_to_server()
+        if not self.is_connected and self.session is not None:
+            if self.reconnect_attempts < RECONNECT_ATTEMPTS:
+                self.master.after(RECONNECT_DELAY_MS, self.reconnect)
+            else:
+                self.session = None
 
 
     def add_message_to_text(self, message):
         # Append message to the text widget
+        self.show_lines([message])
+
+    def show_lines(self, lines):
+        # Append all lines at once, then drop the oldest beyond the limit
         self.text_widget.config(state=tk.NORMAL)
-        self.text_widget.insert(tk.END, message + "\n")
+        self.text_widget.insert(tk.END, "\n".join(lines) + "\n")
+
+        # The text always ends with an empty line after the last newline
+        excess = int(self.text_widget.index("end-1c").split(".")[0]) - 1 - self.transcript_lines
+        if excess > 0:
+            self.text_widget.delete("1.0", f"{excess + 1}.0")
+
         self.text_widget.config(state=tk.DISABLED)
         self.text_widget.yview(tk.END)
 
@@ -170,34 +286,96 @@ class PlayerServer:
             message = self.option.get()
             if message:
                 try:
-                    self.player_socket.sendall(message.encode())
+                    self.send(self.player_socket, encode_answer(message, self.question_number))
                 except (socket.error, OSError):
-                    self.disconnect_to_server()
+                    self.connection_lost()
+
 
+    def send(self, player_socket, data):
+        with self.send_lock:
+            player_socket.sendall(data)
+
+    def receive_messages(self, pending):
+        # Continuously listen for messages from the server; runs on its own
+        # thread, so everything goes through the inbox
+        player_socket = self.player_socket
+        decoder = self.decoder
+        for message in pending:
+            self.inbox.put(message)
 
-    def receive_messages(self):
-        # Continuously listen for messages from the server
         while self.is_connected:
             try:
-                message = self.player_socket.recv(1024).decode()
-                if message:
-                     # Enable answer sending when game starts
-                    if "--- Game Starting ---" in message:
-                        self.master.after(0, lambda: self.Send_button.config(state=tk.NORMAL))
-                        
-                    # Disable answer sending when game ends
-                    if "--- Game Ended ---" in message:
-                        self.master.after(0, lambda: self.Send_button.config(state=tk.DISABLED))
-
-                    self.add_message_to_text(message)
-                else:
+                data = player_socket.recv(1024)
+                if not data:
                     # Empty message means server disconnected
-                    self.disconnect_to_server()
                     break
-            except (socket.error, OSError):
-                self.disconnect_to_server()
+                for message in decoder.feed(data):
+                    if message[0] == PING:
+                        self.send(player_socket, encode_pong())
+                    else:
+                        self.inbox.put(message)
+            except (socket.error, OSError, ProtocolError):
+                break
+
+        self.inbox.put((None, player_socket))
+
+    def process_messages(self):
+        # Tk thread: show everything the receive thread queued since the
+        # last refresh, then wait for the next one
+        batch = []
+        while True:
+            try:
+                batch.append(self.inbox.get_nowait())
+            except queue.Empty:
                 break
 
+        lines = []
+        for i, (msg_type, body) in enumerate(batch):
+            if msg_type is None:
+                # The receive thread of body, a socket, stopped
+                if lines:
+                    self.show_lines(lines)
+                    lines = []
+                if body is self.player_socket:
+                    self.connection_lost()
+                continue
+
+            # Only the newest of back-to-back scoreboards is worth drawing
+            if msg_type == SCOREBOARD and i + 1 < len(batch) and batch[i + 1][0] == SCOREBOARD:
+                continue
+            lines.append(self.handle_message(msg_type, body))
+
+        if lines:
+            self.show_lines(lines)
+        self.master.after(REFRESH_MS, self.process_messages)
+
+    def handle_message(self, msg_type, body):
+        # Returns the text to show
+        if msg_type == QUESTION:
+            self.question_number = body.get("number")
+            # A new question can be answered, also after resuming with the last one answered
+            self.Send_button.config(state=tk.NORMAL)
+
+        if msg_type == ERROR:
+            # The server turned the connection away; its session is over
+            self.session = None
+
+        if msg_type == CONTROL:
+             # Enable answer sending when game starts
+            if body.get("event") == "game_starting":
+                self.Send_button.config(state=tk.NORMAL)
+                
+            # Disable answer sending when game ends
+            if body.get("event") == "game_ended":
+                self.Send_button.config(state=tk.DISABLED)
+
+            # Back in the game after a lost connection; the question may be answered already
+            if body.get("event") == "resumed":
+                can_answer = body.get("game_running") and not body.get("answered")
+                self.Send_button.config(state=tk.NORMAL if can_answer else tk.DISABLED)
+
+        return message_text(msg_type, body)
+
 
     def on_closing(self):
         # Handle window close event
@@ -208,6 +386,11 @@ class PlayerServer:
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Multiplayer quiz player")
+    parser.add_argument("--transcript-lines", type=int, default=TRANSCRIPT_LINES, metavar="N",
+                        help="lines of server messages the window keeps")
+    args = parser.parse_args()
+
     root = tk.Tk()
-    app = PlayerServer(root)
+    app = PlayerServer(root, transcript_lines=args.transcript_lines)
     root.mainloop()
\ No newline at end of file
@@ -0,0 +1 @@
+# Shared building blocks for the quiz server and player client.
@@ -0,0 +1,66 @@
+import queue
+import threading
+import traceback
+
+# A thread that owns some state and is the only thread that changes it.
+#
+# Other threads do not take a lock and change the state themselves, they
+# submit a callback to the actor's inbox and return at once. The actor runs
+# the callbacks one at a time, in the order they were submitted, so the
+# state never needs a lock and a slow step only delays the callbacks behind
+# it, never the threads that submitted them.
+#
+# after_each, if given, runs on the actor thread after every callback, e.g.
+# to flush what the callback queued.
+
+
+class Actor:
+    def __init__(self, name="actor", after_each=None):
+        self.inbox = queue.SimpleQueue()
+        self.after_each = after_each
+        self.thread = threading.Thread(target=self.run, name=name, daemon=True)
+        self.thread.start()
+
+    def on_thread(self):
+        return threading.current_thread() is self.thread
+
+    def submit(self, callback, *args):
+        self.inbox.put((callback, args))
+
+    def call(self, callback, *args):
+        # Runs right away on the actor thread, otherwise like submit()
+        if self.on_thread():
+            callback(*args)
+        else:
+            self.submit(callback, *args)
+
+    def wait_idle(self, timeout=None):
+        # Waits until everything submitted so far has run; returns False on timeout
+        if self.on_thread():
+            return True
+        done = threading.Event()
+        self.submit(done.set)
+        return done.wait(timeout)
+
+    def close(self):
+        # Runs what was already submitted, then stops the thread
+        self.inbox.put(None)
+
+    def run(self):
+        while True:
+            item = self.inbox.get()
+            if item is None:
+                break
+
+            callback, args = item
+            try:
+                callback(*args)
+            except Exception:
+                # One bad event must not stop the ones behind it
+                traceback.print_exc()
+
+            if self.after_each is not None:
+                try:
+                    self.after_each()
+                except Exception:
+                    traceback.print_exc()
@@ -0,0 +1,45 @@
+import argparse
+import os
+import sys
+import time
+
+from quiz.questions import compile_questions
+
+# Compiles a question file in the quiz_qa.txt format into the memory-mapped
+# binary format described in quiz/questions.py.
+#
+#   python -m quiz.compile_questions quiz_qa.txt quiz_qa.qbank
+#
+# The compiled file is used like the text file: --questions quiz_qa.qbank,
+# or its name in the server's "File name" box.
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile a quiz question file for fast loading")
+    parser.add_argument("source", help="question file in the quiz_qa.txt format")
+    parser.add_argument("target", nargs="?", help="compiled file (default: source with a .qbank extension)")
+    args = parser.parse_args(argv)
+
+    target = args.target or os.path.splitext(args.source)[0] + ".qbank"
+    problems = 0
+
+    def report(number, problem):
+        nonlocal problems
+        problems += 1
+        print(f"Warning: '{args.source}' line {number}: {problem}, question skipped.", file=sys.stderr)
+
+    started = time.perf_counter()
+    try:
+        count = compile_questions(args.source, target, report)
+    except (OSError, ValueError) as e:
+        print(f"Error: Could not compile '{args.source}'. Reason: {e}", file=sys.stderr)
+        return 1
+
+    elapsed = time.perf_counter() - started
+    print(f"Compiled {count} questions from '{args.source}' into '{target}' in {elapsed:.2f}s "
+          f"({problems} skipped).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
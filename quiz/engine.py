@@ -0,0 +1,932 @@
+import os
+import socket
+import time
+import uuid
+
+from quiz import metrics
+from quiz.actor import Actor
+from quiz.protocol import (
+    ACK, ANSWER, ANSWER_CHOICES, BYE, CONTROL, ERROR, QUESTION, RESULT, SCOREBOARD, MessageTemplate,
+    encode_message, scoreboard_text,
+)
+from quiz.players import PlayerRegistry
+from quiz.questions import shared_bank
+from quiz.ranking import Ranking
+from quiz.scheduler import shared_scheduler
+from quiz.sessions import RESUMABLE_REASONS, RESUME_GRACE, DetachedConnection
+from quiz.transport import TRANSPORTS, SlowConsumerError
+
+# Game engine shared by the Tk server window and the headless server.
+#
+# The engine owns the game state, the players and the network transport,
+# and never touches a GUI. Everything an operator should see is published
+# as (event, data) tuples to subscribers:
+#   ("log", text)                  a line for the server log
+#   ("listening", is_listening)
+#   ("start_conditions", can_start) file + QA number + at least 2 players
+#   ("game_running", is_running)
+#   ("all_players_left", None)     the last player left, or their session ran out
+#   ("game_started", {"game", "started", "questions", "players"})
+#   ("round_finished", {"game", "number", "question", "answer", "asked",
+#                       "answers": [(name, choice, points, arrived), ...]})
+#   ("game_finished", {"game", "finished", "rounds",
+#                      "standings": [(rank, name, score), ...]})
+#
+# The last three are the game history (see quiz/history.py); times are
+# time.time() and the answers are in the order they arrived. A game that is
+# stopped or loses its server before the last question still finishes, with
+# the rounds played so far.
+#
+# Subscribers are called on whatever thread produced the event, so
+# observers with thread affinity (Tk) must hand events over to their own
+# thread, e.g. through a queue.
+#
+# All game state belongs to one thread, the engine's actor (quiz/actor.py).
+# Player threads, timers, the Tk window and the room manager never change
+# it themselves: add_player, remove_player, handle_player_message, the
+# timers and the operator commands (start_game, stop_game, set_qa_number,
+# load_questions, stop_listening) only put an event into the actor's inbox
+# and return. The on_* methods are the actor side of those events and must
+# only run on the actor thread. No locks are held while messages are
+# handed to the transport, which only queues them for its writers anyway.
+#
+# Writes are flushed once per event: whatever one event sends a player
+# (the correct answer, their result, the scoreboard and the next question)
+# goes out in one socket write after the event, see flush_writes.
+#
+# A player whose connection breaks keeps their place for resume_grace
+# seconds and may come back with their session token, see quiz/sessions.py.
+#
+# Players, answers, sends, disconnects and the time spent evaluating and
+# broadcasting are counted in quiz/metrics.py.
+
+# Players listed on the scoreboard each player receives after a question
+SCOREBOARD_SIZE = 10
+
+# Seconds players get to answer a question (0: wait for every player), and
+# the pause between the scoreboard and the next question
+QUESTION_TIME = 30.0
+QUESTION_PAUSE = 0.0
+
+# Skipped question blocks listed in the log when a file is loaded
+MAX_REPORTED_PROBLEMS = 10
+
+# Seconds stop_listening waits for the game thread to disconnect the players
+STOP_TIMEOUT = 2.0
+
+# Sent to a player whose session ran out while a game is on
+SESSION_EXPIRED = "Your session has expired and the game already started."
+
+
+# Returns the local IP address to display in the server log
+def get_local_ip():
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        s.connect(("8.8.8.8", 80))
+        return s.getsockname()[0]
+    except (socket.error, OSError):
+        # No route to the internet, e.g. on an isolated game server
+        return "127.0.0.1"
+    finally:
+        s.close()
+
+
+class GameEngine:
+    def __init__(self, transport_mode="threaded", transport_options=None, scoreboard_size=SCOREBOARD_SIZE,
+                 question_time=QUESTION_TIME, question_pause=QUESTION_PAUSE, scheduler=None, question_bank=None,
+                 watch_questions=False, batch_writes=True, resume_grace=RESUME_GRACE):
+        # Game start conditions
+        self.game_running = False
+        self.file_found = False
+        self.qa_valid = False
+
+        # Game state variables
+        self.question_number = 0
+        # Parsed question files are shared between games, see quiz/questions.py
+        self.question_bank = question_bank or shared_bank()
+        self.questions = []
+        # Version of the question file, keys the encoded questions (None: not from a file)
+        self.question_source = None
+        # A newer QuestionFile, swapped in before the next question
+        self.pending_questions = None
+        # Follow changes the question bank notices in the file on disk
+        self.watch_questions = watch_questions
+        # The question of the current round; a swap between rounds never touches it
+        self.current_question = None
+        self.current_question_index = -1
+        self.questions_asked_count = 0
+        # Rounds evaluated; less than the questions asked when the game is
+        # stopped in the middle of a round
+        self.rounds_finished = 0
+        # Identifies the running game in the history events
+        self.game_id = None
+        # time.time() when the current question went out
+        self.question_asked_at = 0.0
+
+        # Network transport and connection state
+        self.transport_mode = transport_mode
+        # Extra keyword arguments for the transport (queue size, slow-consumer policy, ...)
+        self.transport_options = transport_options or {}
+        self.transport = None
+        self.is_listening = False
+        # Connected players by name, connection and session, see quiz/players.py
+        self.players = PlayerRegistry()
+        # Seconds a player with a broken connection keeps their place
+        self.resume_grace = resume_grace
+
+        # Scoring and answer tracking. Players that leave keep their place on
+        # the scoreboard until the next game starts.
+        self.ranking = Ranking()
+        self.scoreboard_size = scoreboard_size
+        self.waiting_for_answers = False
+        # Players in the order their answers arrived this round
+        self.answer_sequence = []
+        # perf_counter() when the current question went out and when its last answer came in
+        self.question_sent_at = 0.0
+        self.last_answer_at = 0.0
+
+        # Connections that were sent something during the current event, and
+        # whether a broadcast reached every player; flushed after the event.
+        # batch_writes=False flushes after every message instead.
+        self.batch_writes = batch_writes
+        self.unflushed = set()
+        self.flush_everyone = False
+
+        # The only thread that changes the game state
+        self.actor = Actor("game engine", after_each=self.flush_writes)
+
+        # Question deadline and pause timers, on a scheduler shared by all games
+        self.question_time = question_time
+        self.question_pause = question_pause
+        self.scheduler = scheduler or shared_scheduler()
+        self.round_timer = None
+
+        # Event stream observers
+        self.subscribers = []
+
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        self.subscribers.remove(callback)
+
+    def emit(self, event, data):
+        for callback in list(self.subscribers):
+            callback((event, data))
+
+    def log(self, message):
+        self.emit("log", message)
+
+    def can_start(self):
+        # Game can start only if: file is loaded + QA number set + at least 2 players connected
+        return (self.file_found and
+                self.qa_valid and
+                len(self.players) >= 2)
+
+    def check_start_conditions(self):
+        if self.is_listening:
+            can_start = self.can_start()
+
+            # If conditions are no longer satisfied, stop the running game
+            if not can_start and self.game_running:
+                self.on_stop_game()
+
+            self.emit("start_conditions", can_start)
+
+    # Operator commands, from any thread
+
+    def start_game(self):
+        self.actor.call(self.on_start_game)
+
+    def stop_game(self):
+        self.actor.call(self.on_stop_game)
+
+    # Stop the game and show final scoreboard
+    def on_stop_game(self):
+        if not self.game_running:
+            return
+
+        self.cancel_round_timer()
+        self.game_running = False
+        self.waiting_for_answers = False
+        self.answer_sequence = []
+        self.players.new_round()
+
+        self.send_scoreboards(final=True)
+        self.emit_game_finished()
+
+        self.log("--- Game Ended ---")
+        self.broadcast(CONTROL, {"event": "game_ended", "text": "--- Game Ended ---"})
+
+        # Observers may shut the server down on this event, so it comes last
+        self.emit("game_running", False)
+
+    def emit_game_finished(self):
+        # Standings after the rounds played so far, also for a game that was
+        # stopped before its last question
+        self.emit("game_finished", {
+            "game": self.game_id,
+            "finished": time.time(),
+            "rounds": self.rounds_finished,
+            "standings": self.ranking.top(len(self.ranking)),
+        })
+
+    # Initialize a new game session
+    def on_start_game(self):
+        if self.game_running or not self.can_start():
+            return
+
+        self.game_running = True
+        self.game_id = uuid.uuid4().hex
+        self.emit("game_running", True)
+
+        self.current_question_index = -1
+        self.questions_asked_count = 0
+        self.rounds_finished = 0
+
+        # Reset answer-related state
+        self.waiting_for_answers = False
+        self.answer_sequence = []
+        self.players.new_round()
+
+        self.start_first_round()
+
+    def start_first_round(self):
+        self.log("--- Game Starting ---")
+        self.broadcast(CONTROL, {"event": "game_starting", "text": "--- Game Starting ---"})
+
+        # Reset scores, dropping players that left during an earlier game
+        self.ranking.reset(self.players.names())
+        self.emit("game_started", {
+            "game": self.game_id,
+            "started": time.time(),
+            "questions": self.question_number,
+            "players": len(self.ranking),
+        })
+        self.send_scoreboards()
+
+        self.ask_next_question()
+
+    # Send the next question to all players
+    def ask_next_question(self):
+
+        # Check if total number of questions is reached
+        if self.questions_asked_count >= self.question_number:
+            self.log("--- Game Over---")
+            self.broadcast(CONTROL, {"event": "game_over", "text": "--- Game Over ---"})
+            self.on_stop_game()
+            return
+
+        # Enable answer collection and clear previous answers
+        self.waiting_for_answers = True
+        self.answer_sequence = []
+        self.players.new_round()
+
+        # Reloaded questions only ever take effect here, between two rounds
+        self.swap_questions()
+
+        # Loop back to start if end of file is reached
+        if self.current_question_index + 1 >= len(self.questions):
+            self.current_question_index = 0
+        else:
+            self.current_question_index += 1
+
+        self.questions_asked_count += 1
+
+        # Get current question from list
+        current_q = self.questions[self.current_question_index]
+        self.current_question = current_q
+
+        # Rendered once per question and header, see quiz/payloads.py
+        header = (self.questions_asked_count, self.question_number, max(self.question_time, 0))
+        question_data = self.question_bank.payloads.question(
+            self.question_source, self.questions, self.current_question_index, header)
+
+        if self.question_time > 0:
+            # The round number tells a late timer that its question is already over
+            self.round_timer = self.scheduler.call_later(
+                self.question_time, self.actor.submit, self.on_time_up, self.players.round)
+
+        self.log(f"Asking Question {self.questions_asked_count}: {current_q.text}")
+        self.broadcast_data(QUESTION, question_data)
+        self.question_sent_at = time.perf_counter()
+        self.question_asked_at = time.time()
+
+    def cancel_round_timer(self):
+        if self.round_timer is not None:
+            self.round_timer.cancel()
+            self.round_timer = None
+
+    def on_time_up(self, round_number):
+        # Question deadline: evaluate with whatever answers have arrived
+        if not (self.game_running and self.waiting_for_answers and self.players.round == round_number):
+            return
+
+        self.round_timer = None
+        self.log(f"Time is up: {self.players.answered_count} of {len(self.players)} players answered.")
+        self.broadcast(CONTROL, {"event": "time_up", "text": "Time is up!"})
+        self.log("----------------------")
+        self.evaluate_answers_and_next_question()
+
+    def on_pause_over(self, round_number):
+        # The pause after a scoreboard is over
+        if self.game_running and not self.waiting_for_answers and self.players.round == round_number:
+            self.round_timer = None
+            self.ask_next_question()
+
+    # Transport host interface, called from the player threads
+
+    def check_new_player(self, name, room=None, resume=None):
+        # Called by the transport with the username of a new connection.
+        # Returns the reason to reject it, or None to accept it. Only reads
+        # the state; on_join settles two players racing for one name.
+        # room is only used by the room manager, see quiz/rooms.py
+
+        # A player resuming their session takes their place back, game or not
+        if self.can_resume(name, resume):
+            return None
+
+        # Reject new connections if game already started
+        if self.game_running:
+            self.log(f"Connection attempt rejected: Game in progress.")
+            if resume:
+                return SESSION_EXPIRED
+            return "Game already started."
+
+        # Reject duplicate usernames
+        if name in self.players:
+            self.log(f"Connection attempt by '{name}' rejected (Name taken).")
+            return f"Username '{name}' is already taken."
+
+        return None
+
+    def add_player(self, player_conn, name, player_address, room=None, session=None, resume=None):
+        # session: the token this connection was welcomed with; resume: the
+        # token of the session it takes over, if any
+        self.actor.submit(self.on_join, player_conn, name, player_address, session, resume)
+
+    def handle_player_message(self, player_conn, name, msg_type, body):
+        self.actor.submit(self.on_message, player_conn, name, msg_type, body)
+
+    def remove_player(self, player_conn, reason="closed"):
+        self.actor.submit(self.on_leave, player_conn, reason)
+
+    def can_resume(self, name, resume):
+        player = self.players.find_session(resume) if resume else None
+        return player is not None and player.name == name
+
+    def on_join(self, player_conn, name, player_address, session=None, resume=None):
+        if self.can_resume(name, resume):
+            self.reattach(self.players.find_session(resume), player_conn, player_address, session)
+            return
+
+        if resume and self.game_running:
+            # The session ended between the hello and now, and a new player
+            # cannot join a running game either
+            self.log(f"Connection attempt by '{name}' rejected (Session expired).")
+            try:
+                player_conn.send(encode_message(ERROR, {"reason": SESSION_EXPIRED}))
+                player_conn.flush()
+                player_conn.close()
+            except (socket.error, OSError):
+                pass
+            return
+
+        # Register the player once it was welcomed
+        if self.players.add(player_conn, name, player_address, session) is None:
+            # Another connection with the same name got registered in between
+            self.log(f"Connection attempt by '{name}' rejected (Name taken).")
+            player_conn.close()
+            return
+        metrics.players_active.inc()
+        self.log(f"New connection from {player_address[0]} as '{name}'")
+        if resume:
+            # Joined as a new player; the client expected its old place back
+            self.send_to_player(name, CONTROL, {
+                "event": "resume_failed",
+                "text": "--- Your session has expired, you joined as a new player ---",
+            })
+        self.check_start_conditions()
+
+    def on_message(self, player_conn, name, msg_type, body):
+        # The player leaves for good, so their place is not kept
+        if msg_type == BYE:
+            player = self.players.get(name)
+            if (player is not None and isinstance(player.conn, DetachedConnection)
+                    and player.conn.origin is player_conn):
+                # A failed send detached them just before
+                player_conn = player.conn
+            self.on_leave(player_conn, "left")
+            return
+
+        # Check if message is a valid answer
+        is_answer = (
+            msg_type == ANSWER and
+            self.game_running and
+            self.waiting_for_answers and
+            body.get("choice") in ANSWER_CHOICES and
+            # A late answer to a question whose time ran out must not count for the next one
+            body.get("number", self.questions_asked_count) == self.questions_asked_count
+        )
+
+        if is_answer:
+            self.handle_player_answer(name, body["choice"])
+
+    def handle_player_answer(self, username, answer):
+        player = self.players.get(username)
+        if not self.waiting_for_answers or player is None:
+            return
+
+        # Store player's answer, preventing multiple answers from same player
+        if not self.players.record_answer(player, answer):
+            self.log(f"Error: '{username}' already answered.")
+            self.send_to_player(username, ACK, {"accepted": False, "text": "You already answered"})
+            return
+
+        # Track order of answers
+        player.answered_at = time.time()
+        self.answer_sequence.append(player)
+        self.last_answer_at = time.perf_counter()
+        metrics.answers.inc()
+
+        # Acknowledge answer receipt
+        self.send_to_player(username, ACK, {"accepted": True, "text": f"Your answer: '{answer}' is received"})
+
+        # Check if all players answered
+        if self.players.all_answered():
+            self.log("----------------------")
+            self.evaluate_answers_and_next_question()
+
+    def evaluate_answers_and_next_question(self):
+        # A stopped game or a round that is already over has nothing to evaluate
+        if not (self.game_running and self.waiting_for_answers):
+            return
+        started = time.perf_counter()
+
+        # Stop accepting answers; closing early when everyone answered
+        self.waiting_for_answers = False
+        self.cancel_round_timer()
+        if self.answer_sequence:
+            metrics.answer_window.observe(self.last_answer_at - self.question_sent_at)
+
+        # Get correct answer for current question
+        correct_choice = self.current_question.answer
+
+        self.log(f"Correct Answer: {correct_choice}")
+        self.broadcast(RESULT, {"answer": correct_choice, "text": f"Correct Answer: {correct_choice}"})
+
+        first_correct_answerer = None
+
+        # Answer evaluation section
+        self.log("\n--- Answer Evaluation ---")
+
+        # Only players that are still connected are scored
+        answers = [player for player in self.answer_sequence if self.players.get(player.name) is player]
+
+        # Find first correct answerer
+        for player in answers:
+            if player.answer == correct_choice:
+                first_correct_answerer = player.name
+                break
+
+        # Score calculation; results are the round's history
+        results = []
+        for player in answers:
+            username = player.name
+            points = 0
+            if player.answer == correct_choice:
+                if username == first_correct_answerer:
+                    bonus = len(self.players) - 1
+                    points = 1 + bonus
+                    self.ranking.add_points(username, 1 + bonus)
+                    message = f"{username} is first and correct +1 point and (bonus +{len(self.players) - 1 } Points)."
+                    self.log(message)
+                    self.send_to_player(username, RESULT, {"points": 1 + bonus, "text": message})
+                else:
+                    points = 1
+                    self.ranking.add_points(username, 1)
+                    message = f"{username} your answer is correct +1 Point."
+                    self.send_to_player(username, RESULT, {"points": 1, "text": message})
+                    self.log(f"{username} your answer is correct +1 Point.")
+            else:
+                message = f"{username} your answer is wrong 0 Point."
+                self.send_to_player(username, RESULT, {"points": 0, "text": message})
+                self.log(f"{username} your answer is wrong 0 Point.")
+            results.append((username, player.answer, points, player.answered_at))
+        self.log("\n--- ------ -------- ---")
+
+        self.rounds_finished += 1
+        self.emit("round_finished", {
+            "game": self.game_id,
+            "number": self.questions_asked_count,
+            "question": self.current_question.text,
+            "answer": correct_choice,
+            "asked": self.question_asked_at,
+            "answers": results,
+        })
+
+        # Clear stored answers
+        self.answer_sequence = []
+
+        # Send the updated scoreboard
+        self.send_scoreboards()
+        metrics.evaluation_duration.observe(time.perf_counter() - started)
+
+        if self.question_pause > 0 and self.questions_asked_count < self.question_number:
+            self.round_timer = self.scheduler.call_later(
+                self.question_pause, self.actor.submit, self.on_pause_over, self.players.round)
+        else:
+            self.ask_next_question()
+
+    def send_to_player(self, username, msg_type, body=None, data=None):
+        # data: the message already encoded, body is ignored then
+
+        # Find the connection that belongs to the given username
+        player = self.players.get(username)
+
+        if player is not None:
+            target_conn = player.conn
+            try:
+                target_conn.send(data or encode_message(msg_type, body), msg_type)
+                metrics.messages_sent.inc()
+                if self.batch_writes:
+                    self.unflushed.add(target_conn)
+                else:
+                    target_conn.flush()
+
+            except SlowConsumerError:
+                metrics.send_failures.labels("slow_consumer").inc()
+                self.log(f"'{username}' cannot keep up with the game. Disconnecting.")
+                self.on_leave(target_conn, "slow_consumer")
+
+            except (socket.error, OSError) as e:
+                # If sending fails, log the error and remove the disconnected player
+                metrics.send_failures.labels("error").inc()
+                self.log(f"Error sending message to '{username}'. Disconnecting.")
+                self.on_leave(target_conn, "send_error")
+
+        else:
+            # Username not found in current players list
+            self.log(f"Error: Player '{username}' not found.")
+
+    def broadcast(self, msg_type, body):
+        # Send a message to every connected player, encoded once for all of them
+        self.broadcast_data(msg_type, encode_message(msg_type, body))
+
+    def broadcast_data(self, msg_type, data):
+        started = time.perf_counter()
+        players = self.players.players()
+        for player in players:
+            player_conn = player.conn
+            try:
+                player_conn.send(data, msg_type)
+                if not self.batch_writes:
+                    player_conn.flush()
+            except SlowConsumerError:
+                metrics.send_failures.labels("slow_consumer").inc()
+                self.log(f"'{player.name}' cannot keep up with the game. Disconnecting.")
+                self.on_leave(player_conn, "slow_consumer")
+            except (socket.error, OSError):
+                # If a connection fails, remove that player from the server
+                metrics.send_failures.labels("error").inc()
+                self.on_leave(player_conn, "send_error")
+
+        self.flush_everyone = True
+        metrics.messages_sent.inc(len(players))
+        metrics.broadcast_duration.observe(time.perf_counter() - started)
+
+    def flush_writes(self):
+        # Actor thread, after every event: the writers get everything the
+        # event queued, one write per player. Players that left during the
+        # event were closed, and closing writes out what they had queued.
+        if self.flush_everyone:
+            connections = self.players.connections()
+        elif self.unflushed:
+            connections = self.unflushed
+        else:
+            return
+
+        for player_conn in connections:
+            player_conn.flush()
+        self.unflushed = set()
+        self.flush_everyone = False
+
+    def reattach(self, player, player_conn, player_address, session):
+        # The player's new connection takes over their place and everything
+        # still queued for them; nobody else hears about it
+        old_conn = player.conn
+        if player.resume_timer is not None:
+            player.resume_timer.cancel()
+            player.resume_timer = None
+
+        pending = old_conn.outbound.take_items()
+        # A connection the server did not notice breaking yet is closed now;
+        # its reader reports it, but the registry no longer knows it
+        try:
+            old_conn.close()
+        except (socket.error, OSError):
+            pass
+
+        self.players.replace_conn(player, player_conn, session)
+        player.address = player_address
+        metrics.sessions_resumed.inc()
+        self.log(f"'{player.name}' reconnected from {player_address[0]}.")
+
+        # The welcome back first, then what happened while they were away
+        score = self.ranking.score(player.name) or 0
+        self.send_to_player(player.name, CONTROL, {
+            "event": "resumed",
+            "score": score,
+            "game_running": self.game_running,
+            "answered": self.players.has_answered(player),
+            "text": f"--- Welcome back, {player.name}. Your score: {score} ---",
+        })
+        try:
+            player_conn.outbound.put_items(pending)
+        except SlowConsumerError:
+            metrics.send_failures.labels("slow_consumer").inc()
+            self.on_leave(player_conn, "slow_consumer")
+            return
+
+        if self.batch_writes:
+            self.unflushed.add(player_conn)
+        else:
+            player_conn.flush()
+
+    def detach(self, player, reason):
+        # Keep the player of a broken connection in the game for resume_grace
+        # seconds, with a stand-in connection that queues their messages
+        old_conn = player.conn
+        holder = DetachedConnection(old_conn)
+        self.players.replace_conn(player, holder)
+        try:
+            old_conn.close()
+        except (socket.error, OSError):
+            pass
+
+        player.resume_timer = self.scheduler.call_later(
+            self.resume_grace, self.actor.submit, self.on_resume_expired, holder)
+        metrics.sessions_detached.inc()
+        self.log(f"'{player.name}' lost the connection ({reason}), "
+                 f"keeping their place for {self.resume_grace:g} seconds.")
+
+    def on_resume_expired(self, holder):
+        player = self.players.find(holder)
+        if player is not None:
+            player.resume_timer = None
+            self.log(f"'{player.name}' did not reconnect in time.")
+            self.on_leave(holder, "resume_expired")
+
+    def on_leave(self, player_conn, reason="closed"):
+        # Remove a disconnected player and update game state if needed.
+        # When the reader thread and a failed send both report the same
+        # player only the first one gets it back from the registry, and only
+        # its reason is counted.
+        player = self.players.find(player_conn)
+        if (player is not None and player.session is not None and self.resume_grace > 0
+                and reason in RESUMABLE_REASONS and not isinstance(player_conn, DetachedConnection)):
+            self.detach(player, reason)
+            return
+
+        player = self.players.remove(player_conn)
+        if player is not None:
+            name = player.name
+            if player.resume_timer is not None:
+                player.resume_timer.cancel()
+                player.resume_timer = None
+            metrics.players_active.dec()
+            metrics.disconnects.labels(reason).inc()
+
+            try:
+                if reason == "slow_consumer":
+                    # Its writer may be stuck on a peer that stopped reading,
+                    # and what is queued would never get there anyway
+                    player_conn.abort()
+                else:
+                    player_conn.close()
+            except (socket.error, OSError):
+                pass
+
+            # Log disconnect and notify remaining players
+            self.log(f"'{name}' has disconnected.")
+            self.broadcast(CONTROL, {"event": "player_left", "username": name, "text": f"'{name}' has left the chat."})
+
+            # Re-check whether the game can be started (needs file + QA + at least 2 players);
+            # stops the game when too few players are left
+            self.check_start_conditions()
+
+            # If remaining players have all answered, move on automatically
+            if self.waiting_for_answers and self.players and self.players.all_answered():
+                self.evaluate_answers_and_next_question()
+
+        if not self.players:
+            # Also after a connection that never made it into the registry
+            self.emit("all_players_left", None)
+
+    def send_scoreboards(self, final=False):
+        # Instead of the whole board, every player gets the top of it plus
+        # their own rank, so the bytes sent per round grow linearly with the
+        # number of players
+        board = {
+            "final": final,
+            "top": [list(entry) for entry in self.ranking.top(self.scoreboard_size)],
+            "players": len(self.ranking),
+        }
+        self.log(scoreboard_text(board))
+
+        template = MessageTemplate(SCOREBOARD, board)
+        for player in self.players.players():
+            data = template.encode({"rank": self.ranking.rank(player.name), "score": self.ranking.score(player.name)})
+            self.send_to_player(player.name, SCOREBOARD, data=data)
+
+    def set_qa_number(self, qa_input):
+        # Read and validate the number of questions to ask in the game
+        qa_input = str(qa_input).strip()
+        number = None
+
+        if not qa_input:
+            self.log("Error: Please enter a QA number.")
+        else:
+            try:
+                number = int(qa_input)
+
+                # QA number must be positive
+                if number <= 0:
+                    self.log("Error: QA number must be a positive integer (greater than 0).")
+                    number = None
+                else:
+                    self.log(f"Success: QA number set to {number}.")
+
+            except ValueError:
+                self.log("Error: QA number must be a valid integer.")
+
+        self.actor.call(self.on_qa_number, number)
+
+    def on_qa_number(self, number):
+        # number is None when the input was invalid
+        self.qa_valid = number is not None
+        if number is not None:
+            self.question_number = number
+
+        # Update Start Game button visibility
+        self.check_start_conditions()
+
+    def load_questions(self, file_name):
+        # Read question file and parse it into self.questions list; compiled
+        # files are memory-mapped and decoded one question at a time instead.
+        # The file is parsed on the calling thread, then the game thread
+        # replaces the old questions as a whole: right away when no game is
+        # running, otherwise before the next question.
+        if not file_name:
+            self.log("Error: Please enter a file name.")
+            self.actor.call(self.reject_questions)
+            return
+
+        try:
+            loaded = self.question_bank.load(file_name)
+
+            # Malformed blocks are skipped, tell where they are
+            for number, problem in loaded.problems[:MAX_REPORTED_PROBLEMS]:
+                self.log(f"Warning: '{file_name}' line {number}: {problem}, question skipped.")
+            if len(loaded.problems) > MAX_REPORTED_PROBLEMS:
+                self.log(f"Warning: {len(loaded.problems) - MAX_REPORTED_PROBLEMS} more problems in '{file_name}'.")
+
+            # Validate that at least one question was parsed successfully
+            if not loaded.questions:
+                self.log(f"Error: No questions found or file format is incorrect.")
+                self.actor.call(self.reject_questions)
+            else:
+                self.log(f"Success: File '{file_name}' read successfully.")
+                self.actor.call(self.accept_questions, loaded)
+
+        except FileNotFoundError:
+            # File does not exist in the current working directory
+            self.log(f"Error: File '{file_name}' not found in the current directory.")
+            self.actor.call(self.reject_questions)
+
+        except Exception as e:
+            # Any other parsing/IO error
+            self.log(f"Error: Could not process file '{file_name}'. Reason: {e}")
+            self.actor.call(self.reject_questions)
+
+    def accept_questions(self, loaded):
+        if self.game_running:
+            if loaded.source != self.question_source:
+                self.pending_questions = loaded
+                self.log("The new questions are asked from the next question on.")
+        else:
+            self.use_questions(loaded)
+
+        # Update Start Game button visibility
+        self.check_start_conditions()
+
+    def reject_questions(self):
+        if self.game_running:
+            # A bad file must not end a running game
+            self.log("The game goes on with the current questions.")
+        else:
+            self.questions = []
+            self.question_source = None
+            self.pending_questions = None
+            self.file_found = False
+
+        # Update Start Game button visibility
+        self.check_start_conditions()
+
+    def use_questions(self, loaded):
+        # Game thread, while no question is being asked
+        self.questions = loaded.questions
+        self.question_source = loaded.source
+        self.pending_questions = None
+        self.file_found = True
+
+    def swap_questions(self):
+        # Game thread, between rounds
+        if self.watch_questions and self.pending_questions is None and self.question_source is not None:
+            latest = self.question_bank.latest(self.question_source[0])
+            if latest is not None and latest.source != self.question_source and latest.questions:
+                self.pending_questions = latest
+
+        if self.pending_questions is not None:
+            self.use_questions(self.pending_questions)
+            self.log(f"Questions reloaded: now asking from '{os.path.basename(self.question_source[0])}' "
+                     f"({len(self.questions)} questions).")
+
+    def start_listening(self, port_input):
+        # Validate the port, then start the TCP server
+        port_input = str(port_input).strip()
+
+        if not port_input:
+            self.log("Error: Please enter a port number")
+            return False
+
+        try:
+            port = int(port_input)
+
+            # The transport binds to all interfaces and starts accepting players
+            self.transport = TRANSPORTS[self.transport_mode](self, **self.transport_options)
+            self.is_listening = True
+            self.transport.start(port)
+
+        except (socket.error, ValueError) as e:
+            # Port invalid or bind/listen failed
+            self.is_listening = False
+            self.log("Could not start server: " + str(e))
+            self.log("Try another port")
+            return False
+
+        self.emit("listening", True)
+
+        # Update Start Game button visibility
+        self.actor.call(self.check_start_conditions)
+
+        # Display IP + port info
+        local_ip = get_local_ip()
+        self.log(f"--- Server listening on port {self.transport.port} with {local_ip} ({self.transport.name} transport) ---")
+        return True
+
+    def serve_room(self):
+        # Used by the room manager: players arrive through its shared
+        # transport, so this engine only needs to accept them
+        self.is_listening = True
+
+    def stop_listening(self, wait=True):
+        # wait=False only asks the game thread to disconnect the players, for
+        # rooms that are closed while their manager holds its lock
+        if self.is_listening:
+            # Stop accepting new connections and disconnect all players
+            self.is_listening = False
+            self.actor.call(self.on_stop_listening)
+
+            if wait and not self.actor.wait_idle(STOP_TIMEOUT):
+                self.log("Error: The game did not stop in time.")
+
+            # Close the listening socket once the players are gone
+            if self.transport is not None:
+                self.transport.stop()
+
+            self.emit("listening", False)
+            self.log("--- Server stopped ---")
+
+    def on_stop_listening(self):
+        was_running = self.game_running
+        self.cancel_round_timer()
+        self.game_running = False
+        self.waiting_for_answers = False
+        players = self.players.clear()
+        metrics.players_active.dec(len(players))
+        metrics.disconnects.labels("server").inc(len(players))
+        if was_running:
+            self.emit_game_finished()
+            self.emit("game_running", False)
+
+        for player in players:
+            if player.resume_timer is not None:
+                player.resume_timer.cancel()
+                player.resume_timer = None
+            try:
+                player.conn.close()
+            except (socket.error, OSError):
+                pass
+
+            self.log(f"'{player.name}' has disconnected.")
@@ -0,0 +1,96 @@
+import collections
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+
+# Where the server log goes besides stdout.
+#
+# EventLog keeps the most recent lines in a ring buffer, so a server that
+# runs for days holds a fixed number of lines in memory. The Tk window
+# subscribes it to the engine and picks up whatever is new once per frame
+# (see lines_since), instead of touching the listbox for every line.
+#
+# LogFile writes the full log to a rotating file. Game threads only put the
+# line and the time into a queue; a QueueListener thread turns it into a
+# log record, formats it and writes it, so neither building records nor a
+# slow disk holds up a game.
+
+# Lines kept for the server window
+LOG_LINES = 5000
+
+# Size of one log file before it is rotated, and rotated files kept
+LOG_FILE_BYTES = 10 * 1024 * 1024
+LOG_FILE_BACKUPS = 5
+
+
+def log_lines(message):
+    # A log message as the lines worth showing
+    return [line for line in message.splitlines() if line.strip()]
+
+
+class EventLog:
+    def __init__(self, max_lines=LOG_LINES):
+        self.lock = threading.Lock()
+        self.lines = collections.deque(maxlen=max_lines)
+        # Lines added since the start, including the ones the ring dropped
+        self.sequence = 0
+
+    def __call__(self, item):
+        # Engine subscriber
+        event, data = item
+        if event == "log":
+            self.add(data)
+
+    def add(self, message):
+        lines = log_lines(message)
+        with self.lock:
+            self.lines.extend(lines)
+            self.sequence += len(lines)
+
+    def lines_since(self, sequence):
+        # (new sequence, lines added after sequence that are still kept)
+        with self.lock:
+            new = min(self.sequence - sequence, len(self.lines))
+            lines = [self.lines[i] for i in range(len(self.lines) - new, len(self.lines))]
+            return self.sequence, lines
+
+
+# Builds the log records on the listener thread from (time, line) tuples
+class LineListener(logging.handlers.QueueListener):
+    def prepare(self, item):
+        created, line = item
+        record = logging.LogRecord("quiz", logging.INFO, "", 0, line, None, None)
+        record.created = created
+        record.msecs = (created - int(created)) * 1000
+        return record
+
+
+class LogFile:
+    def __init__(self, path, max_bytes=LOG_FILE_BYTES, backups=LOG_FILE_BACKUPS):
+        # Raises OSError when the file cannot be opened
+        self.path = path
+        self.handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups,
+                                                            encoding="utf-8")
+        self.handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+
+        self.queue = queue.SimpleQueue()
+        self.listener = LineListener(self.queue, self.handler)
+        self.listener.start()
+
+    def __call__(self, item):
+        # Engine subscriber
+        event, data = item
+        if event == "log":
+            self.write(data)
+
+    def write(self, message):
+        now = time.time()
+        for line in log_lines(message):
+            self.queue.put((now, line))
+
+    def close(self):
+        # Writes what is queued, then closes the file
+        self.listener.stop()
+        self.handler.close()
@@ -0,0 +1,358 @@
+import argparse
+import queue
+import signal
+import sqlite3
+import sys
+import time
+
+from quiz.engine import QUESTION_PAUSE, QUESTION_TIME, SCOREBOARD_SIZE, GameEngine
+from quiz.eventlog import LOG_FILE_BACKUPS, LOG_FILE_BYTES, LogFile
+from quiz.history import HistoryStore
+from quiz.metrics import MetricsReporter, MetricsServer
+from quiz.protocol import MAX_CLIENT_FRAME_SIZE
+from quiz.ratelimit import BYTE_RATE, FLOOD_LIMIT, MESSAGE_BURST, MESSAGE_RATE
+from quiz.rooms import MAX_ROOMS, RoomManager
+from quiz.sessions import RESUME_GRACE
+from quiz.supervisor import Supervisor
+from quiz.transport import (
+    COALESCE_SLOW_CONSUMER, HANDSHAKE_TIMEOUT, HEARTBEAT_INTERVAL, HEARTBEAT_TIMEOUT, LISTEN_BACKLOG, MAX_HANDSHAKES,
+    SEND_QUEUE_BYTES, SLOW_CONSUMER_POLICIES, TCP_KEEPALIVE, TRANSPORTS,
+)
+
+# Headless quiz server: the same GameEngine as the Tk window, configured from
+# the command line and logging to stdout. Needs neither X11 nor tkinter.
+#
+#   python -m quiz.headless --port 5000 --questions quiz_qa.txt --qa 5 --auto-start 3
+#
+# With --rooms, players join named rooms that each run their own game:
+#   python -m quiz.headless --port 5000 --questions quiz_qa.txt --qa 5 --auto-start 3 --rooms --room finals:finals.txt:10
+#
+# --workers N runs the rooms in N worker processes sharing the port, see quiz/supervisor.py.
+#
+# --metrics-port serves the counters of quiz/metrics.py to Prometheus on
+# 127.0.0.1 (worker N of --workers on the port plus N), --metrics-interval
+# logs them every few seconds:
+#   python -m quiz.headless --port 5000 ... --metrics-port 9100 --metrics-interval 60
+#
+# --log-file keeps the full log in rotating files (see quiz/eventlog.py), in
+# the Tk window as well; worker N of --workers writes to FILE.N.
+#
+# --history records games, answers and final standings in an SQLite
+# database (see quiz/history.py), shared by all workers of --workers:
+#   python -m quiz.headless --port 5000 ... --history history.db
+#   python -m quiz.history history.db --top 10 --days 7
+#
+# Arguments can also be read from a file, one per line: python -m quiz.headless @server.args
+
+
+def build_parser(description="Headless multiplayer quiz server"):
+    parser = argparse.ArgumentParser(description=description, fromfile_prefix_chars="@")
+    parser.add_argument("--transport", choices=sorted(TRANSPORTS), default="threaded",
+                        help="networking core: one thread per player, or a single asyncio event loop")
+    parser.add_argument("--send-queue-kb", type=int, default=SEND_QUEUE_BYTES // 1024, metavar="KB",
+                        help="outbound bytes a player may have pending before the slow-consumer policy applies")
+    parser.add_argument("--slow-consumer", choices=SLOW_CONSUMER_POLICIES, default=COALESCE_SLOW_CONSUMER,
+                        help="coalesce pending scoreboards before dropping a lagging player, or drop it at once")
+    parser.add_argument("--backlog", type=int, default=LISTEN_BACKLOG, metavar="N",
+                        help="connections the OS queues for the server before it accepts them")
+    parser.add_argument("--handshake-timeout", type=float, default=HANDSHAKE_TIMEOUT, metavar="SECONDS",
+                        help="time a new connection has to send its hello")
+    parser.add_argument("--max-handshakes", type=int, default=MAX_HANDSHAKES, metavar="N",
+                        help="new connections whose hello is read at once; the others wait in the backlog")
+    parser.add_argument("--max-frame", type=int, default=MAX_CLIENT_FRAME_SIZE, metavar="BYTES",
+                        help="largest message a player may send; a bigger one closes the connection")
+    parser.add_argument("--message-rate", type=float, default=MESSAGE_RATE, metavar="N",
+                        help="messages per second a player may send; more are dropped (0: no limit)")
+    parser.add_argument("--message-burst", type=int, default=MESSAGE_BURST, metavar="N",
+                        help="messages a player may send at once before --message-rate applies")
+    parser.add_argument("--byte-rate-kb", type=int, default=BYTE_RATE // 1024, metavar="KB",
+                        help="KB per second a player may send before their connection is slowed down (0: no limit)")
+    parser.add_argument("--flood-limit", type=int, default=FLOOD_LIMIT, metavar="N",
+                        help="disconnect a player once this many of their messages were dropped (0: never)")
+    parser.add_argument("--heartbeat-interval", type=float, default=HEARTBEAT_INTERVAL, metavar="SECONDS",
+                        help="ping a player's connection after this much silence (0: no heartbeats)")
+    parser.add_argument("--heartbeat-timeout", type=float, default=HEARTBEAT_TIMEOUT, metavar="SECONDS",
+                        help="drop a player's connection after this much silence")
+    parser.add_argument("--tcp-keepalive", type=float, default=TCP_KEEPALIVE, metavar="SECONDS",
+                        help="let the OS probe connections idle for this long as well (0: off)")
+    parser.add_argument("--scoreboard-top", type=int, default=SCOREBOARD_SIZE, metavar="N",
+                        help="players listed on the scoreboard sent after each question, besides the player's own rank")
+    parser.add_argument("--question-time", type=float, default=QUESTION_TIME, metavar="SECONDS",
+                        help="time to answer a question before it is evaluated anyway (0: wait for every player)")
+    parser.add_argument("--question-pause", type=float, default=QUESTION_PAUSE, metavar="SECONDS",
+                        help="pause between the scoreboard and the next question")
+    parser.add_argument("--resume-grace", type=float, default=RESUME_GRACE, metavar="SECONDS",
+                        help="time a player whose connection broke may reconnect and keep their place (0: never)")
+    parser.add_argument("--port", type=int, help="TCP port to listen on")
+    parser.add_argument("--questions", metavar="FILE", help="question file in the quiz_qa.txt format")
+    parser.add_argument("--qa", type=int, metavar="N", help="number of questions asked per game")
+    parser.add_argument("--watch-questions", action="store_true",
+                        help="use a question file's new version from the next question on when it changes on disk")
+    parser.add_argument("--auto-start", type=int, default=0, metavar="N",
+                        help="start a game as soon as N players are connected (headless only, minimum 2)")
+    parser.add_argument("--games", type=int, default=0, metavar="N",
+                        help="exit after N finished games (headless only, default: run until interrupted)")
+    parser.add_argument("--rooms", action="store_true",
+                        help="host a separate game in every room players name (headless only)")
+    parser.add_argument("--room", action="append", default=[], metavar="NAME[:FILE][:QA]",
+                        help="a room that is always open, optionally with its own question file and QA number; implies --rooms")
+    parser.add_argument("--max-rooms", type=int, default=MAX_ROOMS, metavar="N",
+                        help="rooms that may be open at the same time (per worker)")
+    parser.add_argument("--workers", type=int, default=0, metavar="N",
+                        help="run the rooms in N worker processes sharing the port (headless only, implies --rooms)")
+    parser.add_argument("--log-file", metavar="FILE",
+                        help="also write the log to FILE, rotated every --log-file-mb megabytes")
+    parser.add_argument("--log-file-mb", type=int, default=LOG_FILE_BYTES // (1024 * 1024), metavar="MB")
+    parser.add_argument("--log-file-backups", type=int, default=LOG_FILE_BACKUPS, metavar="N",
+                        help="rotated log files kept besides the current one")
+    parser.add_argument("--history", metavar="FILE",
+                        help="record games, answers and final standings in the SQLite database FILE")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="serve metrics in the Prometheus text format on this local port (headless only)")
+    parser.add_argument("--metrics-interval", type=float, default=0, metavar="SECONDS",
+                        help="log a metrics snapshot every SECONDS (headless only, default: never)")
+    return parser
+
+
+def parse_room(spec):
+    # "name", "name:file", "name:qa" or "name:file:qa" -> (name, file, qa)
+    parts = spec.split(":")
+    name = parts.pop(0).strip()
+    qa = parts.pop() if parts and parts[-1].strip().isdigit() else None
+    return name, ":".join(parts) or None, qa
+
+
+def transport_options_from_args(args):
+    return {
+        "send_queue_bytes": args.send_queue_kb * 1024,
+        "slow_consumer": args.slow_consumer,
+        "heartbeat_interval": args.heartbeat_interval,
+        "heartbeat_timeout": args.heartbeat_timeout,
+        "keepalive": args.tcp_keepalive,
+        "backlog": args.backlog,
+        "handshake_timeout": args.handshake_timeout,
+        "max_handshakes": args.max_handshakes,
+        "max_frame_size": args.max_frame,
+        "message_rate": args.message_rate,
+        "message_burst": args.message_burst,
+        "byte_rate": args.byte_rate_kb * 1024,
+        "flood_limit": args.flood_limit,
+    }
+
+
+def engine_options_from_args(args):
+    return {
+        "scoreboard_size": args.scoreboard_top,
+        "question_time": args.question_time,
+        "question_pause": args.question_pause,
+        "watch_questions": args.watch_questions,
+        "resume_grace": args.resume_grace,
+    }
+
+
+def log_file_from_args(args, engine, suffix=""):
+    # Subscribes a LogFile for --log-file to the engine and returns it, or
+    # None; the error goes to stderr
+    if not args.log_file:
+        return None
+    path = args.log_file + suffix
+    try:
+        log_file = LogFile(path, args.log_file_mb * 1024 * 1024, args.log_file_backups)
+    except OSError as e:
+        print(f"Error: Could not open log file '{path}'. Reason: {e}", file=sys.stderr)
+        return None
+    engine.subscribe(log_file)
+    return log_file
+
+
+def history_from_args(args, engine):
+    # Subscribes a HistoryStore for --history to the engine and returns it,
+    # or None; the error goes to stderr
+    if not args.history:
+        return None
+    try:
+        history = HistoryStore(args.history)
+    except sqlite3.Error as e:
+        print(f"Error: Could not open history database '{args.history}'. Reason: {e}", file=sys.stderr)
+        return None
+    engine.subscribe(history)
+    return history
+
+
+def engine_from_args(args):
+    return GameEngine(transport_mode=args.transport, transport_options=transport_options_from_args(args),
+                      **engine_options_from_args(args))
+
+
+def manager_from_args(args, **transport_options):
+    # Extra keyword arguments are added to the transport options
+    transport_options = dict(transport_options_from_args(args), **transport_options)
+    return RoomManager(transport_mode=args.transport, transport_options=transport_options,
+                       engine_options=engine_options_from_args(args), auto_start=args.auto_start,
+                       max_rooms=args.max_rooms)
+
+
+# Event stream observer driving the headless server from the main thread
+class HeadlessRunner:
+    def __init__(self, engine, auto_start=0, games=0, out=sys.stdout, prefix=""):
+        self.engine = engine
+        # Put in front of every log line, e.g. the worker number
+        self.prefix = prefix
+        self.auto_start = max(auto_start, 2) if auto_start else 0
+        self.games = games
+        self.games_finished = 0
+        self.out = out
+        self.events = queue.Queue()
+        self.is_running = True
+        engine.subscribe(self.events.put)
+
+    def stop(self, *args):
+        self.is_running = False
+
+    def run(self):
+        while self.is_running:
+            try:
+                event, data = self.events.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            self.handle_event(event, data)
+
+    def handle_event(self, event, data):
+        if event == "log":
+            timestamp = time.strftime("%H:%M:%S")
+            for line in data.splitlines() or [data]:
+                if line.strip():
+                    print(f"{timestamp} {self.prefix}{line}", file=self.out, flush=True)
+
+        elif event == "start_conditions":
+            self.maybe_auto_start()
+
+        elif event == "game_running" and not data:
+            self.games_finished += 1
+            if self.games and self.games_finished >= self.games:
+                self.stop()
+            else:
+                # Players that are still connected go straight into the next game
+                self.maybe_auto_start()
+
+    def maybe_auto_start(self):
+        engine = self.engine
+        if (self.auto_start and not engine.game_running and engine.can_start()
+                and len(engine.players) >= self.auto_start):
+            engine.start_game()
+
+
+def run_headless(args):
+    if args.port is None:
+        print("Error: --port is required in headless mode", file=sys.stderr)
+        return 2
+
+    if args.workers > 0:
+        supervisor = Supervisor(args.workers, args.port, lambda worker: run_worker(args, worker), games=args.games,
+                                backlog=args.backlog)
+        return supervisor.run()
+
+    if args.rooms or args.room:
+        # Every room auto-starts on its own, the runner only counts games
+        engine = manager_from_args(args)
+        runner = HeadlessRunner(engine, games=args.games)
+    else:
+        engine = engine_from_args(args)
+        runner = HeadlessRunner(engine, auto_start=args.auto_start, games=args.games)
+
+    log_file = log_file_from_args(args, engine)
+    history = history_from_args(args, engine)
+    configure(engine, args)
+    return serve(engine, runner, args.port, metrics_port=args.metrics_port, metrics_interval=args.metrics_interval,
+                 log_file=log_file, history=history)
+
+
+def run_worker(args, worker):
+    # Runs in a worker process forked by the supervisor
+    engine = manager_from_args(args, reuse_port=worker.listen_socket is None,
+                               listen_socket=worker.listen_socket, hand_off=worker.hand_off)
+    # The supervisor counts games across workers and decides when to stop
+    runner = HeadlessRunner(engine, prefix=f"[worker {worker.index}] ")
+    log_file = log_file_from_args(args, engine, suffix=f".{worker.index}")
+    history = history_from_args(args, engine)
+    configure(engine, args, owns_room=worker.owns)
+
+    def stats():
+        return {"rooms": len(engine.rooms), "players": len(engine.player_rooms), "games": runner.games_finished}
+
+    metrics_port = args.metrics_port + worker.index if args.metrics_port else None
+    return serve(engine, runner, worker.port, on_listening=lambda: worker.start(engine.transport, stats),
+                 metrics_port=metrics_port, metrics_interval=args.metrics_interval, log_file=log_file,
+                 history=history)
+
+
+def configure(engine, args, owns_room=None):
+    if args.questions:
+        engine.load_questions(args.questions)
+    if args.qa is not None:
+        engine.set_qa_number(args.qa)
+    for spec in args.room:
+        name, questions_file, qa = parse_room(spec)
+        # With workers, every room is opened by the worker that owns it
+        if owns_room is None or owns_room(name):
+            engine.open_room(name, questions_file, qa, persistent=True)
+
+
+def serve(engine, runner, port, on_listening=None, metrics_port=None, metrics_interval=0, log_file=None,
+          history=None):
+    if not engine.start_listening(port):
+        # Print the bind error before exiting
+        while not runner.events.empty():
+            runner.handle_event(*runner.events.get())
+        if log_file is not None:
+            log_file.close()
+        if history is not None:
+            history.close()
+        return 1
+
+    if on_listening is not None:
+        on_listening()
+
+    metrics_server = None
+    if metrics_port is not None:
+        metrics_server = MetricsServer(metrics_port)
+        try:
+            metrics_server.start()
+            engine.log(f"Metrics served on http://127.0.0.1:{metrics_server.port}/metrics")
+        except OSError as e:
+            # The game runs without the endpoint
+            engine.log(f"Error: Could not serve metrics on port {metrics_port}. Reason: {e}")
+            metrics_server = None
+
+    reporter = None
+    if metrics_interval > 0:
+        reporter = MetricsReporter(metrics_interval, engine.log)
+        reporter.start()
+
+    signal.signal(signal.SIGINT, runner.stop)
+    signal.signal(signal.SIGTERM, runner.stop)
+    try:
+        runner.run()
+    finally:
+        if reporter is not None:
+            reporter.stop()
+        if metrics_server is not None:
+            metrics_server.stop()
+        engine.stop_listening()
+        while not runner.events.empty():
+            runner.handle_event(*runner.events.get())
+        if log_file is not None:
+            # Writes the lines still queued
+            log_file.close()
+        if history is not None:
+            # Writes the games still queued
+            history.close()
+    return 0
+
+
+def main(argv=None):
+    return run_headless(build_parser().parse_args(argv))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,291 @@
+import argparse
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+
+from quiz import metrics
+from quiz.protocol import ordinal
+
+# Game history in an SQLite database.
+#
+# HistoryStore subscribes to an engine (or a room manager) and records every
+# game, every round with each answer and the time it arrived, and the final
+# standings. The game thread only puts the event into a queue; one writer
+# thread takes whatever has piled up, up to batch_size events, and writes it
+# in a single transaction, so neither the disk nor a busy database ever
+# holds up a round.
+#
+# The database runs in WAL mode: leaderboard queries read a consistent
+# snapshot while the writer keeps going, and the worker processes of
+# --workers can share one file. Leaderboards:
+#   all-time    the totals table, updated with every finished game and
+#               indexed by score, so the top N is an index scan however
+#               many games were played
+#   per period  summed from the rankings of the games that finished in the
+#               period, through a covering index on the finish time
+#
+# A game stopped before its last question is finished with the rounds that
+# were played. Only a server that died mid-game leaves a games row with
+# finished and rounds NULL: an abandoned game, which has no rankings and so
+# never counts toward a leaderboard.
+#
+#   python -m quiz.history history.db --top 10 --days 7
+
+# Events written in one transaction at most
+HISTORY_BATCH = 500
+
+# Milliseconds a write waits for another process holding the database
+BUSY_TIMEOUT_MS = 5000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    id TEXT PRIMARY KEY,
+    room TEXT,
+    started REAL NOT NULL,
+    finished REAL,
+    questions INTEGER NOT NULL,
+    players INTEGER NOT NULL,
+    rounds INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS rounds (
+    game TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    asked REAL NOT NULL,
+    PRIMARY KEY (game, number)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS answers (
+    game TEXT NOT NULL,
+    round INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    player TEXT NOT NULL,
+    choice TEXT NOT NULL,
+    points INTEGER NOT NULL,
+    arrived REAL NOT NULL,
+    PRIMARY KEY (game, round, position)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS rankings (
+    game TEXT NOT NULL,
+    player TEXT NOT NULL,
+    rank INTEGER NOT NULL,
+    score INTEGER NOT NULL,
+    finished REAL NOT NULL,
+    PRIMARY KEY (game, player)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS rankings_finished ON rankings (finished, player, score, rank);
+
+CREATE TABLE IF NOT EXISTS totals (
+    player TEXT PRIMARY KEY,
+    score INTEGER NOT NULL,
+    games INTEGER NOT NULL,
+    wins INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS totals_score ON totals (score DESC, player);
+"""
+
+ALL_TIME_QUERY = """
+SELECT player, score, games, wins FROM totals
+ORDER BY score DESC, player LIMIT ?
+"""
+
+PERIOD_QUERY = """
+SELECT player, SUM(score) AS total, COUNT(*), SUM(rank = 1) FROM rankings
+WHERE finished >= ? AND finished < ?
+GROUP BY player ORDER BY total DESC, player LIMIT ?
+"""
+
+
+def connect(path):
+    db = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+    db.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    return db
+
+
+class HistoryStore:
+    def __init__(self, path, batch_size=HISTORY_BATCH):
+        # Raises sqlite3.Error when the database cannot be opened
+        self.path = path
+        self.batch_size = batch_size
+        self.db = connect(path)
+        try:
+            self.db.execute("PRAGMA journal_mode = WAL")
+            # Safe with WAL: a crash loses at most the last transactions, never the database
+            self.db.execute("PRAGMA synchronous = NORMAL")
+            self.db.executescript(SCHEMA)
+        except sqlite3.Error:
+            self.db.close()
+            raise
+
+        # Leaderboard queries get their own connection, opened on first use
+        self.reader = None
+        self.reader_lock = threading.Lock()
+
+        self.queue = queue.SimpleQueue()
+        self.writers = {
+            "game_started": self.write_game_started,
+            "round_finished": self.write_round,
+            "game_finished": self.write_game_finished,
+        }
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def __call__(self, item):
+        # Engine subscriber
+        if item[0] in self.writers:
+            self.queue.put(item)
+
+    def flush(self, timeout=None):
+        # Waits until everything queued so far is written
+        written = threading.Event()
+        self.queue.put(written)
+        return written.wait(timeout)
+
+    def close(self):
+        # Writes what is queued, then closes the database
+        self.queue.put(None)
+        self.thread.join()
+        self.db.close()
+        with self.reader_lock:
+            if self.reader is not None:
+                self.reader.close()
+                self.reader = None
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            events = [item for item in batch if isinstance(item, tuple)]
+            if events:
+                self.write(events)
+
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+            if any(item is None for item in batch):
+                return
+
+    def write(self, events):
+        try:
+            with self.db:
+                for event, data in events:
+                    self.writers[event](data)
+        except sqlite3.Error as e:
+            if len(events) > 1:
+                # One by one, so a bad event does not take the batch with it
+                for item in events:
+                    self.write([item])
+                return
+            # The game goes on without this event
+            metrics.history_errors.inc()
+            print(f"Error: Could not write the game history. Reason: {e}", file=sys.stderr)
+            return
+        metrics.history_writes.inc()
+        metrics.history_events.inc(len(events))
+
+    def write_game_started(self, data):
+        self.db.execute(
+            "INSERT INTO games (id, room, started, questions, players) VALUES (?, ?, ?, ?, ?)",
+            (data["game"], data.get("room"), data["started"], data["questions"], data["players"]))
+
+    def write_round(self, data):
+        game, number = data["game"], data["number"]
+        self.db.execute(
+            "INSERT INTO rounds (game, number, question, answer, asked) VALUES (?, ?, ?, ?, ?)",
+            (game, number, data["question"], data["answer"], data["asked"]))
+        self.db.executemany(
+            "INSERT INTO answers (game, round, position, player, choice, points, arrived) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(game, number, position, name, choice, points, arrived)
+             for position, (name, choice, points, arrived) in enumerate(data["answers"], 1)])
+
+    def write_game_finished(self, data):
+        game, finished = data["game"], data["finished"]
+        standings = data["standings"]
+        self.db.execute("UPDATE games SET finished = ?, rounds = ? WHERE id = ?", (finished, data["rounds"], game))
+        self.db.executemany(
+            "INSERT INTO rankings (game, player, rank, score, finished) VALUES (?, ?, ?, ?, ?)",
+            [(game, name, rank, score, finished) for rank, name, score in standings])
+        self.db.executemany(
+            "INSERT INTO totals (player, score, games, wins) VALUES (?, ?, 1, ?) "
+            "ON CONFLICT (player) DO UPDATE SET score = score + excluded.score, games = games + 1, "
+            "wins = wins + excluded.wins",
+            [(name, score, int(rank == 1)) for rank, name, score in standings])
+
+    def leaderboard(self, limit=10, since=None, until=None):
+        with self.reader_lock:
+            if self.reader is None:
+                self.reader = connect(self.path)
+            return leaderboard(self.reader, limit, since, until)
+
+
+def leaderboard(db, limit=10, since=None, until=None):
+    # [(rank, player, score, games, wins), ...] over every game, or over the
+    # games that finished from since up to until (time.time() values)
+    if since is None and until is None:
+        rows = db.execute(ALL_TIME_QUERY, (limit,)).fetchall()
+    else:
+        rows = db.execute(PERIOD_QUERY, (since or 0.0, until or float("inf"), limit)).fetchall()
+    return ranked(rows)
+
+
+def ranked(rows):
+    # Tie-aware ranks (1, 2, 2, 4) for rows sorted by score
+    entries = []
+    rank = 0
+    last_score = None
+    for player, score, games, wins in rows:
+        if score != last_score:
+            rank = len(entries) + 1
+            last_score = score
+        entries.append((rank, player, score, games, wins))
+    return entries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Leaderboard from the game history")
+    parser.add_argument("database", help="history database written with --history")
+    parser.add_argument("--top", type=int, default=10, metavar="N")
+    parser.add_argument("--days", type=float, metavar="N", help="only games that finished in the last N days")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.database):
+        print(f"Error: History database '{args.database}' not found.", file=sys.stderr)
+        return 1
+    # A plain reader: no schema changes, no writer thread
+    try:
+        db = connect(args.database)
+    except sqlite3.Error as e:
+        print(f"Error: Could not open history database '{args.database}'. Reason: {e}", file=sys.stderr)
+        return 1
+    since = time.time() - args.days * 86400 if args.days else None
+    started = time.perf_counter()
+    try:
+        entries = leaderboard(db, args.top, since=since)
+    except sqlite3.Error as e:
+        print(f"Error: Could not read history database '{args.database}'. Reason: {e}", file=sys.stderr)
+        return 1
+    finally:
+        db.close()
+    elapsed = time.perf_counter() - started
+
+    title = f"last {args.days:g} days" if args.days else "all time"
+    print(f"--- LEADERBOARD ({title}) ---")
+    for rank, player, score, games, wins in entries:
+        print(f"{ordinal(rank)} {player} : {score} Point in {games} games, {wins} won")
+    print(f"({elapsed * 1000:.1f} ms)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,374 @@
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+
+from quiz.protocol import (
+    ACK, CONTROL, ERROR, PING, QUESTION, RESULT, WELCOME, FrameDecoder, ProtocolError, encode_answer, encode_bye,
+    encode_hello, encode_pong,
+)
+
+# Headless load generator: thousands of simulated players on one asyncio
+# loop, speaking the same protocol as the Tk client.
+#
+#   python -m quiz.loadgen --port 5000 --players 1000 --duration 30 --think exp:0.5 --correct 0.7
+#
+# Start the server with --auto-start (and --question-pause 0 for clean
+# turnaround numbers, --message-rate 0 so bots answering faster than people
+# are not rate limited), e.g.
+#   python -m quiz.headless --port 5000 --questions quiz_qa.txt --qa 20 --auto-start 1000 --transport asyncio
+#
+# Every bot joins, waits a think time after each question and answers. Bots
+# learn the correct answers from the results, then answer correctly with
+# the --correct probability. With --churn a bot leaves after answering and
+# joins again --reconnect-delay seconds later.
+#
+# Latencies, as percentiles in milliseconds:
+#   question_spread  question received by a bot, behind the first bot of its
+#                    room; messages carry no server clock, so this is the
+#                    broadcast fan-out as the players see it
+#   answer_ack       answer sent -> "is received" ACK
+#   turnaround       last answer of a room sent -> next question received
+#                    (rounds that ran out of time are left out)
+#   join             connect -> WELCOME
+#
+# All bots share one process and one clock, so run it on the server's
+# machine over loopback and compare runs against each other.
+
+# Bytes read from a socket at once
+READ_SIZE = 65536
+
+
+def percentile(values, p):
+    # Nearest-rank percentile of an unsorted list, p in [0, 100]
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(p / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(values):
+    # Latency summary in milliseconds
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p90_ms": round(percentile(values, 90) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+        "max_ms": round(max(values) * 1000, 3) if values else 0.0,
+    }
+
+
+def think_time(spec):
+    # "fixed:S", "uniform:MIN,MAX" or "exp:MEAN" (seconds) -> function returning a delay
+    kind, _, values = spec.partition(":")
+    try:
+        numbers = [float(value) for value in values.split(",")] if values else []
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid think time '{spec}'")
+
+    if kind == "fixed" and len(numbers) == 1:
+        return lambda: numbers[0]
+    if kind == "uniform" and len(numbers) == 2:
+        return lambda: random.uniform(numbers[0], numbers[1])
+    if kind == "exp" and len(numbers) == 1 and numbers[0] > 0:
+        return lambda: random.expovariate(1.0 / numbers[0])
+    raise argparse.ArgumentTypeError(f"invalid think time '{spec}', use fixed:S, uniform:MIN,MAX or exp:MEAN")
+
+
+class LoadStats:
+    def __init__(self):
+        self.question_spread = []
+        self.answer_ack = []
+        self.turnaround = []
+        self.join = []
+        self.counters = dict.fromkeys(
+            ("joins", "rejected", "failed", "answers", "correct", "questions", "leaves", "disconnected"), 0)
+
+    def count(self, name, amount=1):
+        self.counters[name] += amount
+
+    def report(self):
+        return {
+            "question_spread": summarize(self.question_spread),
+            "answer_ack": summarize(self.answer_ack),
+            "turnaround": summarize(self.turnaround),
+            "join": summarize(self.join),
+            "counters": dict(self.counters),
+        }
+
+
+class RoomClock:
+    # What the bots of one room saw of the current question
+    def __init__(self):
+        self.key = None
+        self.first_seen = 0.0
+        self.last_answer = None
+        self.timed_out = False
+
+    def question_received(self, key, now, stats):
+        if key != self.key:
+            # First bot of the room to get this question
+            if self.last_answer is not None and not self.timed_out:
+                stats.turnaround.append(now - self.last_answer)
+            self.key = key
+            self.first_seen = now
+            self.last_answer = None
+            self.timed_out = False
+        stats.question_spread.append(now - self.first_seen)
+
+    def answer_sent(self, now):
+        self.last_answer = now
+
+    def game_over(self):
+        # The first question of the next game has no previous answer
+        self.key = None
+        self.last_answer = None
+
+
+class Bot:
+    def __init__(self, swarm, name, room):
+        self.swarm = swarm
+        self.name = name
+        self.room = room
+        self.clock = swarm.room_clock(room)
+        self.writer = None
+        self.question = None
+        self.answer_sent_at = None
+
+    async def run(self, start_delay):
+        swarm = self.swarm
+        await asyncio.sleep(start_delay)
+        while not swarm.is_done():
+            leave = await self.play()
+            if swarm.is_done():
+                break
+            await asyncio.sleep(swarm.reconnect_delay if leave else swarm.retry_delay)
+
+    async def play(self):
+        # One connection; returns True when the bot left on purpose (churn)
+        swarm = self.swarm
+        stats = swarm.stats
+        started = time.perf_counter()
+        try:
+            reader, self.writer = await asyncio.open_connection(swarm.host, swarm.port)
+            self.writer.write(encode_hello(self.name, self.room))
+            decoder = FrameDecoder()
+            messages = []
+            while not messages:
+                data = await reader.read(READ_SIZE)
+                if not data:
+                    raise ConnectionResetError("closed during handshake")
+                messages = decoder.feed(data)
+        except (ConnectionError, OSError, ProtocolError):
+            stats.count("failed")
+            self.close()
+            return False
+
+        msg_type, _ = messages[0]
+        if msg_type != WELCOME:
+            # e.g. "Game already started" while rejoining
+            stats.count("rejected" if msg_type == ERROR else "failed")
+            self.close()
+            return False
+        stats.join.append(time.perf_counter() - started)
+        stats.count("joins")
+
+        tasks = set()
+        try:
+            messages = messages[1:]
+            while not swarm.is_done():
+                now = time.perf_counter()
+                for msg_type, body in messages:
+                    leave = self.handle(msg_type, body, now, tasks)
+                    if leave:
+                        self.leave()
+                        stats.count("leaves")
+                        return True
+
+                data = await asyncio.wait_for(reader.read(READ_SIZE), max(0.01, swarm.remaining()))
+                if not data:
+                    stats.count("disconnected")
+                    return False
+                messages = decoder.feed(data)
+            self.leave()
+        except asyncio.TimeoutError:
+            # The run is over
+            self.leave()
+            return False
+        except (ConnectionError, OSError, ProtocolError):
+            stats.count("disconnected")
+            return False
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.close()
+
+    def handle(self, msg_type, body, now, tasks):
+        swarm = self.swarm
+        if msg_type == QUESTION:
+            swarm.stats.count("questions")
+            self.question = body
+            self.clock.question_received((body.get("number"), body.get("question")), now, swarm.stats)
+            task = asyncio.ensure_future(self.answer(body))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        elif msg_type == ACK and self.answer_sent_at is not None:
+            swarm.stats.answer_ack.append(now - self.answer_sent_at)
+            self.answer_sent_at = None
+            # Leave once the answer counted, so the round does not wait for this bot
+            return swarm.churn > 0 and random.random() < swarm.churn
+
+        elif msg_type == RESULT:
+            if "answer" in body and self.question is not None:
+                swarm.known_answers[self.question.get("question")] = body["answer"]
+            elif body.get("points"):
+                swarm.stats.count("correct")
+
+        elif msg_type == PING:
+            self.writer.write(encode_pong())
+
+        elif msg_type == CONTROL:
+            event = body.get("event")
+            if event == "time_up":
+                self.clock.timed_out = True
+            elif event == "game_over":
+                self.clock.game_over()
+        return False
+
+    async def answer(self, question):
+        swarm = self.swarm
+        await asyncio.sleep(swarm.think())
+        if self.writer is None or self.question is not question:
+            return
+
+        options = list(question.get("options", {})) or ["A"]
+        correct = swarm.known_answers.get(question.get("question"))
+        if correct in options and random.random() < swarm.correct_rate:
+            choice = correct
+        else:
+            wrong = [option for option in options if option != correct]
+            choice = random.choice(wrong or options)
+
+        self.answer_sent_at = time.perf_counter()
+        self.clock.answer_sent(self.answer_sent_at)
+        self.writer.write(encode_answer(choice, question.get("number")))
+        swarm.stats.count("answers")
+
+    def leave(self):
+        # Leaving for good, so the server frees the name instead of keeping
+        # the bot's place for a reconnect
+        self.writer.write(encode_bye())
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+class Swarm:
+    def __init__(self, host, port, players, rooms=0, duration=30.0, ramp=1.0, think=None, correct_rate=0.7,
+                 churn=0.0, reconnect_delay=1.0, retry_delay=1.0):
+        self.host = host
+        self.port = port
+        self.players = players
+        # 0: no room in the hello, the server's default game
+        self.rooms = rooms
+        self.duration = duration
+        # Seconds over which the joins are spread
+        self.ramp = ramp
+        self.think = think or think_time("fixed:0")
+        self.correct_rate = correct_rate
+        # Probability that a bot leaves after an answer
+        self.churn = churn
+        self.reconnect_delay = reconnect_delay
+        # Wait before joining again after a rejected or failed join
+        self.retry_delay = retry_delay
+
+        self.stats = LoadStats()
+        # Question text -> correct choice, learned from the results
+        self.known_answers = {}
+        self.room_clocks = {}
+        self.stop_at = 0.0
+
+    def room_clock(self, room):
+        if room not in self.room_clocks:
+            self.room_clocks[room] = RoomClock()
+        return self.room_clocks[room]
+
+    def remaining(self):
+        return self.stop_at - time.monotonic()
+
+    def is_done(self):
+        return time.monotonic() >= self.stop_at
+
+    async def run(self):
+        self.stop_at = time.monotonic() + self.duration
+        bots = [Bot(self, f"bot{i}", f"room{i % self.rooms}" if self.rooms else None) for i in range(self.players)]
+        await asyncio.gather(*(bot.run(self.ramp * i / max(1, self.players)) for i, bot in enumerate(bots)))
+        return self.stats.report()
+
+
+def raise_open_file_limit():
+    # Every bot needs a socket; the default soft limit is often 1024
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        except (ValueError, OSError):
+            pass
+
+
+def print_report(report, out=sys.stdout):
+    for name in ("question_spread", "answer_ack", "turnaround", "join"):
+        fields = "  ".join(f"{key}={value}" for key, value in report[name].items())
+        print(f"{name:<16} {fields}", file=out)
+    print("counters         " + "  ".join(f"{key}={value}" for key, value in report["counters"].items()), file=out)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Simulated players for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--players", type=int, default=100)
+    parser.add_argument("--rooms", type=int, default=0, metavar="N",
+                        help="spread the players over rooms room0 .. roomN-1 (server needs --rooms)")
+    parser.add_argument("--duration", type=float, default=30.0, metavar="SECONDS")
+    parser.add_argument("--ramp", type=float, default=1.0, metavar="SECONDS", help="spread the joins over this time")
+    parser.add_argument("--think", type=think_time, default="uniform:0.05,0.5",
+                        help="delay before answering: fixed:S, uniform:MIN,MAX or exp:MEAN")
+    parser.add_argument("--correct", type=float, default=0.7, metavar="RATE",
+                        help="probability of answering a known question correctly")
+    parser.add_argument("--churn", type=float, default=0.0, metavar="RATE",
+                        help="probability that a bot leaves after an answer and joins again")
+    parser.add_argument("--reconnect-delay", type=float, default=1.0, metavar="SECONDS")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    return parser
+
+
+def swarm_from_args(args):
+    return Swarm(args.host, args.port, args.players, rooms=args.rooms, duration=args.duration, ramp=args.ramp,
+                 think=args.think, correct_rate=args.correct, churn=args.churn,
+                 reconnect_delay=args.reconnect_delay)
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    raise_open_file_limit()
+    report = asyncio.run(swarm_from_args(args).run())
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
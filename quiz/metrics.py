@@ -0,0 +1,349 @@
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from quiz.scheduler import shared_scheduler
+
+# Counters, gauges and latency histograms of the server process.
+#
+# The instrumentation is always on: the transports and the game engines
+# update the metrics below directly, an update is one lock and an addition,
+# so it is cheap enough for every message read and every broadcast.
+# Metrics with labels hand out one child per label value; callers keep the
+# child, e.g. metrics.disconnects.labels("closed").inc().
+#
+# Two ways to read them, both optional:
+#   MetricsServer    a local HTTP endpoint in the Prometheus text format,
+#                    e.g. curl http://127.0.0.1:9100/metrics
+#   MetricsReporter  a log line every few seconds with what changed since
+#                    the previous one
+#
+# Every process has its own registry; with worker processes every worker
+# serves its own endpoint (see quiz/headless.py).
+
+# Upper bounds of the histogram buckets, in seconds
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                   5.0, 10.0)
+ANSWER_BUCKETS = (0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 15.0, 20.0, 30.0, 45.0, 60.0, 120.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{escape_label(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help_text, label_names=(), label_values=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.label_values = tuple(label_values)
+        self.lock = threading.Lock()
+        # Label values -> child metric, only for metrics declared with labels
+        self.children = {}
+
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            values = tuple(str(value) for value in values)
+            with self.lock:
+                child = self.children.get(values)
+                if child is None:
+                    child = self.children[values] = self.new_child(values)
+        return child
+
+    def new_child(self, values):
+        return type(self)(self.name, self.help_text, self.label_names, values)
+
+    def series(self):
+        # The metrics holding values: the children, or the metric itself
+        if self.label_names and not self.label_values:
+            return list(self.children.values())
+        return [self]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_text, label_names=(), label_values=()):
+        super().__init__(name, help_text, label_names, label_values)
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def samples(self):
+        # [(name, label names, label values, value)]
+        return [(self.name, self.label_names, self.label_values, self.value)]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount=1):
+        with self.lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, label_names=(), label_values=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, label_names, label_values)
+        self.buckets = tuple(buckets)
+        # One count per bucket plus +Inf, not cumulative
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def new_child(self, values):
+        return Histogram(self.name, self.help_text, self.label_names, values, self.buckets)
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def samples(self):
+        with self.lock:
+            counts = list(self.counts)
+            total, count = self.sum, self.count
+
+        names = self.label_names + ("le",)
+        samples = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            samples.append((self.name + "_bucket", names, self.label_values + (format_value(float(bound)),),
+                            cumulative))
+        samples.append((self.name + "_sum", self.label_names, self.label_values, total))
+        samples.append((self.name + "_count", self.label_names, self.label_values, count))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+
+    def register(self, metric):
+        with self.lock:
+            if metric.name in self.metrics:
+                raise ValueError(f"Metric '{metric.name}' is already registered")
+            self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help_text, label_names=()):
+        return self.register(Counter(name, help_text, label_names))
+
+    def gauge(self, name, help_text, label_names=()):
+        return self.register(Gauge(name, help_text, label_names))
+
+    def histogram(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help_text, label_names, buckets=buckets))
+
+    def render(self):
+        # Everything in the Prometheus text exposition format
+        with self.lock:
+            metrics = list(self.metrics.values())
+
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for series in metric.series():
+                for name, names, values, value in series.samples():
+                    lines.append(f"{name}{format_labels(names, values)} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        # {(name, label values): value}, (count, sum) for histograms
+        with self.lock:
+            metrics = list(self.metrics.values())
+
+        values = {}
+        for metric in metrics:
+            for series in metric.series():
+                if isinstance(series, Histogram):
+                    with series.lock:
+                        values[(series.name, series.label_values)] = (series.count, series.sum)
+                else:
+                    values[(series.name, series.label_values)] = series.value
+        return values
+
+
+registry = Registry()
+
+# The server's metrics
+connections_accepted = registry.counter(
+    "quiz_connections_accepted_total", "Connections that completed the handshake and joined a game.")
+connections_rejected = registry.counter(
+    "quiz_connections_rejected_total", "Connections turned away during the handshake.", ("reason",))
+handshakes_pending = registry.gauge(
+    "quiz_handshakes_pending", "Connections accepted whose hello is still being read.")
+players_active = registry.gauge(
+    "quiz_players_active", "Players connected to a game.")
+messages_received = registry.counter(
+    "quiz_messages_received_total", "Messages decoded from players after their hello.")
+messages_sent = registry.counter(
+    "quiz_messages_sent_total", "Messages handed to the players' outbound queues.")
+socket_writes = registry.counter(
+    "quiz_socket_writes_total", "Writes to player sockets; each carries every message queued when it was made.")
+answers = registry.counter(
+    "quiz_answers_total", "Answers accepted, at most one per player and question.")
+answer_window = registry.histogram(
+    "quiz_answer_window_seconds", "Time from a question's broadcast to the last answer that counted for it.",
+    buckets=ANSWER_BUCKETS)
+evaluation_duration = registry.histogram(
+    "quiz_evaluation_seconds", "Time spent scoring a round and sending the results and scoreboards.")
+broadcast_duration = registry.histogram(
+    "quiz_broadcast_seconds", "Time spent handing one broadcast to every player's queue.")
+send_failures = registry.counter(
+    "quiz_send_failures_total", "Messages that could not be queued for a player.", ("reason",))
+disconnects = registry.counter(
+    "quiz_disconnects_total", "Players removed from a game.", ("reason",))
+pings_sent = registry.counter(
+    "quiz_pings_sent_total", "Heartbeat pings sent to idle connections.")
+heartbeat_timeouts = registry.counter(
+    "quiz_heartbeat_timeouts_total", "Connections closed because the peer stopped answering pings.")
+messages_dropped = registry.counter(
+    "quiz_messages_dropped_total", "Messages from players dropped by the inbound message rate limit.")
+reads_throttled = registry.counter(
+    "quiz_reads_throttled_total", "Reads from players paused by the inbound byte rate limit.")
+history_writes = registry.counter(
+    "quiz_history_writes_total", "Transactions that wrote a batch of game history events.")
+history_events = registry.counter(
+    "quiz_history_events_total", "Game history events written to the database.")
+history_errors = registry.counter(
+    "quiz_history_errors_total", "Game history events lost because the database could not be written.")
+sessions_detached = registry.counter(
+    "quiz_sessions_detached_total", "Players kept in their game after their connection broke.")
+sessions_resumed = registry.counter(
+    "quiz_sessions_resumed_total", "Players that took their place back with a new connection.")
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+
+        body = self.server.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes would flood the server log
+        pass
+
+
+# Local HTTP endpoint serving the registry
+class MetricsServer:
+    def __init__(self, port, host="127.0.0.1", registry=registry):
+        self.host = host
+        self.requested_port = port
+        self.registry = registry
+        self.server = None
+        self.port = None
+
+    def start(self):
+        # Raises OSError when the port is taken
+        self.server = ThreadingHTTPServer((self.host, self.requested_port), MetricsHandler)
+        self.server.daemon_threads = True
+        self.server.registry = self.registry
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+def short_name(name):
+    name = name[len("quiz_"):] if name.startswith("quiz_") else name
+    return name[:-len("_total")] if name.endswith("_total") else name
+
+
+# Logs what changed every interval seconds, on the shared timer thread
+class MetricsReporter:
+    def __init__(self, interval, log, registry=registry, scheduler=None):
+        self.interval = interval
+        self.log = log
+        self.registry = registry
+        self.scheduler = scheduler or shared_scheduler()
+        self.previous = {}
+        self.previous_time = 0.0
+        self.timer = None
+        self.is_running = False
+
+    def start(self):
+        self.is_running = True
+        self.previous = self.registry.snapshot()
+        self.previous_time = time.monotonic()
+        self.timer = self.scheduler.call_later(self.interval, self.report)
+
+    def stop(self):
+        self.is_running = False
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+    def report(self):
+        if not self.is_running:
+            return
+        now = time.monotonic()
+        current = self.registry.snapshot()
+        elapsed = max(now - self.previous_time, 1e-9)
+        self.log("Metrics: " + self.summary(current, self.previous, elapsed))
+        self.previous, self.previous_time = current, now
+        self.timer = self.scheduler.call_later(self.interval, self.report)
+
+    def summary(self, current, previous, elapsed):
+        kinds = {metric.name: metric.kind for metric in list(self.registry.metrics.values())}
+        fields = []
+        for (name, values), value in current.items():
+            label = short_name(name) + (f"[{','.join(values)}]" if values else "")
+            kind = kinds.get(name)
+            if kind == "gauge":
+                fields.append(f"{label}={format_value(value)}")
+            elif kind == "histogram":
+                count, total = value
+                old_count, old_total = previous.get((name, values), (0, 0.0))
+                if count > old_count:
+                    average = (total - old_total) / (count - old_count)
+                    fields.append(f"{label}_avg={average * 1000:.2f}ms")
+            else:
+                delta = value - previous.get((name, values), 0)
+                if delta:
+                    fields.append(f"{label}=+{delta} ({delta / elapsed:.1f}/s)")
+        return " ".join(fields)
@@ -0,0 +1,90 @@
+import collections
+import threading
+
+from quiz.protocol import PROTOCOL_VERSION, QUESTION, encode_message
+
+# Encoded QUESTION messages, ready to be written to the players.
+#
+# Question indexes wrap around in long sessions and every room playing the
+# same file asks the same questions, so a question is rendered into JSON
+# and framed once, and asking it again only costs the socket writes.
+#
+# A payload is keyed by (source, question index, protocol version, header):
+# source is the (path, mtime, size) version of the question file the
+# QuestionBank loaded, header is (number, total, time limit). The least
+# recently used payloads are evicted first. When the bank loads a new
+# version of a file, the payloads of the old version are dropped and the
+# same questions are rendered again from the new version in the background.
+
+# Payloads kept, across all files and rooms
+PAYLOAD_CACHE_SIZE = 4096
+
+
+def question_body(question, number, total, time_limit):
+    body = {
+        "number": number,
+        "total": total,
+        "question": question.text,
+        "options": dict(question.options),
+    }
+    if time_limit:
+        body["time_limit"] = time_limit
+    return body
+
+
+class PayloadCache:
+    def __init__(self, max_entries=PAYLOAD_CACHE_SIZE):
+        self.lock = threading.Lock()
+        # Key -> encoded message, least recently used first
+        self.entries = collections.OrderedDict()
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
+
+    def question(self, source, questions, index, header):
+        # Encoded QUESTION message for questions[index]; header is (number, total, time limit)
+        if source is None:
+            # Questions that did not come from a file have no stable key
+            return encode_message(QUESTION, question_body(questions[index], *header))
+
+        key = (source, index, PROTOCOL_VERSION, header)
+        with self.lock:
+            data = self.entries.get(key)
+            if data is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return data
+            self.misses += 1
+
+        # Rendered outside the lock; two rooms missing at once both render, one wins
+        data = encode_message(QUESTION, question_body(questions[index], *header))
+        self.store(key, data)
+        return data
+
+    def store(self, key, data):
+        with self.lock:
+            self.entries[key] = data
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def replace_source(self, old_source, new_source, questions):
+        # Drop the payloads of an old file version, then render the same
+        # questions of the new version on a background thread
+        with self.lock:
+            stale = [key for key in self.entries if key[0] == old_source]
+            for key in stale:
+                del self.entries[key]
+
+        keys = [(new_source,) + key[1:] for key in stale if key[1] < len(questions)]
+        if keys:
+            threading.Thread(target=self.render, args=(keys, questions), daemon=True).start()
+
+    def render(self, keys, questions):
+        for key in keys:
+            _, index, _, header = key
+            self.store(key, encode_message(QUESTION, question_body(questions[index], *header)))
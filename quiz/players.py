@@ -0,0 +1,135 @@
+import threading
+
+# Connected players, indexed by username and by connection so that both
+# "send this to alice" and "this socket closed" are O(1), together with the
+# answer each player gave in the current round. Players with a session
+# token are indexed by it too, for resuming a lost connection.
+#
+# All mutations take the registry lock, so transports may add and remove
+# players from any thread while the engine runs a round.
+
+
+class PlayerState:
+    __slots__ = ("name", "conn", "address", "answer", "answer_round", "answered_at", "session", "resume_timer")
+
+    def __init__(self, name, conn, address, session=None):
+        self.name = name
+        self.conn = conn
+        self.address = address
+        self.answer = None
+        # Round number the answer belongs to, see PlayerRegistry.has_answered
+        self.answer_round = -1
+        # time.time() when the answer arrived
+        self.answered_at = 0.0
+        # Token to resume the session with, and the timer that ends it while detached
+        self.session = session
+        self.resume_timer = None
+
+
+class PlayerRegistry:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.by_name = {}
+        self.by_conn = {}
+        self.by_session = {}
+
+        # Answers only count for the current round, so starting a new round
+        # is O(1) instead of resetting every player
+        self.round = 0
+        self.answered_count = 0
+
+    def add(self, conn, name, address, session=None):
+        # Returns the new PlayerState, or None if the username is taken
+        with self.lock:
+            if name in self.by_name:
+                return None
+
+            player = PlayerState(name, conn, address, session)
+            self.by_name[name] = player
+            self.by_conn[conn] = player
+            if session is not None:
+                self.by_session[session] = player
+            return player
+
+    def replace_conn(self, player, conn, session=None):
+        # The player continues on conn; a new session token replaces the old one
+        with self.lock:
+            del self.by_conn[player.conn]
+            player.conn = conn
+            self.by_conn[conn] = player
+            if session is not None:
+                self.by_session.pop(player.session, None)
+                player.session = session
+                self.by_session[session] = player
+
+    def remove(self, conn):
+        # Returns the removed PlayerState, or None if it was already removed
+        with self.lock:
+            player = self.by_conn.pop(conn, None)
+            if player is None:
+                return None
+
+            del self.by_name[player.name]
+            self.by_session.pop(player.session, None)
+            if self.has_answered(player):
+                self.answered_count -= 1
+            return player
+
+    def clear(self):
+        with self.lock:
+            players = list(self.by_name.values())
+            self.by_name.clear()
+            self.by_conn.clear()
+            self.by_session.clear()
+            self.answered_count = 0
+        return players
+
+    def get(self, name):
+        return self.by_name.get(name)
+
+    def find(self, conn):
+        return self.by_conn.get(conn)
+
+    def find_session(self, session):
+        return self.by_session.get(session)
+
+    def __len__(self):
+        return len(self.by_name)
+
+    def __contains__(self, name):
+        return name in self.by_name
+
+    def names(self):
+        with self.lock:
+            return list(self.by_name)
+
+    def players(self):
+        # Snapshot, safe to iterate while other threads add or remove players
+        with self.lock:
+            return list(self.by_name.values())
+
+    def connections(self):
+        with self.lock:
+            return list(self.by_conn)
+
+    def new_round(self):
+        with self.lock:
+            self.round += 1
+            self.answered_count = 0
+
+    def has_answered(self, player):
+        return player.answer_round == self.round
+
+    def record_answer(self, player, answer):
+        # Returns False if the player already answered this round or has left
+        with self.lock:
+            if self.has_answered(player) or self.by_name.get(player.name) is not player:
+                return False
+
+            player.answer = answer
+            player.answer_round = self.round
+            self.answered_count += 1
+            return True
+
+    def all_answered(self):
+        return self.answered_count >= len(self.by_name)
@@ -0,0 +1,256 @@
+import json
+import secrets
+import struct
+from collections import namedtuple
+
+# Wire protocol shared by the quiz server and the player client.
+#
+# Every message is one frame:
+#   4 bytes  big-endian length of everything after this field
+#   1 byte   message type (see below)
+#   N bytes  UTF-8 JSON object with the message fields
+#
+# TCP may split or merge sends arbitrarily, so readers feed whatever recv()
+# returned into a FrameDecoder and get back zero or more whole messages.
+#
+# Connection setup:
+#   client -> HELLO    {"version", "username"} plus "room" to join or create a room,
+#                      and "session" to resume a connection that was lost
+#   server -> WELCOME  {"version", "session"}  or  ERROR {"reason"} followed by close
+#
+# The session token of the WELCOME lets a client that lost its connection
+# come back as the same player within the server's grace window (see
+# quiz/sessions.py); every WELCOME carries a new token.
+#
+# Heartbeats: the server sends PING to a connection it has not heard from
+# for a while, and the client answers with PONG right away. A connection
+# that stays silent too long is closed (see transport.Heartbeat).
+
+PROTOCOL_VERSION = 3
+
+# Client -> server
+HELLO = 1
+ANSWER = 2            # {"choice": "A" | "B" | "C", "number": question number}
+BYE = 3               # {} leaving for good, the session cannot be resumed
+PONG = 4              # {} answer to a PING
+
+# Server -> client
+WELCOME = 10
+ERROR = 11            # {"reason"}
+QUESTION = 12         # {"number", "total", "question", "options": {"A", "B", "C"}} plus "time_limit" seconds
+ACK = 13              # {"accepted", "text"} answer receipt
+RESULT = 14           # {"text"} plus "answer" (broadcast) or "points" (personal)
+SCOREBOARD = 15       # {"final", "top": [[rank, name, score], ...], "players"} plus "rank", "score" (personal)
+CONTROL = 16          # {"event", "text"} game_starting, time_up, game_over, game_ended, player_left,
+                      # resumed (personal, plus "score", "game_running" and "answered"),
+                      # resume_failed (personal)
+PING = 17             # {} the connection was idle; answer with PONG
+
+MESSAGE_NAMES = {
+    HELLO: "hello",
+    ANSWER: "answer",
+    BYE: "bye",
+    PONG: "pong",
+    WELCOME: "welcome",
+    ERROR: "error",
+    QUESTION: "question",
+    ACK: "ack",
+    RESULT: "result",
+    SCOREBOARD: "scoreboard",
+    CONTROL: "control",
+    PING: "ping",
+}
+
+ANSWER_CHOICES = ("A", "B", "C")
+
+HEADER = struct.Struct("!IB")
+
+# Largest frame a peer may send; anything bigger is treated as garbage
+MAX_FRAME_SIZE = 1 << 20
+
+# Largest frame the server accepts from a client; a hello or an answer is a
+# few dozen bytes
+MAX_CLIENT_FRAME_SIZE = 4096
+
+MAX_USERNAME = 32
+
+MAX_ROOM_NAME = 32
+
+MAX_SESSION_TOKEN = 64
+
+# A validated HELLO; session is the token to resume, or None
+Hello = namedtuple("Hello", ["username", "room", "session"])
+
+
+class ProtocolError(Exception):
+    pass
+
+
+# A frame header announced more than the decoder's max_frame_size
+class FrameTooLargeError(ProtocolError):
+    pass
+
+
+def encode_message(msg_type, body=None):
+    payload = json.dumps(body or {}, separators=(",", ":")).encode()
+    return HEADER.pack(len(payload) + 1, msg_type) + payload
+
+
+class MessageTemplate:
+    # Encodes many messages that only differ in a few fields, e.g. the same
+    # scoreboard with each player's own rank: the shared fields are turned
+    # into JSON once and every message only encodes its own fields.
+
+    def __init__(self, msg_type, shared_body):
+        self.msg_type = msg_type
+        # Shared object without its closing brace
+        self.prefix = json.dumps(shared_body, separators=(",", ":")).encode()[:-1]
+
+    def encode(self, body):
+        fields = json.dumps(body, separators=(",", ":")).encode()[1:]
+        if len(self.prefix) > 1 and len(fields) > 1:
+            fields = b"," + fields
+        payload = self.prefix + fields
+        return HEADER.pack(len(payload) + 1, self.msg_type) + payload
+
+
+class FrameDecoder:
+    # Incremental decoder: keeps partial frames between feed() calls and
+    # only decodes each body once, however many frames one recv() carried.
+
+    def __init__(self, max_frame_size=MAX_FRAME_SIZE):
+        self.buffer = bytearray()
+        self.max_frame_size = max_frame_size
+
+    def feed(self, data):
+        self.buffer += data
+        messages = []
+        offset = 0
+        buffer_size = len(self.buffer)
+
+        while buffer_size - offset >= HEADER.size:
+            length, msg_type = HEADER.unpack_from(self.buffer, offset)
+            if length > self.max_frame_size:
+                raise FrameTooLargeError(f"Frame of {length} bytes exceeds the limit of {self.max_frame_size}")
+            if length < 1:
+                raise ProtocolError(f"Invalid frame length {length}")
+
+            frame_end = offset + 4 + length
+            if frame_end > buffer_size:
+                break
+
+            try:
+                body = json.loads(bytes(self.buffer[offset + HEADER.size:frame_end]))
+            except ValueError as e:
+                raise ProtocolError(f"Malformed message body: {e}")
+            if not isinstance(body, dict):
+                raise ProtocolError("Message body must be a JSON object")
+
+            messages.append((msg_type, body))
+            offset = frame_end
+
+        if offset:
+            del self.buffer[:offset]
+        return messages
+
+
+def encode_hello(username, room=None, session=None):
+    # First message of a client: protocol version, username, optional room
+    # and the session token of a lost connection
+    hello = {"version": PROTOCOL_VERSION, "username": username}
+    if room:
+        hello["room"] = room
+    if session:
+        hello["session"] = session
+    return encode_message(HELLO, hello)
+
+
+def new_session_token():
+    return secrets.token_urlsafe(16)
+
+
+def encode_welcome(session):
+    return encode_message(WELCOME, {"version": PROTOCOL_VERSION, "session": session})
+
+
+def encode_answer(choice, number):
+    # number: the question being answered, so a late answer is not counted for the next one
+    return encode_message(ANSWER, {"choice": choice, "number": number})
+
+
+def encode_bye():
+    return encode_message(BYE, {})
+
+
+def encode_pong():
+    return encode_message(PONG, {})
+
+
+def parse_hello(msg_type, body):
+    # Validate the first client message; returns a Hello or raises
+    # ProtocolError with a reason that can be sent back to the client.
+    if msg_type != HELLO:
+        raise ProtocolError("Expected a hello message.")
+    if body.get("version") != PROTOCOL_VERSION:
+        raise ProtocolError(f"Unsupported protocol version {body.get('version')!r}, server speaks {PROTOCOL_VERSION}.")
+
+    username = body.get("username")
+    if not isinstance(username, str) or not username.strip() or len(username.strip()) > MAX_USERNAME:
+        raise ProtocolError(f"Username must be 1 to {MAX_USERNAME} characters.")
+    username = username.strip()
+
+    room = body.get("room")
+    if room is not None:
+        if not isinstance(room, str) or not room.strip() or len(room.strip()) > MAX_ROOM_NAME:
+            raise ProtocolError(f"Room name must be 1 to {MAX_ROOM_NAME} characters.")
+        room = room.strip()
+
+    session = body.get("session")
+    if session is not None and (not isinstance(session, str) or len(session) > MAX_SESSION_TOKEN):
+        raise ProtocolError("Invalid session token.")
+    return Hello(username, room, session or None)
+
+
+def ordinal(rank):
+    # 1st, 2nd, 3rd, 4th, ... 11th, 12th, 13th, ... 21st
+    if rank % 100 in (11, 12, 13):
+        return f"{rank}th"
+    return f"{rank}{ {1: 'st', 2: 'nd', 3: 'rd'}.get(rank % 10, 'th')}"
+
+
+def scoreboard_text(body):
+    # The top of the scoreboard, followed by the receiver's own rank when the
+    # message was personal
+    final = body.get("final")
+    top = body.get("top") or []
+    if not top:
+        return "Final Scoreboard is Empty" if final else "Scoreboard is Empty"
+
+    if final:
+        lines = ["", "--- FINAL SCOREBOARD ---"]
+        lines += [f"{ordinal(rank)} {name} : {score} Point" for rank, name, score in top]
+    else:
+        lines = ["Scoreboard:"]
+        lines += [f"{rank}. {name} : {score} Point" for rank, name, score in top]
+
+    if len(top) < body.get("players", 0):
+        lines.append(f"... {body['players'] - len(top)} more")
+    if body.get("rank") is not None:
+        lines.append(f"Your rank: {ordinal(body['rank'])} of {body.get('players')} with {body.get('score')} Point")
+    return "\n".join(lines)
+
+
+def message_text(msg_type, body):
+    # Human readable text of a server message, as shown in the player window
+    if msg_type == SCOREBOARD:
+        return scoreboard_text(body)
+    if msg_type == QUESTION:
+        options = body.get("options", {})
+        lines = [f"--- Question {body.get('number')} / {body.get('total')} ---", body.get("question", "")]
+        lines += [f"{choice} - {options.get(choice)}" for choice in ANSWER_CHOICES if choice in options]
+        if body.get("time_limit"):
+            lines.append(f"You have {body['time_limit']:g} seconds to answer.")
+        return "\n".join(lines)
+    if msg_type == ERROR:
+        return f"Error: {body.get('reason', '')}"
+    return body.get("text", "")
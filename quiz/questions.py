@@ -0,0 +1,322 @@
+import array
+import collections
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+
+from quiz.payloads import PayloadCache
+from quiz.protocol import ANSWER_CHOICES
+from quiz.scheduler import shared_scheduler
+
+# Question files in the quiz_qa.txt format, one block per question:
+#   Question text
+#   A - first option
+#   B - second option
+#   C - third option
+#   Answer: B
+#
+# Blank lines are skipped. Blocks that are malformed (no options, or an
+# answer that is not one of the options, ...) are skipped and reported with
+# their line number; the other questions of the file still load.
+#
+# Parsed files live in a question bank shared by every game in the process,
+# so rooms playing the same file share one parsed copy. A file is parsed
+# again when its size or modification time changes. The parsed questions
+# are shared, so games must never modify them.
+#
+# Loaded files are checked for changes every FILE_CHECK_INTERVAL seconds;
+# a changed file is parsed again on a background thread, and the encoded
+# questions of its old version are replaced (see quiz/payloads.py). Games
+# that watch their file swap the new version in between two rounds.
+#
+# Large banks can be compiled once into a binary file (python -m
+# quiz.compile_questions quiz_qa.txt quiz_qa.qbank) and loaded like a text
+# file. A compiled bank is memory-mapped, not read: loading it only checks
+# the header, and a question is decoded when a game asks for it, so startup
+# time and memory do not grow with the size of the bank.
+#
+# Compiled layout, little endian:
+#   header   "QBNK", format version (u32), question count (u64), index offset (u64)
+#   records  one UTF-8 JSON array per question: [text, [[choice, option], ...], answer, line]
+#   index    count + 1 offsets (u64); question i is bytes offset[i]:offset[i + 1]
+
+# Seconds between checks of the loaded files' size and modification time
+FILE_CHECK_INTERVAL = 2.0
+
+COMPILED_MAGIC = b"QBNK"
+COMPILED_VERSION = 2
+COMPILED_HEADER = struct.Struct("<4sIQQ")
+COMPILED_OFFSET = struct.Struct("<Q")
+
+# "A -" -> "A"
+OPTION_PREFIXES = {f"{choice} -": choice for choice in ANSWER_CHOICES}
+
+# One parsed question. options holds (choice, text) pairs in file order,
+# line is the line number of the question text.
+Question = collections.namedtuple("Question", ["text", "options", "answer", "line"])
+
+
+def iter_questions(lines, on_error=None):
+    # Parse lines into Question records, one at a time and in constant memory.
+    # Malformed blocks are skipped; each is reported once as
+    # on_error(line number, message).
+    def report(number, message):
+        if on_error is not None:
+            on_error(number, message)
+
+    # The block being read: question text, its line number, the options so
+    # far and whether a problem was reported already
+    text = None
+    text_line = 0
+    options = {}
+    broken = False
+
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+
+        if line.startswith("Answer:"):
+            # Extract correct answer letter (A/B/C)
+            answer = line.split(":", 1)[1].strip().upper()
+
+            if text is None:
+                report(number, "'Answer:' line without a question")
+            elif broken:
+                pass
+            elif not options:
+                report(text_line, "question has no options")
+            elif answer not in options:
+                report(number, f"answer '{answer}' is not one of the options {', '.join(options)}")
+            else:
+                yield Question(text, tuple(options.items()), answer, text_line)
+
+            # Reset block for the next question
+            text = None
+            options = {}
+            broken = False
+
+        elif text is None:
+            text = line
+            text_line = number
+
+        elif line[:3] in OPTION_PREFIXES:
+            choice = OPTION_PREFIXES[line[:3]]
+            option = line[3:].strip()
+            if choice in options and not broken:
+                report(number, f"option {choice} given twice")
+                broken = True
+            elif not option and not broken:
+                report(number, f"option {choice} is empty")
+                broken = True
+            else:
+                options[choice] = option
+
+        elif options:
+            # A new question started before the previous one got its answer
+            if not broken:
+                report(text_line, "question has no 'Answer:' line")
+            text = line
+            text_line = number
+            options = {}
+            broken = False
+
+        elif not broken:
+            report(number, "expected an option line ('A - ...')")
+            broken = True
+
+    if text is not None and not broken:
+        report(text_line, "question has no 'Answer:' line")
+
+
+def parse_questions(lines, on_error=None):
+    # Parse lines into a list of Question records
+    return list(iter_questions(lines, on_error))
+
+
+def read_questions(file_name, on_error=None):
+    with open(file_name, 'r') as file:
+        return parse_questions(file, on_error)
+
+
+def is_compiled(path):
+    with open(path, 'rb') as file:
+        return file.read(len(COMPILED_MAGIC)) == COMPILED_MAGIC
+
+
+def compile_questions(source_name, target_name, on_error=None):
+    # Compile a question file into the binary format, returns the question count.
+    # The target is replaced in one step, so games that still have the old
+    # bank mapped keep reading the old questions.
+    offsets = array.array('Q')
+    temp_name = target_name + ".tmp"
+
+    with open(source_name, 'r') as source, open(temp_name, 'wb') as target:
+        target.write(COMPILED_HEADER.pack(COMPILED_MAGIC, COMPILED_VERSION, 0, 0))
+        position = COMPILED_HEADER.size
+        for question in iter_questions(source, on_error):
+            offsets.append(position)
+            record = json.dumps(question, ensure_ascii=False, separators=(",", ":")).encode()
+            target.write(record)
+            position += len(record)
+        offsets.append(position)
+
+        if offsets.itemsize != COMPILED_OFFSET.size or offsets.typecode != 'Q':
+            raise ValueError("unsupported platform word size")
+        if sys.byteorder != "little":
+            offsets.byteswap()
+        target.write(offsets.tobytes())
+
+        count = len(offsets) - 1
+        target.seek(0)
+        target.write(COMPILED_HEADER.pack(COMPILED_MAGIC, COMPILED_VERSION, count, position))
+
+    os.replace(temp_name, target_name)
+    return count
+
+
+# A compiled question file; reads like the list of Question records that
+# parse_questions returns, but decodes a question only when it is indexed
+class CompiledQuestions:
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.count, self.index_offset = COMPILED_HEADER.unpack_from(self.map, 0)
+        if magic != COMPILED_MAGIC:
+            raise ValueError("not a compiled question file")
+        if version != COMPILED_VERSION:
+            raise ValueError(f"compiled with format version {version}, compile the question file again")
+        if self.index_offset + (self.count + 1) * COMPILED_OFFSET.size > len(self.map):
+            raise ValueError("compiled question file is truncated")
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if not 0 <= index < self.count:
+            raise IndexError("question index out of range")
+        start, end = struct.unpack_from("<2Q", self.map, self.index_offset + index * COMPILED_OFFSET.size)
+        text, options, answer, line = json.loads(self.map[start:end])
+        return Question(text, tuple(map(tuple, options)), answer, line)
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self[index]
+
+
+# One loaded version of a question file. source is (path, mtime, size),
+# problems lists the skipped blocks as (line number, problem).
+QuestionFile = collections.namedtuple("QuestionFile", ["source", "questions", "problems"])
+
+
+def file_source(path):
+    stat = os.stat(path)
+    return (path, stat.st_mtime_ns, stat.st_size)
+
+
+def read_file(path, source):
+    problems = []
+    if is_compiled(path):
+        # Problems were reported by the compiler
+        questions = CompiledQuestions(path)
+    else:
+        questions = read_questions(path, lambda number, message: problems.append((number, message)))
+    return QuestionFile(source, questions, problems)
+
+
+class QuestionBank:
+    def __init__(self, scheduler=None):
+        self.lock = threading.Lock()
+        # Absolute path -> newest QuestionFile
+        self.files = {}
+        # Encoded questions of every file, see quiz/payloads.py
+        self.payloads = PayloadCache()
+
+        # Loaded files are checked for changes on the timer thread
+        self.scheduler = scheduler
+        self.is_checking = False
+        self.reloading = set()
+
+    def load(self, file_name):
+        # Returns the QuestionFile, parsed again if the file changed.
+        # Raises FileNotFoundError / OSError like open() would.
+        path = os.path.abspath(file_name)
+        source = file_source(path)
+
+        with self.lock:
+            cached = self.files.get(path)
+        if cached is not None and cached.source == source:
+            return cached
+
+        loaded = read_file(path, source)
+        self.store(loaded)
+        return loaded
+
+    def latest(self, path):
+        # Newest version of a loaded file, without touching the disk
+        with self.lock:
+            return self.files.get(path)
+
+    def store(self, loaded):
+        path = loaded.source[0]
+        with self.lock:
+            old = self.files.get(path)
+            self.files[path] = loaded
+            start_checking = not self.is_checking
+            self.is_checking = True
+
+        if old is not None and old.source != loaded.source:
+            self.payloads.replace_source(old.source, loaded.source, loaded.questions)
+        if start_checking:
+            if self.scheduler is None:
+                self.scheduler = shared_scheduler()
+            self.scheduler.call_later(FILE_CHECK_INTERVAL, self.check_files)
+
+    def check_files(self):
+        # Runs on the timer thread, so it only stats; parsing happens on a reload thread
+        with self.lock:
+            files = list(self.files.values())
+
+        for loaded in files:
+            path = loaded.source[0]
+            try:
+                source = file_source(path)
+            except OSError:
+                # Deleted or being replaced, keep the loaded version
+                continue
+
+            with self.lock:
+                reload = source != loaded.source and path not in self.reloading
+                if reload:
+                    self.reloading.add(path)
+            if reload:
+                threading.Thread(target=self.reload, args=(path,), daemon=True).start()
+
+        self.scheduler.call_later(FILE_CHECK_INTERVAL, self.check_files)
+
+    def reload(self, path):
+        try:
+            self.store(read_file(path, file_source(path)))
+        except (OSError, ValueError):
+            # Half written or broken: keep the loaded version, a later check tries again
+            pass
+        finally:
+            with self.lock:
+                self.reloading.discard(path)
+
+
+shared = None
+shared_lock = threading.Lock()
+
+
+def shared_bank():
+    # The question bank used by every game engine in this process
+    global shared
+    with shared_lock:
+        if shared is None:
+            shared = QuestionBank()
+        return shared
@@ -0,0 +1,141 @@
+import bisect
+
+# Incrementally maintained scoreboard.
+#
+# Entries are kept sorted by (-score, name) in a list of short sorted
+# buckets, the same layout as the sortedcontainers SortedList. A Fenwick
+# tree over the bucket sizes turns "how many entries sort before this one"
+# into O(log n), so awarding points, a player's own rank and the top K are
+# all cheap no matter how many players are in the game:
+#   add_points  O(log n) bisect + a short bucket insert
+#   rank        O(log n)
+#   top(k)      O(log n + k)
+#
+# Ranks are tie-aware (1, 2, 2, 4): a player's rank is one plus the number
+# of players with a strictly higher score. Players who leave keep their
+# place until the next game resets the ranking.
+#
+# Only the game's actor thread touches a Ranking, so it takes no lock.
+
+# Buckets are split when they grow past twice this size
+BUCKET_SIZE = 512
+
+
+class Ranking:
+    def __init__(self, bucket_size=BUCKET_SIZE):
+        self.bucket_size = bucket_size
+        self.scores = {}
+        self.buckets = []
+        # Last key of every bucket, to find the bucket of a key with bisect
+        self.maxes = []
+        self.tree = []
+
+    def __len__(self):
+        return len(self.scores)
+
+    def __contains__(self, name):
+        return name in self.scores
+
+    def score(self, name):
+        return self.scores.get(name)
+
+    def reset(self, names):
+        # Start a new game with every given player at 0 points
+        self.scores = {name: 0 for name in names}
+        keys = sorted((0, name) for name in self.scores)
+        self.buckets = [keys[i:i + self.bucket_size] for i in range(0, len(keys), self.bucket_size)]
+        self.rebuild_index()
+
+    def add_points(self, name, points):
+        old_score = self.scores.get(name)
+        if old_score is not None:
+            if not points:
+                return
+            self.remove_key((-old_score, name))
+        else:
+            old_score = 0
+
+        self.scores[name] = old_score + points
+        self.insert_key((-(old_score + points), name))
+
+    def rank(self, name):
+        # Tie-aware rank of a player, or None for unknown players
+        score = self.scores.get(name)
+        if score is None:
+            return None
+        # (-score, "") sorts before every player with this score
+        return self.position((-score, "")) + 1
+
+    def top(self, k):
+        # [(rank, name, score), ...] for the best k players
+        entries = []
+        rank = 0
+        last_score = None
+        for bucket in self.buckets:
+            for negative_score, name in bucket:
+                if len(entries) >= k:
+                    return entries
+                if -negative_score != last_score:
+                    rank = len(entries) + 1
+                    last_score = -negative_score
+                entries.append((rank, name, -negative_score))
+        return entries
+
+    # Sorted bucket list internals
+
+    def position(self, key):
+        # Number of keys that sort before key
+        index = bisect.bisect_left(self.maxes, key)
+        if index == len(self.buckets):
+            return len(self.scores)
+        return self.prefix(index) + bisect.bisect_left(self.buckets[index], key)
+
+    def insert_key(self, key):
+        if not self.buckets:
+            self.buckets.append([key])
+            self.rebuild_index()
+            return
+
+        index = min(bisect.bisect_left(self.maxes, key), len(self.buckets) - 1)
+        bucket = self.buckets[index]
+        bisect.insort(bucket, key)
+        self.maxes[index] = bucket[-1]
+
+        if len(bucket) > 2 * self.bucket_size:
+            self.buckets[index:index + 1] = [bucket[:self.bucket_size], bucket[self.bucket_size:]]
+            self.rebuild_index()
+        else:
+            self.update(index, 1)
+
+    def remove_key(self, key):
+        index = bisect.bisect_left(self.maxes, key)
+        bucket = self.buckets[index]
+        del bucket[bisect.bisect_left(bucket, key)]
+
+        if bucket:
+            self.maxes[index] = bucket[-1]
+            self.update(index, -1)
+        else:
+            del self.buckets[index]
+            self.rebuild_index()
+
+    def rebuild_index(self):
+        # Recompute maxes and the Fenwick tree after buckets were added or removed
+        self.maxes = [bucket[-1] for bucket in self.buckets]
+        self.tree = [0] * (len(self.buckets) + 1)
+        for index, bucket in enumerate(self.buckets):
+            self.update(index, len(bucket))
+
+    def update(self, index, delta):
+        index += 1
+        while index < len(self.tree):
+            self.tree[index] += delta
+            index += index & -index
+
+    def prefix(self, index):
+        # Total size of the buckets before bucket number index
+        total = 0
+        while index > 0:
+            total += self.tree[index]
+            index -= index & -index
+        return total
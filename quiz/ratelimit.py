@@ -0,0 +1,97 @@
+import time
+
+from quiz import metrics
+
+# Inbound rate limits of a player connection.
+#
+# Every message a player sends costs the server a decode, a pass through the
+# game's actor thread and often a reply ("You already answered"), so a client
+# sending as fast as it can would slow the game down for everybody. Each
+# connection gets two token buckets, filled at a steady rate up to a burst:
+#
+#   bytes    - a read that goes beyond the bucket pauses the connection's
+#              reader until the bucket has caught up again. The socket
+#              buffers fill up and TCP slows the sender down; nothing is lost.
+#   messages - a message beyond the bucket is dropped before it reaches the
+#              game. A connection that had flood_limit messages dropped is
+#              disconnected with the reason "flood".
+#
+# A player answering each question and the pings never comes near either
+# limit. Frames larger than protocol.MAX_CLIENT_FRAME_SIZE end the connection
+# before they are read (reason "oversized").
+
+# Messages per second a player may send, and how many at once
+MESSAGE_RATE = 5.0
+MESSAGE_BURST = 20
+
+# Bytes per second a player may send; the bucket holds one second's worth
+BYTE_RATE = 16 * 1024
+
+# Dropped messages after which a connection is closed (0: never)
+FLOOD_LIMIT = 200
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate, burst):
+        # rate 0 or less: no limit
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, amount=1):
+        # True and the tokens are taken, or False and nothing is
+        if self.rate <= 0:
+            return True
+        self.refill()
+        if self.tokens < amount:
+            return False
+        self.tokens -= amount
+        return True
+
+    def borrow(self, amount):
+        # Always takes the tokens; returns the seconds until the bucket is
+        # out of debt again
+        if self.rate <= 0:
+            return 0.0
+        self.refill()
+        self.tokens -= amount
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+
+class InboundLimiter:
+    def __init__(self, message_rate=MESSAGE_RATE, message_burst=MESSAGE_BURST, byte_rate=BYTE_RATE,
+                 flood_limit=FLOOD_LIMIT):
+        self.messages = TokenBucket(message_rate, message_burst)
+        self.bytes = TokenBucket(byte_rate, byte_rate)
+        self.flood_limit = flood_limit
+        self.dropped = 0
+
+    def pause_for(self, size):
+        # Seconds the reader should wait after reading size bytes
+        pause = self.bytes.borrow(size)
+        if pause:
+            metrics.reads_throttled.inc()
+        return pause
+
+    def admit(self, messages):
+        # The messages within the limit, in order
+        if not messages:
+            return messages
+        admitted = [message for message in messages if self.messages.take()]
+        dropped = len(messages) - len(admitted)
+        if dropped:
+            self.dropped += dropped
+            metrics.messages_dropped.inc(dropped)
+        return admitted
+
+    def is_flooding(self):
+        # The connection should be closed
+        return 0 < self.flood_limit <= self.dropped
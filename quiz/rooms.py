@@ -0,0 +1,262 @@
+import socket
+import threading
+
+from quiz.engine import GameEngine, get_local_ip
+from quiz.transport import TRANSPORTS
+
+# Many concurrent quizzes ("rooms") in one server process.
+#
+# Players name a room in their HELLO; an unknown room is created on the spot
+# with the server's default question file and QA number, and closed again
+# when its engine reports that its last player is gone. A player who only
+# lost their connection is gone once their session runs out, so the room
+# stays open while they may still resume it. Rooms given on the
+# command line are always open and may use their own question file and QA
+# number.
+#
+# Shared by all rooms: the listening socket and transport, the question bank
+# (each file is parsed once, see quiz/questions.py) and the timer heap.
+# Owned by every room: a GameEngine with its questions, QA number, players,
+# scoreboard and round timer, and the engine's game thread that runs
+# everything the room does (see quiz/actor.py). The transport only puts a
+# room's work into that room's inbox, so a burst of answers or a 10,000
+# player scoreboard in one room never holds up another room.
+#
+# The manager implements the same host interface as GameEngine and publishes
+# the same events, with every log line prefixed by the room name and the
+# room's name added to the game history events.
+
+# Room for players that do not name one
+DEFAULT_ROOM = "lobby"
+MAX_ROOMS = 100
+
+
+class Room:
+    def __init__(self, name, engine_options, persistent=False):
+        self.name = name
+        # Persistent rooms stay open without players
+        self.persistent = persistent
+        # Players routed to this room, counted by the manager
+        self.members = 0
+        self.engine = GameEngine(**engine_options)
+
+    def submit(self, callback, *args):
+        # Runs callback on the room's game thread
+        self.engine.actor.submit(callback, *args)
+
+    def close(self):
+        # Disconnects the players, then stops the game thread
+        self.engine.stop_listening(wait=False)
+        self.engine.actor.close()
+
+
+class RoomManager:
+    def __init__(self, transport_mode="threaded", transport_options=None, engine_options=None,
+                 auto_start=0, max_rooms=MAX_ROOMS):
+        self.transport_mode = transport_mode
+        self.transport_options = transport_options or {}
+        self.transport = None
+        self.is_listening = False
+
+        # Keyword arguments for the GameEngine of every room
+        self.engine_options = engine_options or {}
+        self.auto_start = max(auto_start, 2) if auto_start else 0
+        self.max_rooms = max_rooms
+
+        # Guards rooms, player_rooms and Room.members
+        self.lock = threading.Lock()
+        self.rooms = {}
+        self.player_rooms = {}
+
+        # Event stream observers
+        self.subscribers = []
+
+        # Holds the default question file and QA number for new rooms; it
+        # never has players, it only validates and logs the settings
+        self.defaults = GameEngine(**self.engine_options)
+        self.defaults.subscribe(lambda item: self.emit(*item) if item[0] == "log" else None)
+
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        self.subscribers.remove(callback)
+
+    def emit(self, event, data):
+        for callback in list(self.subscribers):
+            callback((event, data))
+
+    def log(self, message):
+        self.emit("log", message)
+
+    def load_questions(self, file_name):
+        self.defaults.load_questions(file_name)
+        # Rooms opened from now on copy the settings
+        self.defaults.actor.wait_idle()
+
+    def set_qa_number(self, qa_input):
+        self.defaults.set_qa_number(qa_input)
+        self.defaults.actor.wait_idle()
+
+    def open_room(self, name, questions_file=None, qa=None, persistent=False):
+        # Caller holds self.lock, or no transport is running yet
+        room = Room(name, self.engine_options, persistent)
+        room.engine.subscribe(lambda item: self.room_event(room, *item))
+        self.rooms[name] = room
+
+        engine = room.engine
+        engine.serve_room()
+        if questions_file:
+            engine.load_questions(questions_file)
+        else:
+            # The default questions are shared, not copied
+            engine.questions = self.defaults.questions
+            engine.question_source = self.defaults.question_source
+            engine.file_found = self.defaults.file_found
+        if qa is not None:
+            engine.set_qa_number(qa)
+        else:
+            engine.question_number = self.defaults.question_number
+            engine.qa_valid = self.defaults.qa_valid
+
+        self.log(f"Room '{name}' opened.")
+        return room
+
+    def close_room(self, room):
+        # Caller holds self.lock; the game thread finishes its inbox first
+        del self.rooms[room.name]
+        room.close()
+        self.log(f"Room '{room.name}' closed.")
+
+    def room_event(self, room, event, data):
+        # Called on the room's game thread
+        if event == "log":
+            lines = [line for line in data.splitlines() if line.strip()]
+            if lines:
+                self.log("\n".join(f"[{room.name}] {line}" for line in lines))
+
+        elif event == "start_conditions" and data:
+            # Start from the inbox, not from inside the engine call that emitted this
+            room.submit(self.maybe_auto_start, room)
+
+        elif event in ("game_started", "round_finished", "game_finished"):
+            # Game history, see quiz/history.py
+            self.emit(event, dict(data, room=room.name))
+
+        elif event == "all_players_left":
+            # After the event that removed the last player, outside of it
+            room.submit(self.close_if_empty, room)
+
+        elif event == "game_running":
+            self.emit("game_running", data)
+            if not data:
+                # Players that are still in the room go straight into the next game
+                room.submit(self.maybe_auto_start, room)
+
+    def maybe_auto_start(self, room):
+        engine = room.engine
+        if (self.auto_start and not engine.game_running and engine.can_start()
+                and len(engine.players) >= self.auto_start):
+            engine.start_game()
+
+    # Transport host interface
+
+    def check_new_player(self, name, room_name=None, resume=None):
+        room_name = room_name or DEFAULT_ROOM
+        with self.lock:
+            room = self.rooms.get(room_name)
+            if room is None:
+                if not self.is_listening:
+                    return "Server is shutting down."
+                if len(self.rooms) >= self.max_rooms:
+                    # Players whose handshake failed after the check can leave empty rooms behind
+                    for empty_room in [r for r in self.rooms.values() if not r.members and not r.persistent]:
+                        self.close_room(empty_room)
+                if len(self.rooms) >= self.max_rooms:
+                    self.log(f"Connection attempt by '{name}' rejected (Too many rooms).")
+                    return "Too many rooms are open, try again later."
+                room = self.open_room(room_name)
+
+        return room.engine.check_new_player(name, resume=resume)
+
+    def add_player(self, player_conn, name, player_address, room_name=None, session=None, resume=None):
+        with self.lock:
+            room = self.rooms.get(room_name or DEFAULT_ROOM)
+            if room is not None:
+                room.members += 1
+                self.player_rooms[player_conn] = room
+
+        if room is None:
+            # The room was closed between the check and now
+            player_conn.close()
+            return
+        room.engine.add_player(player_conn, name, player_address, session=session, resume=resume)
+
+    def handle_player_message(self, player_conn, name, msg_type, body):
+        room = self.player_rooms.get(player_conn)
+        if room is not None:
+            room.engine.handle_player_message(player_conn, name, msg_type, body)
+
+    def remove_player(self, player_conn, reason="closed"):
+        with self.lock:
+            room = self.player_rooms.pop(player_conn, None)
+            if room is None:
+                return
+
+            room.members -= 1
+            # The room closes once its engine reports the last player gone
+            room.engine.remove_player(player_conn, reason)
+
+    def close_if_empty(self, room):
+        # Room's game thread; a player may have joined since the event
+        with self.lock:
+            if (not room.members and not room.persistent and not room.engine.players
+                    and self.rooms.get(room.name) is room):
+                self.close_room(room)
+
+    # Server lifecycle, same as GameEngine
+
+    def start_listening(self, port_input):
+        port_input = str(port_input).strip()
+
+        if not port_input:
+            self.log("Error: Please enter a port number")
+            return False
+
+        try:
+            port = int(port_input)
+            self.transport = TRANSPORTS[self.transport_mode](self, **self.transport_options)
+            self.is_listening = True
+            self.transport.start(port)
+
+        except (socket.error, ValueError) as e:
+            self.is_listening = False
+            self.log("Could not start server: " + str(e))
+            self.log("Try another port")
+            return False
+
+        self.emit("listening", True)
+
+        local_ip = get_local_ip()
+        self.log(f"--- Server listening on port {self.transport.port} with {local_ip} "
+                 f"({self.transport.name} transport, {len(self.rooms)} rooms open) ---")
+        return True
+
+    def stop_listening(self):
+        if not self.is_listening:
+            return
+
+        with self.lock:
+            self.is_listening = False
+            rooms = list(self.rooms.values())
+            for room in rooms:
+                self.close_room(room)
+            self.player_rooms.clear()
+
+        # Let every room disconnect its players before the transport goes away
+        for room in rooms:
+            room.engine.actor.thread.join(1.0)
+        self.transport.stop()
+
+        self.emit("listening", False)
+        self.log("--- Server stopped ---")
@@ -0,0 +1,108 @@
+import heapq
+import itertools
+import threading
+import time
+import traceback
+
+# Timers for question deadlines and the pause between questions.
+#
+# One heap and one thread serve every game in the process, instead of a
+# thread or a Tk after() call per timer. Callbacks run on the scheduler
+# thread, one at a time, so they must be short: the engine's timers only
+# submit the real work to the game's actor (engine.actor.submit) and return.
+#
+# Cancelled timers stay in the heap until they reach the top, unless more
+# than half of the heap is cancelled, then it is rebuilt.
+
+
+class Timer:
+    __slots__ = ("scheduler", "when", "callback", "args", "cancelled")
+
+    def __init__(self, scheduler, when, callback, args):
+        self.scheduler = scheduler
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.scheduler.cancel(self)
+
+
+class TimerScheduler:
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.heap = []
+        # Tie breaker so timers due at the same time run in the order they were added
+        self.sequence = itertools.count()
+        self.cancelled_count = 0
+        self.thread = None
+
+    def call_later(self, delay, callback, *args):
+        timer = Timer(self, time.monotonic() + max(0.0, delay), callback, args)
+        with self.condition:
+            heapq.heappush(self.heap, (timer.when, next(self.sequence), timer))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+            elif self.heap[0][2] is timer:
+                # New earliest deadline, wake the thread to sleep less
+                self.condition.notify()
+        return timer
+
+    def cancel(self, timer):
+        # Timers that already fired are marked cancelled too, so this is a no-op for them
+        with self.condition:
+            if timer.cancelled:
+                return
+            timer.cancelled = True
+            self.cancelled_count += 1
+            if self.cancelled_count > 64 and self.cancelled_count * 2 > len(self.heap):
+                self.heap = [entry for entry in self.heap if not entry[2].cancelled]
+                heapq.heapify(self.heap)
+                self.cancelled_count = 0
+
+    def __len__(self):
+        with self.condition:
+            return len(self.heap) - self.cancelled_count
+
+    def next_due(self):
+        # Wait for the earliest timer and take it off the heap
+        with self.condition:
+            while True:
+                while self.heap and self.heap[0][2].cancelled:
+                    heapq.heappop(self.heap)
+                    self.cancelled_count -= 1
+
+                if not self.heap:
+                    self.condition.wait()
+                    continue
+
+                remaining = self.heap[0][0] - time.monotonic()
+                if remaining <= 0:
+                    timer = heapq.heappop(self.heap)[2]
+                    timer.cancelled = True
+                    return timer
+                self.condition.wait(remaining)
+
+    def run(self):
+        while True:
+            timer = self.next_due()
+            try:
+                timer.callback(*timer.args)
+            except Exception:
+                # A broken callback must not stop the timers of other games
+                traceback.print_exc()
+
+
+shared = None
+shared_lock = threading.Lock()
+
+
+def shared_scheduler():
+    # The scheduler used by every game engine in this process
+    global shared
+    with shared_lock:
+        if shared is None:
+            shared = TimerScheduler()
+        return shared
@@ -0,0 +1,48 @@
+from quiz.transport import OutboundQueue
+
+# Resuming a lost connection.
+#
+# Every WELCOME carries a session token (see quiz/protocol.py). When a
+# player's connection breaks, the engine does not remove them right away:
+# a DetachedConnection takes the place of the broken one and keeps what is
+# sent to them, and their score, their answer to the current question and
+# their place on the scoreboard stay as they are. If they connect again
+# within the grace window with the token in their HELLO, the new connection
+# takes over everything the DetachedConnection kept, without a rejoin or a
+# "player_left" for anyone else. Otherwise the player leaves once the window
+# is over, as if the connection had just closed.
+#
+# A detached player still counts as one who has not answered, so a round
+# waits for them until its time is up or their window is over.
+
+# Seconds a player whose connection broke can resume it (0: never)
+RESUME_GRACE = 20.0
+
+# Disconnect reasons a player can come back from; a protocol error, a slow
+# consumer or the server shutting down ends the session
+RESUMABLE_REASONS = ("closed", "error", "send_error", "timeout")
+
+
+# Stands in for the connection of a detached player: queues what the game
+# sends them until a new connection takes over the queue
+class DetachedConnection:
+    def __init__(self, conn):
+        # The broken connection; its last messages may still arrive
+        self.origin = conn
+        outbound = conn.outbound
+        self.outbound = OutboundQueue(outbound.max_bytes, outbound.policy)
+        self.outbound.put_items(outbound.take_items())
+        self.address = conn.address
+
+    def send(self, data, msg_type=None):
+        # Raises SlowConsumerError once the queue is full, which ends the session
+        self.outbound.put(data, msg_type)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def abort(self):
+        pass
@@ -0,0 +1,321 @@
+import bisect
+import hashlib
+import json
+import os
+import select
+import signal
+import socket
+import sys
+import threading
+import time
+import traceback
+
+from quiz.rooms import DEFAULT_ROOM
+from quiz.transport import LISTEN_BACKLOG
+
+# Supervisor mode: several worker processes behind one port, so a server
+# uses every core instead of one interpreter under the GIL.
+#
+# Every worker runs its own RoomManager (see quiz/rooms.py). With
+# SO_REUSEPORT each worker binds the port itself and the kernel spreads new
+# connections over the workers; without it the supervisor binds the port
+# and the workers accept from the inherited socket.
+#
+# A room must live in exactly one worker, so after the hello the accepting
+# worker looks up the room's owner on a consistent hash ring. Connections
+# for rooms it does not own are passed on, file descriptor and all, over
+# the owner's AF_UNIX datagram channel (socket.send_fds); the owner then
+# finishes the handshake as if it had accepted the connection itself.
+# Adding or removing a worker only moves the rooms of that worker.
+#
+# Workers report their numbers to the supervisor every second. The
+# supervisor logs a summary, restarts workers that died or stopped
+# reporting, and shuts everything down on SIGINT / SIGTERM.
+
+# Points per worker on the hash ring; more points spread rooms more evenly
+VIRTUAL_NODES = 64
+
+# Seconds between worker reports, and between supervisor summaries
+REPORT_INTERVAL = 1.0
+SUMMARY_INTERVAL = 10.0
+
+# A worker that has not reported for this long is restarted
+WORKER_TIMEOUT = 10.0
+
+# Largest handshake passed along with a connection
+MAX_HAND_OFF_BYTES = 64 * 1024
+
+
+def ring_hash(key):
+    # Stable across processes, unlike hash() with string hash randomization
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    def __init__(self, workers, virtual_nodes=VIRTUAL_NODES):
+        points = sorted((ring_hash(f"worker-{worker}-{i}"), worker)
+                        for worker in range(workers) for i in range(virtual_nodes))
+        self.hashes = [point for point, _ in points]
+        self.workers = [worker for _, worker in points]
+
+    def owner(self, key):
+        # First point clockwise from the key's hash
+        index = bisect.bisect(self.hashes, ring_hash(key)) % len(self.hashes)
+        return self.workers[index]
+
+
+# Passes accepted connections to one worker; any process may send, only
+# the owning worker receives
+class ConnectionChannel:
+    def __init__(self):
+        self.sender, self.receiver = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+
+    def send_connection(self, fd, address, data):
+        header = json.dumps({"address": list(address[:2])}).encode()
+        socket.send_fds(self.sender, [header + b"\n" + data], [fd])
+
+    def receive_connection(self):
+        # Returns (socket, address, handshake bytes)
+        message, fds, _, _ = socket.recv_fds(self.receiver, MAX_HAND_OFF_BYTES, 1)
+        header, data = message.split(b"\n", 1)
+        address = tuple(json.loads(header)["address"])
+        return socket.socket(fileno=fds[0]), address, data
+
+
+class Worker:
+    def __init__(self, index, port, ring, channels, report_socket, listen_socket):
+        self.index = index
+        self.port = port
+        self.ring = ring
+        self.channels = channels
+        self.report_socket = report_socket
+        # Inherited listening socket, None when workers use SO_REUSEPORT
+        self.listen_socket = listen_socket
+        self.handed_off = 0
+        self.adopted = 0
+
+    def owns(self, room):
+        return self.ring.owner(room) == self.index
+
+    def hand_off(self, room):
+        # Transport hook: None keeps the connection, otherwise a function
+        # that passes it to the worker owning the room
+        owner = self.ring.owner(room or DEFAULT_ROOM)
+        if owner == self.index:
+            return None
+        self.handed_off += 1
+        return self.channels[owner].send_connection
+
+    def start(self, transport, stats):
+        # transport.adopt() takes connections from other workers; stats() is
+        # the dict reported to the supervisor
+        threading.Thread(target=self.receive_connections, args=(transport,), daemon=True).start()
+        threading.Thread(target=self.report, args=(stats,), daemon=True).start()
+
+    def receive_connections(self, transport):
+        channel = self.channels[self.index]
+        while True:
+            try:
+                player_socket, address, data = channel.receive_connection()
+            except (OSError, ValueError):
+                continue
+            self.adopted += 1
+            transport.adopt(player_socket, address, data)
+
+    def report(self, stats):
+        while True:
+            report = dict(stats(), worker=self.index, pid=os.getpid(),
+                          handed_off=self.handed_off, adopted=self.adopted)
+            try:
+                self.report_socket.send(json.dumps(report).encode())
+            except OSError:
+                return
+            time.sleep(REPORT_INTERVAL)
+
+
+class Supervisor:
+    def __init__(self, workers, port, run_worker, games=0, backlog=LISTEN_BACKLOG, out=sys.stdout):
+        # run_worker(worker) runs in the forked child and returns its exit code
+        self.worker_count = workers
+        self.port = port
+        self.run_worker = run_worker
+        self.games = games
+        self.backlog = backlog
+        self.out = out
+        self.is_running = True
+
+        self.ring = HashRing(workers)
+        self.channels = [ConnectionChannel() for _ in range(workers)]
+        self.report_sockets = [socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM) for _ in range(workers)]
+        self.port_socket = None
+        self.listen_socket = None
+
+        # index -> pid, latest report and when it arrived
+        self.pids = {}
+        self.reports = {}
+        self.last_report = {}
+        # Games finished by workers that have been restarted since
+        self.retired_games = 0
+
+    def log(self, message):
+        print(f"{time.strftime('%H:%M:%S')} [supervisor] {message}", file=self.out, flush=True)
+
+    def stop(self, *args):
+        self.is_running = False
+
+    def bind(self):
+        if hasattr(socket, "SO_REUSEPORT"):
+            # Bound but never listening: reserves the port (and picks one for
+            # port 0) so the workers can all bind it with SO_REUSEPORT
+            self.port_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.port_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            self.port_socket.bind(('0.0.0.0', self.port))
+            self.port = self.port_socket.getsockname()[1]
+        else:
+            self.listen_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.listen_socket.bind(('0.0.0.0', self.port))
+            self.listen_socket.listen(self.backlog)
+            self.port = self.listen_socket.getsockname()[1]
+
+    def spawn(self, index):
+        worker = Worker(index, self.port, self.ring, self.channels, self.report_sockets[index][0], self.listen_socket)
+        pid = os.fork()
+        if pid == 0:
+            # Child: never return into the supervisor loop
+            code = 1
+            try:
+                signal.signal(signal.SIGINT, signal.SIG_DFL)
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                code = self.run_worker(worker)
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                sys.stdout.flush()
+                os._exit(code)
+
+        self.pids[index] = pid
+        self.last_report[index] = time.monotonic()
+        self.log(f"Worker {index} started (pid {pid})")
+
+    def run(self):
+        try:
+            self.bind()
+        except (socket.error, OSError) as e:
+            self.log("Could not start server: " + str(e))
+            return 1
+
+        mode = "SO_REUSEPORT" if self.listen_socket is None else "a shared listening socket"
+        self.log(f"--- Supervising {self.worker_count} workers on port {self.port} ({mode}) ---")
+        for index in range(self.worker_count):
+            self.spawn(index)
+
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+
+        next_summary = time.monotonic() + SUMMARY_INTERVAL
+        try:
+            while self.is_running:
+                self.read_reports(timeout=0.5)
+                self.check_workers()
+
+                if self.games and self.games_finished() >= self.games:
+                    self.log(f"{self.games_finished()} games finished.")
+                    break
+
+                if time.monotonic() >= next_summary:
+                    self.log_summary()
+                    next_summary = time.monotonic() + SUMMARY_INTERVAL
+        finally:
+            self.log_summary()
+            self.stop_workers()
+            self.log("--- Server stopped ---")
+        return 0
+
+    def read_reports(self, timeout):
+        receivers = {pair[1]: index for index, pair in enumerate(self.report_sockets)}
+        try:
+            readable, _, _ = select.select(list(receivers), [], [], timeout)
+        except InterruptedError:
+            return
+
+        for receiver in readable:
+            try:
+                report = json.loads(receiver.recv(65536))
+            except (OSError, ValueError):
+                continue
+            index = receivers[receiver]
+            # Drop late reports from a worker that has already been replaced
+            if report.get("pid") == self.pids.get(index):
+                self.reports[index] = report
+                self.last_report[index] = time.monotonic()
+
+    def check_workers(self):
+        # Restart workers that died or stopped reporting
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+
+            for index, worker_pid in list(self.pids.items()):
+                if worker_pid == pid:
+                    self.log(f"Worker {index} (pid {pid}) exited with status {os.waitstatus_to_exitcode(status)}.")
+                    self.retired_games += self.reports.pop(index, {}).get("games", 0)
+                    del self.pids[index]
+                    if self.is_running:
+                        self.spawn(index)
+
+        now = time.monotonic()
+        for index, pid in list(self.pids.items()):
+            if now - self.last_report[index] > WORKER_TIMEOUT:
+                self.log(f"Worker {index} (pid {pid}) stopped reporting. Restarting it.")
+                self.last_report[index] = now
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+
+    def games_finished(self):
+        return self.retired_games + sum(report.get("games", 0) for report in self.reports.values())
+
+    def log_summary(self):
+        reports = [self.reports[index] for index in sorted(self.reports)]
+        total = {key: sum(report.get(key, 0) for report in reports)
+                 for key in ("rooms", "players", "handed_off", "adopted")}
+        self.log(f"Workers {len(self.pids)}/{self.worker_count} up: {total['rooms']} rooms, "
+                 f"{total['players']} players, {self.games_finished()} games finished, "
+                 f"{total['handed_off']} connections handed off")
+        for report in reports:
+            self.log(f"  worker {report['worker']} (pid {report['pid']}): {report.get('rooms', 0)} rooms, "
+                     f"{report.get('players', 0)} players, {report.get('games', 0)} games")
+
+    def stop_workers(self):
+        for pid in self.pids.values():
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+        deadline = time.monotonic() + 5.0
+        while self.pids and time.monotonic() < deadline:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                time.sleep(0.05)
+                continue
+            for index, worker_pid in list(self.pids.items()):
+                if worker_pid == pid:
+                    del self.pids[index]
+
+        for pid in self.pids.values():
+            # Did not stop in time
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        self.pids.clear()
+
@@ -0,0 +1,127 @@
+import threading
+import time
+import traceback
+
+from quiz.scheduler import shared_scheduler
+
+# Hashed timer wheel for the connection heartbeats.
+#
+# Thousands of connections each need a deadline that moves every time the
+# player sends something. A heap would pay O(log n) for every move; the
+# wheel instead has a ring of slots, one per tick, and a timer goes into the
+# slot its deadline falls in, so adding and cancelling are O(1). Deadlines
+# further away than one turn of the ring wait in their slot for the turns
+# still to come.
+#
+# The wheel does not move deadlines at all: a heartbeat timer fires at the
+# old deadline, finds that the player was active since and sets a new one
+# (see transport.Heartbeat). So a busy connection costs a single timer per
+# heartbeat interval, not one per message.
+#
+# The ticks are a single timer on the shared scheduler (quiz/scheduler.py),
+# running only while the wheel has timers, and the callbacks run on the
+# scheduler thread: they must be short.
+
+# Seconds per slot; deadlines are rounded up to the next tick
+WHEEL_TICK = 0.5
+WHEEL_SLOTS = 512
+
+
+class WheelTimer:
+    __slots__ = ("wheel", "tick", "callback", "args", "cancelled")
+
+    def __init__(self, wheel, tick, callback, args):
+        self.wheel = wheel
+        # Tick the timer is due at
+        self.tick = tick
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.wheel.cancel(self)
+
+
+class TimerWheel:
+    def __init__(self, tick=WHEEL_TICK, slots=WHEEL_SLOTS, scheduler=None):
+        self.tick = tick
+        self.slots = [set() for _ in range(slots)]
+        self.lock = threading.Lock()
+        self.scheduler = scheduler or shared_scheduler()
+        self.started = time.monotonic()
+        # Last tick whose slot was run
+        self.current = 0
+        self.count = 0
+        self.ticking = False
+
+    def now_tick(self):
+        return int((time.monotonic() - self.started) / self.tick)
+
+    def call_later(self, delay, callback, *args):
+        with self.lock:
+            if not self.count:
+                # Nothing to catch up on after an idle spell
+                self.current = self.now_tick()
+            # Never in the slot that is being run, so at least one tick away
+            tick = max(self.current + 1, self.now_tick() + 1 + int(max(0.0, delay) / self.tick))
+            timer = WheelTimer(self, tick, callback, args)
+            self.slots[tick % len(self.slots)].add(timer)
+            self.count += 1
+            if not self.ticking:
+                self.ticking = True
+                self.scheduler.call_later(self.tick, self.advance)
+        return timer
+
+    def cancel(self, timer):
+        with self.lock:
+            if timer.cancelled:
+                return
+            timer.cancelled = True
+            self.slots[timer.tick % len(self.slots)].discard(timer)
+            self.count -= 1
+
+    def __len__(self):
+        return self.count
+
+    def advance(self):
+        # Scheduler thread: runs every slot up to now, catching up on ticks
+        # that came late
+        due = []
+        with self.lock:
+            now = self.now_tick()
+            while self.current < now:
+                self.current += 1
+                slot = self.slots[self.current % len(self.slots)]
+                ready = [timer for timer in slot if timer.tick <= self.current]
+                for timer in ready:
+                    slot.discard(timer)
+                    timer.cancelled = True
+                due.extend(ready)
+                # Every timer left is due: skip the empty ticks up to now
+                if self.count == len(due):
+                    self.current = now
+                    break
+            self.count -= len(due)
+            self.ticking = self.count > 0
+            if self.ticking:
+                self.scheduler.call_later(self.tick, self.advance)
+
+        for timer in due:
+            try:
+                timer.callback(*timer.args)
+            except Exception:
+                # A broken callback must not stop the other timers
+                traceback.print_exc()
+
+
+shared = None
+shared_lock = threading.Lock()
+
+
+def shared_wheel():
+    # The timer wheel used by every transport in this process
+    global shared
+    with shared_lock:
+        if shared is None:
+            shared = TimerWheel()
+        return shared
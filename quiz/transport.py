@@ -0,0 +1,1033 @@
+import asyncio
+import concurrent.futures
+import selectors
+import socket
+import threading
+import time
+import traceback
+from collections import OrderedDict, deque
+
+from quiz import metrics
+from quiz.protocol import (
+    ERROR, HELLO, MAX_CLIENT_FRAME_SIZE, PING, PONG, PROTOCOL_VERSION, SCOREBOARD, FrameDecoder, FrameTooLargeError,
+    ProtocolError, encode_message, encode_welcome, new_session_token, parse_hello,
+)
+from quiz.ratelimit import BYTE_RATE, FLOOD_LIMIT, MESSAGE_BURST, MESSAGE_RATE, InboundLimiter
+from quiz.timerwheel import shared_wheel
+
+# Network transports for the quiz server.
+#
+# A transport owns the listening socket and the per-player connections, and
+# drives the game through a small "host" interface implemented by the server:
+#   host.check_new_player(name, room, resume)   -> rejection reason, or None to accept
+#   host.add_player(conn, name, address, room, session, resume)
+#   host.handle_player_message(conn, name, msg_type, body)
+#   host.remove_player(conn, reason)     reason: "closed", "error", "protocol", "oversized", "flood"
+#                                        or "timeout"
+#
+# Transports run the protocol handshake (HELLO -> WELCOME / ERROR) and decode
+# frames, so the host only ever sees whole, typed messages. Handshakes never
+# hold up the accept loop: the threaded transport reads every pending hello
+# on one HandshakePipeline thread, the asyncio transport in the connection's
+# coroutine. Each pending connection has handshake_timeout seconds from the
+# moment its handshake starts; at most max_handshakes run at once, and the
+# connections beyond that wait in the listen backlog. Transports count
+# handshakes and received messages in quiz/metrics.py. Every WELCOME carries
+# a new session token; add_player gets it as session, and resume is the
+# token the client sent back to take over a lost connection (or None).
+#
+# Connections handed to the host only expose send(data, msg_type), flush()
+# and close(), so the game logic does not care which transport is running.
+# send() never blocks: the encoded message (the same bytes object for every
+# player of a broadcast) goes into the player's bounded OutboundQueue.
+# Nothing is written before flush(): then a writer takes everything queued
+# and writes it with one system call (sendmsg, or one buffered write on
+# asyncio), so all a game step sends a player leaves in one TCP segment
+# where it fits. close() lets queued messages go out first. Player sockets
+# have TCP_NODELAY set, so a flushed batch is not held back by Nagle.
+#
+# A peer that vanished without closing its connection (a dropped Wi-Fi, a
+# suspended laptop) would otherwise sit in a blocking recv() forever and
+# keep its place in the game. Heartbeat pings a connection that has been
+# silent for heartbeat_interval seconds and drops it as "timeout" once it
+# has been silent for heartbeat_timeout; every message from the peer counts,
+# the client answers a ping with PONG. The deadlines live on the shared
+# timer wheel (quiz/timerwheel.py). keepalive additionally lets the OS probe
+# idle connections (SO_KEEPALIVE) after that many seconds.
+#
+# Each player's reader goes through an InboundLimiter (quiz/ratelimit.py):
+# reads beyond byte_rate pause the reader, messages beyond message_rate are
+# dropped, and flood_limit dropped messages close the connection. Frames
+# larger than max_frame_size close it as well.
+#
+# Several server processes can share one port (see quiz/supervisor.py):
+# reuse_port binds with SO_REUSEPORT, listen_socket serves an inherited
+# listening socket, and hand_off(room) may return a function that takes over
+# a connection right after its hello: it gets the socket's file descriptor,
+# the peer address and the handshake bytes, and another process continues
+# with adopt().
+
+# Pending connections the OS queues before accept() picks them up, so a
+# whole class joining at once is not turned away; the OS caps it at its own
+# limit (net.core.somaxconn on Linux)
+LISTEN_BACKLOG = 1024
+
+# Seconds a new connection has to complete its hello message
+HANDSHAKE_TIMEOUT = 1.0
+
+# Handshakes in progress at once
+MAX_HANDSHAKES = 256
+
+RECV_SIZE = 1024
+
+# Buffers handed to one sendmsg() call, below the usual IOV_MAX
+MAX_SEND_BUFFERS = 512
+
+# Bytes of encoded messages a player may have waiting before the
+# slow-consumer policy applies
+SEND_QUEUE_BYTES = 256 * 1024
+
+# What to do when a player's queue is full:
+#   coalesce - a new scoreboard replaces the ones still waiting; drop the
+#              player if that does not free enough room
+#   drop     - disconnect the player right away
+COALESCE_SLOW_CONSUMER = "coalesce"
+DROP_SLOW_CONSUMER = "drop"
+SLOW_CONSUMER_POLICIES = (COALESCE_SLOW_CONSUMER, DROP_SLOW_CONSUMER)
+
+# Only the newest of these is worth delivering to a lagging player
+COALESCED_MESSAGES = (SCOREBOARD,)
+
+# Seconds of silence before a connection is pinged, and before it is
+# dropped (0: no heartbeats)
+HEARTBEAT_INTERVAL = 10.0
+HEARTBEAT_TIMEOUT = 30.0
+
+# Seconds of silence before the OS sends TCP keepalive probes (0: off)
+TCP_KEEPALIVE = 0
+
+PING_MESSAGE = encode_message(PING, {})
+
+def rejection_message(reason):
+    return encode_message(ERROR, {"reason": reason})
+
+
+async def read_hello_async(reader, data=b"", max_frame_size=MAX_CLIENT_FRAME_SIZE):
+    # Reads up to the hello; data is what was already read from the stream
+    # elsewhere. Returns (Hello, decoder, messages that arrived after the
+    # hello). The caller applies the deadline.
+    decoder = FrameDecoder(max_frame_size)
+    messages = decoder.feed(data)
+    if messages:
+        return parse_hello(*messages[0]), decoder, messages[1:]
+
+    while True:
+        data = await reader.read(RECV_SIZE)
+        if not data:
+            raise ConnectionResetError("Closed during handshake")
+
+        messages = decoder.feed(data)
+        if messages:
+            return parse_hello(*messages[0]), decoder, messages[1:]
+
+
+def set_nodelay(sock):
+    # Not available on every socket type, e.g. socketpairs in tests
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except (socket.error, OSError):
+        pass
+
+
+def set_keepalive(sock, idle):
+    # Probe every idle / 3 seconds after idle seconds, give up after 3
+    # unanswered probes; the timing options are not available everywhere
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        if hasattr(socket, "TCP_KEEPIDLE"):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, max(1, int(idle)))
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, max(1, int(idle) // 3))
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3)
+    except (socket.error, OSError):
+        pass
+
+
+def send_batch(sock, batch):
+    # Writes every buffer of batch, in order, on a blocking socket; returns
+    # the number of system calls it took
+    if not hasattr(sock, "sendmsg"):
+        # Windows: one buffer, written by sendall()
+        sock.sendall(b"".join(batch))
+        return 1
+
+    buffers = [memoryview(data) for data in batch]
+    first = 0
+    writes = 0
+    while first < len(buffers):
+        sent = sock.sendmsg(buffers[first:first + MAX_SEND_BUFFERS])
+        writes += 1
+
+        # Skip what went out; a partly sent buffer continues where it stopped
+        while first < len(buffers) and sent >= len(buffers[first]):
+            sent -= len(buffers[first])
+            first += 1
+        if sent:
+            buffers[first] = buffers[first][sent:]
+    return writes
+
+
+def handshake_bytes(hello, decoder, pending):
+    # Everything read so far, re-encoded for the process that adopts the connection
+    body = {"version": PROTOCOL_VERSION, "username": hello.username}
+    if hello.room is not None:
+        body["room"] = hello.room
+    if hello.session is not None:
+        body["session"] = hello.session
+    data = encode_message(HELLO, body)
+    data += b"".join(encode_message(msg_type, body) for msg_type, body in pending)
+    return data + bytes(decoder.buffer)
+
+
+class SlowConsumerError(ConnectionError):
+    pass
+
+
+# Liveness checks for the connections of one transport, one wheel timer per
+# connection. Timers are not moved when data arrives: the reader only notes
+# the time in conn.last_seen, and the timer looks at it when it fires.
+class Heartbeat:
+    def __init__(self, host, interval=HEARTBEAT_INTERVAL, timeout=HEARTBEAT_TIMEOUT, wheel=None):
+        self.host = host
+        self.interval = interval
+        self.timeout = max(timeout, interval)
+        self.wheel = wheel or shared_wheel()
+        self.is_running = interval > 0
+
+    def watch(self, conn):
+        conn.last_seen = time.monotonic()
+        if self.is_running:
+            self.wheel.call_later(self.interval, self.check, conn)
+
+    def stop(self):
+        # Timers still on the wheel find this and do nothing
+        self.is_running = False
+
+    def check(self, conn):
+        # Scheduler thread
+        if not self.is_running or conn.is_closing:
+            return
+
+        silent = time.monotonic() - conn.last_seen
+        if silent < self.interval:
+            # Heard from since the last check
+            self.wheel.call_later(self.interval - silent, self.check, conn)
+            return
+
+        if silent >= self.timeout:
+            metrics.heartbeat_timeouts.inc()
+            self.host.remove_player(conn, "timeout")
+            conn.abort()
+            return
+
+        try:
+            conn.send(PING_MESSAGE, PING)
+            conn.flush()
+            metrics.pings_sent.inc()
+        except (socket.error, OSError):
+            # Full queue or closed connection: the next check or the reader deals with it
+            pass
+        self.wheel.call_later(self.timeout - silent, self.check, conn)
+
+
+# Bounded FIFO of encoded messages waiting to be written to one player
+class OutboundQueue:
+    def __init__(self, max_bytes=SEND_QUEUE_BYTES, policy=COALESCE_SLOW_CONSUMER):
+        self.items = deque()
+        self.size = 0
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.lock = threading.Lock()
+
+    def put(self, data, msg_type=None):
+        # Raises SlowConsumerError when the player cannot keep up
+        with self.lock:
+            # A single message is always accepted, however big it is
+            if self.items and self.size + len(data) > self.max_bytes:
+                if self.policy == COALESCE_SLOW_CONSUMER and msg_type in COALESCED_MESSAGES:
+                    self.discard_pending(msg_type)
+
+                if self.items and self.size + len(data) > self.max_bytes:
+                    raise SlowConsumerError(f"Outbound queue full ({self.size} bytes pending)")
+
+            self.items.append((msg_type, data))
+            self.size += len(data)
+
+    def discard_pending(self, msg_type):
+        if any(item_type == msg_type for item_type, _ in self.items):
+            self.items = deque(item for item in self.items if item[0] != msg_type)
+            self.size = sum(len(data) for _, data in self.items)
+
+    def take_items(self):
+        # (msg_type, data) of everything waiting, for a queue that continues
+        # where this one stopped
+        with self.lock:
+            items = list(self.items)
+            self.items.clear()
+            self.size = 0
+        return items
+
+    def put_items(self, items):
+        for msg_type, data in items:
+            self.put(data, msg_type)
+
+    def pop_all(self):
+        with self.lock:
+            batch = [data for _, data in self.items]
+            self.items.clear()
+            self.size = 0
+        return batch
+
+    def is_empty(self):
+        return not self.items
+
+
+# A connection whose hello is still being read
+class PendingHandshake:
+    __slots__ = ("sock", "address", "decoder", "deadline", "may_hand_off")
+
+    def __init__(self, sock, address, deadline, may_hand_off, max_frame_size):
+        self.sock = sock
+        self.address = address
+        self.decoder = FrameDecoder(max_frame_size)
+        self.deadline = deadline
+        self.may_hand_off = may_hand_off
+
+
+# One thread reading the hellos of all new connections of a threaded
+# transport from non-blocking sockets, so a silent client only costs its
+# own deadline. Every handshake gets the same timeout, so the pending ones
+# expire in the order they started and the oldest is always first.
+# finish(sock, address, hello, decoder, pending, may_hand_off) runs on this
+# thread once a hello is complete, with the socket blocking again.
+class HandshakePipeline:
+    def __init__(self, finish, timeout=HANDSHAKE_TIMEOUT, max_pending=MAX_HANDSHAKES,
+                 max_frame_size=MAX_CLIENT_FRAME_SIZE):
+        self.finish = finish
+        self.timeout = timeout
+        self.max_frame_size = max_frame_size
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.selector = selectors.DefaultSelector()
+        # New connections come in through a queue, with a byte on the wakeup socket
+        self.incoming = deque()
+        self.wakeup_reader, self.wakeup_writer = socket.socketpair()
+        self.wakeup_reader.setblocking(False)
+        self.wakeup_writer.setblocking(False)
+        self.selector.register(self.wakeup_reader, selectors.EVENT_READ)
+        # sock -> PendingHandshake, oldest first
+        self.pending = OrderedDict()
+        self.is_running = False
+        self.thread = None
+
+    def start(self):
+        self.is_running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.is_running = False
+        self.wake()
+
+    def wake(self):
+        try:
+            self.wakeup_writer.send(b"\0")
+        except (BlockingIOError, OSError):
+            # Already woken, or stopped
+            pass
+
+    def submit(self, sock, address, data=b"", may_hand_off=True):
+        # Blocks while max_pending handshakes are in progress
+        while not self.slots.acquire(timeout=0.5):
+            if not self.is_running:
+                sock.close()
+                return
+        metrics.handshakes_pending.inc()
+        self.incoming.append((sock, address, data, may_hand_off))
+        self.wake()
+
+    def run(self):
+        try:
+            while self.is_running:
+                timeout = None
+                if self.pending:
+                    oldest = next(iter(self.pending.values()))
+                    timeout = max(0.0, oldest.deadline - time.monotonic())
+
+                for key, _ in self.selector.select(timeout):
+                    if key.data is None:
+                        self.take_incoming()
+                    else:
+                        self.read(key.data)
+                self.expire()
+        finally:
+            for handshake in list(self.pending.values()):
+                self.done(handshake)
+                handshake.sock.close()
+            while self.incoming:
+                self.incoming.popleft()[0].close()
+                self.release()
+            self.selector.close()
+            self.wakeup_reader.close()
+            self.wakeup_writer.close()
+
+    def take_incoming(self):
+        try:
+            while self.wakeup_reader.recv(RECV_SIZE):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+        while self.incoming:
+            sock, address, data, may_hand_off = self.incoming.popleft()
+            handshake = PendingHandshake(sock, address, time.monotonic() + self.timeout, may_hand_off,
+                                         self.max_frame_size)
+            try:
+                sock.setblocking(False)
+                self.pending[sock] = handshake
+                self.selector.register(sock, selectors.EVENT_READ, handshake)
+            except (ValueError, OSError):
+                # Closed in the meantime
+                self.pending.pop(sock, None)
+                self.release()
+                sock.close()
+                continue
+            if data:
+                self.received(handshake, data)
+
+    def read(self, handshake):
+        try:
+            data = handshake.sock.recv(RECV_SIZE)
+        except BlockingIOError:
+            return
+        except (socket.error, OSError):
+            data = b""
+
+        if not data:
+            metrics.connections_rejected.labels("error").inc()
+            self.done(handshake)
+            handshake.sock.close()
+            return
+        self.received(handshake, data)
+
+    def received(self, handshake, data):
+        try:
+            messages = handshake.decoder.feed(data)
+            if not messages:
+                return
+            hello = parse_hello(*messages[0])
+        except ProtocolError as e:
+            self.done(handshake)
+            metrics.connections_rejected.labels("protocol").inc()
+            self.reject(handshake.sock, str(e))
+            return
+
+        self.done(handshake)
+        sock = handshake.sock
+        try:
+            # Blocking again; the timeout only guards the few bytes the
+            # server writes before the player's writer thread takes over
+            sock.settimeout(self.timeout)
+        except OSError:
+            sock.close()
+            return
+
+        try:
+            self.finish(sock, handshake.address, hello, handshake.decoder, messages[1:], handshake.may_hand_off)
+        except Exception:
+            # A broken connection must not stop the handshakes of the others
+            traceback.print_exc()
+            sock.close()
+
+    def reject(self, sock, reason):
+        try:
+            sock.settimeout(self.timeout)
+            sock.sendall(rejection_message(reason))
+        except (socket.error, OSError):
+            pass
+        sock.close()
+
+    def expire(self):
+        now = time.monotonic()
+        while self.pending:
+            oldest = next(iter(self.pending.values()))
+            if oldest.deadline > now:
+                break
+            metrics.connections_rejected.labels("timeout").inc()
+            self.done(oldest)
+            oldest.sock.close()
+
+    def done(self, handshake):
+        # The handshake is no longer pending, its socket is still open
+        if self.pending.pop(handshake.sock, None) is not None:
+            try:
+                self.selector.unregister(handshake.sock)
+            except (KeyError, ValueError):
+                pass
+            self.release()
+
+    def release(self):
+        metrics.handshakes_pending.dec()
+        self.slots.release()
+
+
+# Connection backed by a blocking socket: a reader thread owned by the
+# transport and a writer thread draining the outbound queue
+class ThreadedConnection:
+    def __init__(self, sock, address, outbound):
+        self.sock = sock
+        self.address = address
+        self.outbound = outbound
+        self.is_closing = False
+        # monotonic() of the last data from the peer, see Heartbeat
+        self.last_seen = time.monotonic()
+        self.has_data = threading.Event()
+        self.writer_thread = threading.Thread(target=self.write_loop, daemon=True)
+        self.writer_thread.start()
+
+    def send(self, data, msg_type=None):
+        if self.is_closing:
+            raise ConnectionResetError("Connection is closed")
+        self.outbound.put(data, msg_type)
+
+    def flush(self):
+        # Wakes the writer for everything sent so far
+        self.has_data.set()
+
+    def close(self):
+        if self.is_closing:
+            return
+        self.is_closing = True
+
+        # Wake the reader thread now; the writer closes the socket once drained
+        try:
+            self.sock.shutdown(socket.SHUT_RD)
+        except (socket.error, OSError):
+            pass
+        self.has_data.set()
+
+    def abort(self):
+        # Drops the connection without writing what is queued; also wakes a
+        # writer stuck on a peer that stopped reading
+        self.is_closing = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except (socket.error, OSError):
+            pass
+        self.has_data.set()
+
+    def write_loop(self):
+        while True:
+            self.has_data.wait()
+            self.has_data.clear()
+
+            try:
+                batch = self.outbound.pop_all()
+                if batch:
+                    metrics.socket_writes.inc(send_batch(self.sock, batch))
+            except (socket.error, OSError):
+                # Peer is gone; wake the reader so the host removes the player
+                self.is_closing = True
+                try:
+                    self.sock.shutdown(socket.SHUT_RDWR)
+                except (socket.error, OSError):
+                    pass
+                break
+
+            if self.is_closing and self.outbound.is_empty():
+                break
+
+        self.sock.close()
+
+
+# One accept thread plus a reader and a writer thread per connected player
+class ThreadedTransport:
+    name = "threaded"
+
+    def __init__(self, host, backlog=LISTEN_BACKLOG, send_queue_bytes=SEND_QUEUE_BYTES,
+                 slow_consumer=COALESCE_SLOW_CONSUMER, reuse_port=False, listen_socket=None, hand_off=None,
+                 heartbeat_interval=HEARTBEAT_INTERVAL, heartbeat_timeout=HEARTBEAT_TIMEOUT, keepalive=TCP_KEEPALIVE,
+                 handshake_timeout=HANDSHAKE_TIMEOUT, max_handshakes=MAX_HANDSHAKES,
+                 max_frame_size=MAX_CLIENT_FRAME_SIZE, message_rate=MESSAGE_RATE, message_burst=MESSAGE_BURST,
+                 byte_rate=BYTE_RATE, flood_limit=FLOOD_LIMIT):
+        self.host = host
+        self.backlog = backlog
+        self.send_queue_bytes = send_queue_bytes
+        self.slow_consumer = slow_consumer
+        self.reuse_port = reuse_port
+        self.listen_socket = listen_socket
+        self.hand_off = hand_off
+        self.heartbeat = Heartbeat(host, heartbeat_interval, heartbeat_timeout)
+        self.keepalive = keepalive
+        self.handshakes = HandshakePipeline(self.welcome, handshake_timeout, max_handshakes, max_frame_size)
+        # Arguments of each connection's InboundLimiter
+        self.limits = (message_rate, message_burst, byte_rate, flood_limit)
+        self.server_socket = None
+        self.port = None
+        self.is_running = False
+        self.thread = None
+        self.connections = set()
+
+    def start(self, port):
+        if self.listen_socket is not None:
+            # Shared with other processes: shutdown() would stop them too, so
+            # the accept loop polls is_running instead
+            self.server_socket = self.listen_socket
+            self.server_socket.settimeout(0.5)
+        else:
+            self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            try:
+                if self.reuse_port:
+                    self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+                # Bind to all interfaces so clients on the same network can connect
+                self.server_socket.bind(('0.0.0.0', port))
+                self.server_socket.listen(self.backlog)
+            except (socket.error, OSError):
+                self.server_socket.close()
+                raise
+
+        self.port = self.server_socket.getsockname()[1]
+        self.is_running = True
+        self.handshakes.start()
+        self.thread = threading.Thread(target=self.accept_connections, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if not self.is_running:
+            return
+        self.is_running = False
+        self.heartbeat.stop()
+        self.handshakes.stop()
+
+        # shutdown() wakes up the accept thread, close() alone does not on Linux
+        if self.listen_socket is None:
+            try:
+                self.server_socket.shutdown(socket.SHUT_RDWR)
+            except (socket.error, OSError):
+                pass
+        self.server_socket.close()
+
+        # Writer threads are daemons: give them a moment to flush what the
+        # host sent last (final scoreboard, game ended) before the process exits
+        deadline = time.monotonic() + 1.0
+        for conn in list(self.connections):
+            conn.writer_thread.join(max(0.0, deadline - time.monotonic()))
+
+    def accept_connections(self):
+        # Accept incoming player connections while the transport is running
+        while self.is_running:
+            try:
+                player_socket, player_address = self.server_socket.accept()
+            except socket.timeout:
+                continue
+            except (socket.error, OSError):
+                break
+
+            self.admit(player_socket, player_address)
+
+    def adopt(self, player_socket, player_address, data):
+        # A connection handed over by another process, with the bytes it read
+        self.admit(player_socket, player_address, data, may_hand_off=False)
+
+    def admit(self, player_socket, player_address, data=b"", may_hand_off=True):
+        # The hello is read on the handshake thread; blocks while too many
+        # handshakes are in progress
+        set_nodelay(player_socket)
+        if self.keepalive > 0:
+            set_keepalive(player_socket, self.keepalive)
+        self.handshakes.submit(player_socket, player_address, data, may_hand_off)
+
+    def welcome(self, player_socket, player_address, hello, decoder, pending, may_hand_off):
+        # Handshake thread, once the hello arrived
+        try:
+            take_over = self.hand_off(hello.room) if self.hand_off and may_hand_off else None
+            if take_over is not None:
+                take_over(player_socket.fileno(), player_address, handshake_bytes(hello, decoder, pending))
+                player_socket.close()
+                return
+
+            reason = self.host.check_new_player(hello.username, hello.room, hello.session)
+            if reason:
+                metrics.connections_rejected.labels("refused").inc()
+                player_socket.sendall(rejection_message(reason))
+                player_socket.close()
+                return
+
+            session = new_session_token()
+            player_socket.sendall(encode_welcome(session))
+            player_socket.settimeout(None)
+        except (socket.error, OSError):
+            # A slow or broken client only loses its own connection
+            metrics.connections_rejected.labels("error").inc()
+            player_socket.close()
+            return
+
+        metrics.connections_accepted.inc()
+
+        conn = ThreadedConnection(player_socket, player_address,
+                                  OutboundQueue(self.send_queue_bytes, self.slow_consumer))
+        self.connections.add(conn)
+        self.host.add_player(conn, hello.username, player_address, hello.room, session, hello.session)
+        self.heartbeat.watch(conn)
+
+        # Start a thread for this player
+        player_thread = threading.Thread(target=self.handle_player, args=(conn, hello.username, decoder, pending),
+                                         daemon=True)
+        player_thread.start()
+
+    def handle_player(self, conn, name, decoder, pending):
+        try:
+            self.read_player(conn, name, decoder, pending)
+        finally:
+            self.connections.discard(conn)
+
+    def read_player(self, conn, name, decoder, pending):
+        # Listen for messages from a specific player
+        limiter = InboundLimiter(*self.limits)
+        messages = limiter.admit(pending)
+        while self.is_running:
+            for msg_type, body in messages:
+                # A PONG only proves the connection is alive
+                if msg_type != PONG:
+                    self.host.handle_player_message(conn, name, msg_type, body)
+            if limiter.is_flooding():
+                self.host.remove_player(conn, "flood")
+                break
+
+            try:
+                data = conn.sock.recv(RECV_SIZE)
+                if not data:
+                    # Empty read means the player disconnected
+                    self.host.remove_player(conn, "closed")
+                    break
+                conn.last_seen = time.monotonic()
+                pause = limiter.pause_for(len(data))
+                if pause:
+                    time.sleep(pause)
+                messages = limiter.admit(decoder.feed(data))
+            except FrameTooLargeError:
+                self.host.remove_player(conn, "oversized")
+                break
+            except ProtocolError:
+                self.host.remove_player(conn, "protocol")
+                break
+            except (socket.error, OSError):
+                self.host.remove_player(conn, "error")
+                break
+            if messages:
+                metrics.messages_received.inc(len(messages))
+
+
+# Connection backed by an asyncio stream; send(), flush() and close() are
+# safe from any thread, write_out() runs on the loop thread
+class AsyncioConnection:
+    def __init__(self, transport, writer, address, outbound):
+        self.transport = transport
+        self.writer = writer
+        self.address = address
+        self.outbound = outbound
+        self.is_closing = False
+        self.last_seen = time.monotonic()
+        self.waiting_for_drain = False
+
+    def send(self, data, msg_type=None):
+        if self.is_closing or self.writer.is_closing():
+            raise ConnectionResetError("Connection is closed")
+        self.outbound.put(data, msg_type)
+
+    def flush(self):
+        self.transport.schedule_flush(self)
+
+    def close(self):
+        if self.is_closing:
+            return
+        self.is_closing = True
+        self.transport.schedule_flush(self)
+
+    def abort(self):
+        # Drops the connection without writing what is queued
+        self.is_closing = True
+        try:
+            self.transport.loop.call_soon_threadsafe(self.writer.transport.abort)
+        except RuntimeError:
+            # Loop already closed
+            pass
+
+    def write_out(self):
+        # Loop thread: everything queued goes into the stream in one write
+        if self.writer.is_closing():
+            return
+
+        if self.waiting_for_drain:
+            # Kernel and stream buffers are full; messages stay queued (and
+            # coalescable) until the peer reads. A closing slow peer is cut off.
+            if self.is_closing:
+                self.writer.transport.abort()
+            return
+
+        batch = self.outbound.pop_all()
+        if batch:
+            self.writer.writelines(batch)
+            metrics.socket_writes.inc()
+
+        if self.is_closing:
+            # Closes once the stream buffer has been written out
+            self.writer.close()
+        elif self.writer.transport.get_write_buffer_size() > self.outbound.max_bytes:
+            self.waiting_for_drain = True
+            self.transport.loop.create_task(self.wait_for_drain())
+
+    async def wait_for_drain(self):
+        try:
+            await self.writer.drain()
+        except (ConnectionError, OSError):
+            pass
+        self.waiting_for_drain = False
+        self.write_out()
+
+
+# A single event loop thread serving every player with one coroutine each.
+# Game logic triggered by players runs on the loop thread itself.
+class AsyncioTransport:
+    name = "asyncio"
+
+    def __init__(self, host, backlog=LISTEN_BACKLOG, send_queue_bytes=SEND_QUEUE_BYTES,
+                 slow_consumer=COALESCE_SLOW_CONSUMER, reuse_port=False, listen_socket=None, hand_off=None,
+                 heartbeat_interval=HEARTBEAT_INTERVAL, heartbeat_timeout=HEARTBEAT_TIMEOUT, keepalive=TCP_KEEPALIVE,
+                 handshake_timeout=HANDSHAKE_TIMEOUT, max_handshakes=MAX_HANDSHAKES,
+                 max_frame_size=MAX_CLIENT_FRAME_SIZE, message_rate=MESSAGE_RATE, message_burst=MESSAGE_BURST,
+                 byte_rate=BYTE_RATE, flood_limit=FLOOD_LIMIT):
+        self.host = host
+        self.backlog = backlog
+        self.send_queue_bytes = send_queue_bytes
+        self.slow_consumer = slow_consumer
+        self.reuse_port = reuse_port
+        self.listen_socket = listen_socket
+        self.hand_off = hand_off
+        self.heartbeat = Heartbeat(host, heartbeat_interval, heartbeat_timeout)
+        self.keepalive = keepalive
+        self.handshake_timeout = handshake_timeout
+        self.max_handshakes = max_handshakes
+        self.max_frame_size = max_frame_size
+        # Arguments of each connection's InboundLimiter
+        self.limits = (message_rate, message_burst, byte_rate, flood_limit)
+        # Created on the loop thread
+        self.handshake_slots = None
+        self.loop = None
+        self.loop_thread_id = None
+        self.server = None
+        self.writers = set()
+
+        # Connections with queued output, flushed together in one loop callback
+        self.dirty = set()
+        self.dirty_lock = threading.Lock()
+        self.flush_scheduled = False
+        self.port = None
+        self.is_running = False
+        self.thread = None
+
+    def start(self, port):
+        self.loop = asyncio.new_event_loop()
+        started = concurrent.futures.Future()
+        self.thread = threading.Thread(target=self.run_loop, args=(port, started), daemon=True)
+        self.thread.start()
+
+        # Re-raises bind errors in the caller's thread, like ThreadedTransport
+        started.result()
+
+    def stop(self):
+        if not self.is_running:
+            return
+        self.is_running = False
+        self.heartbeat.stop()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=2.0)
+
+    def schedule_flush(self, conn):
+        with self.dirty_lock:
+            self.dirty.add(conn)
+            if self.flush_scheduled:
+                return
+            self.flush_scheduled = True
+
+        # One wakeup per batch of sends, not one per player
+        try:
+            if threading.get_ident() == self.loop_thread_id:
+                self.loop.call_soon(self.flush_dirty)
+            else:
+                self.loop.call_soon_threadsafe(self.flush_dirty)
+        except RuntimeError:
+            # Loop already closed; the connection is gone anyway
+            pass
+
+    def flush_dirty(self):
+        with self.dirty_lock:
+            dirty = self.dirty
+            self.dirty = set()
+            self.flush_scheduled = False
+
+        for conn in dirty:
+            conn.write_out()
+
+    def run_loop(self, port, started):
+        asyncio.set_event_loop(self.loop)
+        self.loop_thread_id = threading.get_ident()
+        self.handshake_slots = asyncio.Semaphore(self.max_handshakes)
+
+        try:
+            if self.listen_socket is not None:
+                server = asyncio.start_server(self.handle_client, sock=self.listen_socket, backlog=self.backlog)
+            else:
+                server = asyncio.start_server(self.handle_client, '0.0.0.0', port, backlog=self.backlog,
+                                              reuse_port=self.reuse_port or None)
+            self.server = self.loop.run_until_complete(server)
+        except (socket.error, OSError) as e:
+            self.loop.close()
+            started.set_exception(e)
+            return
+
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.is_running = True
+        started.set_result(None)
+
+        try:
+            self.loop.run_forever()
+        finally:
+            # Closing every stream ends the player coroutines with an empty read
+            self.server.close()
+            for writer in list(self.writers):
+                writer.close()
+
+            pending = asyncio.all_tasks(self.loop)
+            if pending:
+                self.loop.run_until_complete(asyncio.wait(pending, timeout=1.0))
+            self.loop.close()
+
+    def adopt(self, player_socket, player_address, data):
+        # A connection handed over by another process, with the bytes it read;
+        # safe to call from any thread
+        asyncio.run_coroutine_threadsafe(self.adopt_client(player_socket, data), self.loop)
+
+    async def adopt_client(self, player_socket, data):
+        try:
+            reader, writer = await asyncio.open_connection(sock=player_socket)
+        except (ConnectionError, OSError):
+            player_socket.close()
+            return
+        await self.handle_client(reader, writer, data, may_hand_off=False)
+
+    async def handle_client(self, reader, writer, data=b"", may_hand_off=True):
+        address = writer.get_extra_info("peername")
+        self.writers.add(writer)
+        try:
+            await self.serve_player(reader, writer, address, data, may_hand_off)
+        finally:
+            self.writers.discard(writer)
+
+    async def read_hello(self, reader, data):
+        # Waits for a free handshake slot; the deadline starts once it has one
+        async with self.handshake_slots:
+            metrics.handshakes_pending.inc()
+            try:
+                return await asyncio.wait_for(read_hello_async(reader, data, self.max_frame_size),
+                                              self.handshake_timeout)
+            finally:
+                metrics.handshakes_pending.dec()
+
+    async def serve_player(self, reader, writer, address, data=b"", may_hand_off=True):
+        if self.keepalive > 0:
+            set_keepalive(writer.get_extra_info("socket"), self.keepalive)
+        try:
+            # Receive the hello message with a deadline
+            try:
+                hello, decoder, pending = await self.read_hello(reader, data)
+            except ProtocolError as e:
+                metrics.connections_rejected.labels("protocol").inc()
+                writer.write(rejection_message(str(e)))
+                writer.close()
+                return
+            except asyncio.TimeoutError:
+                metrics.connections_rejected.labels("timeout").inc()
+                writer.close()
+                return
+
+            take_over = self.hand_off(hello.room) if self.hand_off and may_hand_off else None
+            if take_over is not None:
+                # Bytes the stream buffered beyond what read() returned would be
+                # lost here, but clients send nothing else before the WELCOME
+                player_socket = writer.get_extra_info("socket")
+                take_over(player_socket.fileno(), address, handshake_bytes(hello, decoder, pending))
+                # No shutdown(), so the connection stays open in the other process
+                writer.close()
+                return
+
+            reason = self.host.check_new_player(hello.username, hello.room, hello.session)
+            if reason:
+                metrics.connections_rejected.labels("refused").inc()
+                writer.write(rejection_message(reason))
+                writer.close()
+                return
+
+            session = new_session_token()
+            writer.write(encode_welcome(session))
+        except (ConnectionError, OSError):
+            metrics.connections_rejected.labels("error").inc()
+            writer.close()
+            return
+
+        metrics.connections_accepted.inc()
+
+        conn = AsyncioConnection(self, writer, address,
+                                 OutboundQueue(self.send_queue_bytes, self.slow_consumer))
+        name = hello.username
+        self.host.add_player(conn, name, address, hello.room, session, hello.session)
+        self.heartbeat.watch(conn)
+
+        # Listen for messages from this player
+        limiter = InboundLimiter(*self.limits)
+        messages = limiter.admit(pending)
+        while self.is_running:
+            for msg_type, body in messages:
+                # A PONG only proves the connection is alive
+                if msg_type != PONG:
+                    self.host.handle_player_message(conn, name, msg_type, body)
+            if limiter.is_flooding():
+                self.host.remove_player(conn, "flood")
+                break
+
+            try:
+                data = await reader.read(RECV_SIZE)
+                if not data:
+                    # Empty read means the player disconnected
+                    self.host.remove_player(conn, "closed")
+                    break
+                conn.last_seen = time.monotonic()
+                pause = limiter.pause_for(len(data))
+                if pause:
+                    await asyncio.sleep(pause)
+                messages = limiter.admit(decoder.feed(data))
+            except FrameTooLargeError:
+                self.host.remove_player(conn, "oversized")
+                break
+            except ProtocolError:
+                self.host.remove_player(conn, "protocol")
+                break
+            except (ConnectionError, OSError):
+                self.host.remove_player(conn, "error")
+                break
+            if messages:
+                metrics.messages_received.inc(len(messages))
+
+
+TRANSPORTS = {
+    ThreadedTransport.name: ThreadedTransport,
+    AsyncioTransport.name: AsyncioTransport,
+}
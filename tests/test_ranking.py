@@ -0,0 +1,62 @@
+import random
+import unittest
+
+from quiz.ranking import Ranking
+
+# Randomized check of the bucketed ranking against a scoreboard recomputed
+# with sorted() after every change. Small buckets make the splits, the
+# emptied buckets and the Fenwick tree updates happen within a few hundred
+# steps.
+
+
+def sorted_board(scores):
+    # [(rank, name, score), ...] with tie-aware ranks
+    board = []
+    for name, score in sorted(scores.items(), key=lambda item: (-item[1], item[0])):
+        rank = board[-1][0] if board and board[-1][2] == score else len(board) + 1
+        board.append((rank, name, score))
+    return board
+
+
+class RankingTest(unittest.TestCase):
+    def check(self, ranking, scores):
+        board = sorted_board(scores)
+        self.assertEqual(len(ranking), len(scores))
+        self.assertEqual(ranking.top(len(scores) + 1), board)
+        self.assertEqual(ranking.top(3), board[:3])
+        for rank, name, score in board:
+            self.assertEqual(ranking.rank(name), rank)
+            self.assertEqual(ranking.score(name), score)
+
+    def test_matches_sorted(self):
+        for seed in range(20):
+            rng = random.Random(seed)
+            ranking = Ranking(bucket_size=rng.choice((1, 2, 3, 8)))
+            names = [f"player{i}" for i in range(rng.randint(0, 40))]
+            ranking.reset(names)
+            scores = dict.fromkeys(names, 0)
+            self.check(ranking, scores)
+
+            for _ in range(300):
+                if rng.random() < 0.05:
+                    names = rng.sample(sorted(set(names) | {f"player{i}" for i in range(60)}), rng.randint(0, 50))
+                    ranking.reset(names)
+                    scores = dict.fromkeys(names, 0)
+                else:
+                    # Unknown names join with their first points; negative
+                    # points move players down the board
+                    name = f"player{rng.randrange(60)}"
+                    points = rng.choice((0, 1, 1, 2, 5, -1, -3))
+                    ranking.add_points(name, points)
+                    scores[name] = scores.get(name, 0) + points
+                self.check(ranking, scores)
+
+    def test_unknown_player(self):
+        ranking = Ranking()
+        ranking.reset(["alice"])
+        self.assertIsNone(ranking.rank("bob"))
+        self.assertIsNone(ranking.score("bob"))
+
+
+if __name__ == "__main__":
+    unittest.main()